@@ -0,0 +1,2 @@
+default_app_config = \
+    'card_issuing_excercise.apps.processing.apps.ProcessingConfig'
@@ -1,5 +1,17 @@
 from django.apps import AppConfig
 
+from card_issuing_excercise.settings import PIN_SPECIAL_ACCOUNTS_ON_STARTUP
+
 
 class ProcessingConfig(AppConfig):
-    name = 'processing'
+    name = 'card_issuing_excercise.apps.processing'
+    label = 'processing'
+
+    def ready(self):
+        # special accounts never change after initialize_before_startup,
+        # so they are resolved once and pinned in process memory.
+        # Fails fast if start up was broken
+        if PIN_SPECIAL_ACCOUNTS_ON_STARTUP:
+            from card_issuing_excercise.apps.processing.models import \
+                UserAccountsUnion
+            UserAccountsUnion.objects.load_special_accounts()
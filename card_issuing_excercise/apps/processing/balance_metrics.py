@@ -0,0 +1,44 @@
+'''
+In-process metrics of balance at point of time lookups.
+Balance is rolled forward by transfers from the nearest previous
+day snapshot, so long windows mean missing snapshots.
+'''
+
+from collections import namedtuple
+import datetime
+import threading
+
+
+# Roll forward windows since process start (or metrics reset)
+RollForwardStats = namedtuple(
+    'RollForwardStats',
+    ['lookups', 'cap_exceeded', 'max_window'])
+
+
+class RollForwardMetrics:
+
+    '''
+    Counts roll forward windows of account balance lookups
+    and windows longer than configured cap
+    '''
+
+    # shared by all instances in process
+    _stats = RollForwardStats(0, 0, datetime.timedelta(0))
+    _lock = threading.Lock()
+
+    def record(self, window, cap_exceeded):
+        with self._lock:
+            stats = RollForwardMetrics._stats
+            RollForwardMetrics._stats = RollForwardStats(
+                lookups=stats.lookups + 1,
+                cap_exceeded=stats.cap_exceeded + int(cap_exceeded),
+                max_window=max(stats.max_window, window))
+
+    def get_stats(self):
+        with self._lock:
+            return RollForwardMetrics._stats
+
+    def reset(self):
+        with self._lock:
+            RollForwardMetrics._stats = RollForwardStats(
+                0, 0, datetime.timedelta(0))
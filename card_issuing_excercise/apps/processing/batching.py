@@ -0,0 +1,186 @@
+'''
+Group commit of presentments.
+Presentments don't need funds decision right away,
+so presentments of concurrent requests are collected for a few milliseconds
+and posted in one database transaction (one commit instead of many).
+'''
+
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections, connection, \
+    transaction as db_transaction, \
+    OperationalError
+
+from card_issuing_excercise.apps.processing.models import Transaction
+from card_issuing_excercise.settings import PRESENTMENT_BATCH_WINDOW, \
+    PRESENTMENT_BATCH_MAX_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# InnoDB rolls back whole transaction of deadlock victim
+MYSQL_DEADLOCK_ERROR = 1213
+
+
+class PresentmentItem:
+
+    '''
+    One presentment waiting for batch commit.
+    Holds arguments of Transaction.objects.present_transaction
+    and its outcome: presented transaction or raised exception
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def get_result(self):
+        '''
+        Returns presented transaction or raises error of this item
+        '''
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class PresentmentBatcher:
+
+    '''
+    Collects presentments during batch window or up to batch size
+    and posts them in one database transaction.
+    Every presentment gets its own savepoint,
+    so failed one doesn't rollback the others.
+    Deadlock rolls back the whole batch,
+    so then presentments are posted one by one.
+    One daemon thread per process posts batches,
+    request threads wait till their batch is commited
+    '''
+
+    # shared by all instances in process
+    _queue = queue.Queue()
+    _lock = threading.Lock()
+    _thread = None
+
+    def present(self, *args, **kwargs):
+        '''
+        Same as Transaction.objects.present_transaction,
+        but returns only after batch with presentment is commited.
+        Raises IssuerTransactionError of this presentment only
+        '''
+        item = PresentmentItem(*args, **kwargs)
+        if connection.in_atomic_block:
+            # caller's transaction should see presentment,
+            # so it can't be posted by other connection
+            self.post([item])
+            return item.get_result()
+        self._ensure_started()
+        self._queue.put(item)
+        item.done.wait()
+        return item.get_result()
+
+    def post(self, items):
+        '''
+        Posts list of PresentmentItem in one database transaction
+        and saves outcome in every item
+        '''
+        try:
+            with db_transaction.atomic():
+                for item in items:
+                    self._post_item(item)
+        except Exception as err:
+            if self._is_deadlock(err) and not connection.in_atomic_block:
+                # whole batch is rolled back by deadlock,
+                # so presentments are posted again one by one
+                # and deadlock fails only the one it happens to
+                logger.warning(
+                    'Batch of %s presentments is deadlocked, '
+                    'posting them separately', len(items))
+                for item in items:
+                    self._post_item_alone(item)
+            else:
+                # commit failed: nothing of batch is saved
+                for item in items:
+                    item.result = None
+                    item.error = err
+        for item in items:
+            item.done.set()
+
+    def _post_item(self, item):
+        try:
+            # transaction manager doesn't use savepoints,
+            # so every presentment gets exactly one to fail separately
+            with db_transaction.atomic():
+                item.result = Transaction.objects.present_transaction(
+                    *item.args, **item.kwargs)
+        except Exception as err:
+            if self._is_deadlock(err):
+                # transaction is already rolled back by database,
+                # rollback to savepoint can't save other presentments
+                raise
+            item.error = err
+
+    def _post_item_alone(self, item):
+        '''
+        Posts presentment in its own database transaction
+        '''
+        item.result = None
+        item.error = None
+        try:
+            with db_transaction.atomic():
+                self._post_item(item)
+        except Exception as err:
+            item.result = None
+            item.error = err
+
+    def _is_deadlock(self, err):
+        return isinstance(err, OperationalError) and \
+            bool(err.args) and err.args[0] == MYSQL_DEADLOCK_ERROR
+
+    def _ensure_started(self):
+        with self._lock:
+            if PresentmentBatcher._thread is not None and \
+                    PresentmentBatcher._thread.is_alive():
+                return
+            PresentmentBatcher._thread = threading.Thread(
+                target=self._run, name='presentment-batcher', daemon=True)
+            PresentmentBatcher._thread.start()
+
+    def _run(self):
+        while True:
+            items = self._get_batch()
+            # thread lives longer than any request:
+            # drop connections which are broken or too old
+            close_old_connections()
+            try:
+                self.post(items)
+            except Exception as err:
+                # never leave request threads waiting
+                logger.exception(
+                    'Failed to post batch of %s presentments', len(items))
+                for item in items:
+                    if not item.done.is_set():
+                        item.error = err
+                        item.done.set()
+
+    def _get_batch(self):
+        '''
+        Waits for first presentment,
+        than collects next ones during batch window up to batch size
+        '''
+        items = [self._queue.get()]
+        deadline = time.monotonic() + PRESENTMENT_BATCH_WINDOW
+        while len(items) < PRESENTMENT_BATCH_MAX_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return items
@@ -0,0 +1,37 @@
+'''
+Helpers shared by benchmark commands of the Schema webhook
+'''
+
+import random
+import string
+
+
+MESSAGE_AMOUNT = '0.01'
+
+
+def get_random_id(length, random_generator=random):
+    return ''.join(
+        random_generator.choice(string.ascii_uppercase + string.digits)
+        for _ in range(length))
+
+
+def get_message(message_type, card_id, transaction_id):
+    '''
+    Builds valid Schema message of minimal amount
+    '''
+    message = {
+        'type': message_type,
+        'card_id': card_id,
+        'transaction_id': transaction_id,
+        'merchant_name': 'Benchmark merchant',
+        'merchant_country': 'US',
+        'merchant_mcc': '1111',
+        'billing_amount': MESSAGE_AMOUNT,
+        'billing_currency': 'EUR',
+        'transaction_amount': MESSAGE_AMOUNT,
+        'transaction_curreny': 'EUR'}
+    if message_type == 'presentment':
+        message.update({
+            'settlement_amount': MESSAGE_AMOUNT,
+            'settlement_currency': 'EUR'})
+    return message
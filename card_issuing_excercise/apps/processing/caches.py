@@ -0,0 +1,111 @@
+'''
+Process level caches for the Schema webhook hot path.
+Caches are not shared btw processes and should store only
+data that never changes after creation.
+'''
+
+from collections import namedtuple, OrderedDict
+import threading
+
+from card_issuing_excercise.settings import CARD_ACCOUNTS_CACHE_SIZE
+
+
+# Ids of all rows related to one card
+CardAccounts = namedtuple(
+    'CardAccounts',
+    ['user_account_id', 'base_account_id', 'reserved_account_id'])
+
+
+class CardAccountsCache:
+
+    '''
+    Maps card_id to ids of user account union and its "real" accounts.
+    Card mappings never change after account creation,
+    so entries are invalidated explicitly on creation and deletion only.
+    Oldest entries are evicted when cache size limit is reached
+    '''
+
+    # shared by all instances in process
+    _entries = OrderedDict()
+    _lock = threading.Lock()
+
+    def get(self, card_id):
+        '''
+        Returns cached CardAccounts or None
+        '''
+        with self._lock:
+            card_accounts = self._entries.get(card_id)
+            if card_accounts is not None:
+                self._entries.move_to_end(card_id)
+            return card_accounts
+
+    def set(self, card_id, card_accounts):
+        '''
+        Caches CardAccounts for card
+        '''
+        with self._lock:
+            self._entries[card_id] = card_accounts
+            self._entries.move_to_end(card_id)
+            while len(self._entries) > CARD_ACCOUNTS_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, card_id):
+        '''
+        Drops card from cache if it was cached
+        '''
+        with self._lock:
+            self._entries.pop(card_id, None)
+
+    def clear(self):
+        '''
+        Drops all cached cards
+        '''
+        with self._lock:
+            self._entries.clear()
+
+
+# Ids of special account union and its basic account shards
+# ordered by shard number
+SpecialAccount = namedtuple(
+    'SpecialAccount', ['user_account_id', 'base_account_ids'])
+
+
+class SpecialAccountsRegistry:
+
+    '''
+    Pins special accounts (settlement, revenue etc.) in process memory.
+    Special accounts are created once on startup and never change,
+    so there is no need to look them up on every request.
+    '''
+
+    # shared by all instances in process
+    _accounts = {}
+    _lock = threading.Lock()
+
+    def get(self, role):
+        '''
+        Returns pinned SpecialAccount or None
+        '''
+        with self._lock:
+            return self._accounts.get(role)
+
+    def set(self, role, special_account):
+        '''
+        Pins SpecialAccount for role
+        '''
+        with self._lock:
+            self._accounts[role] = special_account
+
+    def invalidate(self, role):
+        '''
+        Unpins special account of role
+        '''
+        with self._lock:
+            self._accounts.pop(role, None)
+
+    def clear(self):
+        '''
+        Unpins all special accounts
+        '''
+        with self._lock:
+            self._accounts.clear()
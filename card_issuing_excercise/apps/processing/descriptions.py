@@ -0,0 +1,100 @@
+'''
+Writes transactions descriptions off the webhook critical path.
+The Schema needs only status code, so descriptions
+are handed to background writer after money is moved.
+'''
+
+import logging
+import queue
+import threading
+
+from django.db import close_old_connections, \
+    transaction as db_transaction
+
+from card_issuing_excercise.apps.processing.models import Transaction
+from card_issuing_excercise.settings import \
+    TRANSACTION_DESCRIPTIONS_BATCH_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# Descriptions modes
+DESCRIPTIONS_SYNC_MODE = 'sync'
+DESCRIPTIONS_DEFERRED_MODE = 'deferred'
+
+
+class DescriptionsWriter:
+
+    '''
+    Background writer of transactions descriptions.
+    Descriptions are queued only after database transaction is commited,
+    one daemon thread per process drains the queue in batches
+    and saves every batch by one UPDATE and one INSERT.
+    Queued descriptions are lost if process is killed.
+    '''
+
+    # shared by all instances in process
+    _queue = queue.Queue()
+    _lock = threading.Lock()
+    _thread = None
+
+    def schedule(self, issuer_transaction, info_in_json):
+        '''
+        Hands description to writer on commit of current database transaction
+        '''
+        db_transaction.on_commit(
+            lambda: self._put(issuer_transaction, info_in_json))
+
+    def write(self, items):
+        '''
+        Saves descriptions for list of (transaction, info_in_json) pairs
+        '''
+        Transaction.objects.bulk_update_descriptions(items)
+
+    def flush(self):
+        '''
+        Blocks until all queued descriptions are saved
+        '''
+        self._queue.join()
+
+    def _put(self, issuer_transaction, info_in_json):
+        self._ensure_started()
+        self._queue.put((issuer_transaction, info_in_json))
+
+    def _ensure_started(self):
+        with self._lock:
+            if DescriptionsWriter._thread is not None and \
+                    DescriptionsWriter._thread.is_alive():
+                return
+            DescriptionsWriter._thread = threading.Thread(
+                target=self._run, name='descriptions-writer', daemon=True)
+            DescriptionsWriter._thread.start()
+
+    def _run(self):
+        while True:
+            items = self._get_batch()
+            # thread lives longer than any request:
+            # drop connections which are broken or too old
+            close_old_connections()
+            try:
+                self.write(items)
+            except Exception:
+                logger.exception(
+                    'Failed to save descriptions of %s transactions',
+                    len(items))
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _get_batch(self):
+        '''
+        Waits for first description,
+        than takes already queued ones up to batch size
+        '''
+        items = [self._queue.get()]
+        while len(items) < TRANSACTION_DESCRIPTIONS_BATCH_SIZE:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
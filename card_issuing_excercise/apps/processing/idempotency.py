@@ -0,0 +1,177 @@
+'''
+Remembers outcomes of processed Schema messages.
+The Schema retries messages it didn't get answer for,
+so the same (transaction_id, type) pair can come many times.
+Retries are answered from here without touching database.
+'''
+
+from collections import namedtuple, OrderedDict
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+
+from card_issuing_excercise.settings import SCHEMA_IDEMPOTENCY_BACKEND, \
+    SCHEMA_IDEMPOTENCY_CACHE_SIZE, \
+    SCHEMA_IDEMPOTENCY_TTL
+
+
+logger = logging.getLogger(__name__)
+
+# Http status of processed message and fingerprint of its payload
+MessageOutcome = namedtuple('MessageOutcome', ['status_code', 'fingerprint'])
+
+
+class LocalIdempotencyBackend:
+
+    '''
+    Process level LRU storage with TTL.
+    Not shared btw processes, so retry which comes to another worker
+    is processed by database as usual.
+    '''
+
+    # shared by all instances in process
+    _entries = OrderedDict()
+    _lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        Returns not expired MessageOutcome or None
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            outcome, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return outcome
+
+    def set(self, key, outcome):
+        '''
+        Stores MessageOutcome, evicts oldest entries on size limit
+        '''
+        with self._lock:
+            self._entries[key] = (
+                outcome, time.monotonic() + SCHEMA_IDEMPOTENCY_TTL)
+            self._entries.move_to_end(key)
+            while len(self._entries) > SCHEMA_IDEMPOTENCY_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Drops all stored outcomes
+        '''
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheIdempotencyBackend:
+
+    '''
+    Shared storage on top of django cache (memcached, redis etc.).
+    Size limit is managed by cache itself.
+    '''
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def get(self, key):
+        outcome = self.cache.get(key)
+        if outcome is None:
+            return None
+        return MessageOutcome(*outcome)
+
+    def set(self, key, outcome):
+        self.cache.set(key, tuple(outcome), SCHEMA_IDEMPOTENCY_TTL)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class IdempotencyStore:
+
+    '''
+    Remembers http statuses of processed Schema messages by
+    (transaction_id, type) together with payload fingerprint.
+    Backend is chosen by SCHEMA_IDEMPOTENCY_BACKEND setting:
+    None for process level storage or django cache alias for shared one.
+    '''
+
+    KEY_PREFIX = 'schema-idempotency:'
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = self._get_default_backend()
+        self.backend = backend
+
+    def get(self, message):
+        '''
+        Returns remembered MessageOutcome for message or None.
+        Flags messages which reuse processed id with another payload
+        '''
+        key = self._get_key(message)
+        if key is None:
+            return None
+        outcome = self.backend.get(key)
+        if outcome is not None and \
+                outcome.fingerprint != self._get_fingerprint(message):
+            self._alarm_conflicting_payload(message)
+        return outcome
+
+    def is_retry(self, message, outcome):
+        '''
+        Whether message repeats payload of message with remembered outcome
+        '''
+        return outcome.fingerprint == self._get_fingerprint(message)
+
+    def remember(self, message, status_code):
+        '''
+        Remembers final status of processed message
+        '''
+        key = self._get_key(message)
+        if key is None:
+            return
+        self.backend.set(
+            key, MessageOutcome(status_code, self._get_fingerprint(message)))
+
+    def _get_key(self, message):
+        '''
+        Builds storage key from message id and type.
+        Returns None for messages without them
+        '''
+        if not isinstance(message, dict):
+            return None
+        transaction_id = message.get('transaction_id')
+        message_type = message.get('type')
+        if not isinstance(transaction_id, str) or \
+                not isinstance(message_type, str):
+            return None
+        # hashed to be safe for any cache backend
+        return self.KEY_PREFIX + hashlib.sha1(
+            '\n'.join([transaction_id, message_type]).
+            encode('utf-8')).hexdigest()
+
+    def _get_fingerprint(self, message):
+        '''
+        Hash of canonical json of message
+        '''
+        return hashlib.sha1(
+            json.dumps(message, sort_keys=True, separators=(',', ':')).
+            encode('utf-8')).hexdigest()
+
+    def _get_default_backend(self):
+        if SCHEMA_IDEMPOTENCY_BACKEND is None:
+            return LocalIdempotencyBackend()
+        return DjangoCacheIdempotencyBackend(SCHEMA_IDEMPOTENCY_BACKEND)
+
+    def _alarm_conflicting_payload(self, message):
+        '''Alarm about id reused by message with different payload'''
+        logger.warning(
+            'Schema message %s (%s) reuses processed id with other payload',
+            message.get('transaction_id'), message.get('type'))
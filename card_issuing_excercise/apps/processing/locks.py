@@ -0,0 +1,80 @@
+'''
+In-process locks for cards.
+Messages of the same card are processed one at a time inside of worker
+before database connection is used, so hot cards don't pile up
+waits on database row locks. Row locks are still needed across processes.
+'''
+
+from collections import namedtuple
+from contextlib import contextmanager
+import threading
+import time
+import zlib
+
+from card_issuing_excercise.settings import CARD_LOCK_STRIPES
+
+
+# Lock waits of one stripe since process start (or metrics reset)
+StripeMetrics = namedtuple(
+    'StripeMetrics',
+    ['acquisitions', 'contended_acquisitions', 'total_wait', 'max_wait'])
+
+
+class CardLockManager:
+
+    '''
+    Hashes card_id onto fixed array of locks (stripes).
+    Different cards can share stripe, so lock only card related work.
+    Collects wait time metrics per stripe.
+    '''
+
+    # shared by all instances in process
+    _locks = [threading.Lock() for _ in range(CARD_LOCK_STRIPES)]
+    _metrics = [StripeMetrics(0, 0, 0.0, 0.0)] * CARD_LOCK_STRIPES
+    _metrics_lock = threading.Lock()
+
+    @contextmanager
+    def lock(self, card_id):
+        '''
+        Holds stripe lock of card inside of with block
+        '''
+        stripe = self.get_stripe(card_id)
+        stripe_lock = self._locks[stripe]
+        started_at = time.perf_counter()
+        contended = not stripe_lock.acquire(blocking=False)
+        if contended:
+            stripe_lock.acquire()
+        self._record_wait(stripe, contended,
+                          time.perf_counter() - started_at)
+        try:
+            yield
+        finally:
+            stripe_lock.release()
+
+    def get_stripe(self, card_id):
+        '''
+        Stable across processes stripe number of card
+        '''
+        return zlib.crc32(str(card_id).encode('utf-8')) % len(self._locks)
+
+    def get_metrics(self):
+        '''
+        Returns list of StripeMetrics by stripe number
+        '''
+        with self._metrics_lock:
+            return list(self._metrics)
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            for stripe in range(len(self._metrics)):
+                self._metrics[stripe] = StripeMetrics(0, 0, 0.0, 0.0)
+
+    def _record_wait(self, stripe, contended, wait):
+        with self._metrics_lock:
+            metrics = self._metrics[stripe]
+            self._metrics[stripe] = StripeMetrics(
+                acquisitions=metrics.acquisitions + 1,
+                contended_acquisitions=metrics.contended_acquisitions +
+                int(contended),
+                total_wait=metrics.total_wait + wait,
+                max_wait=max(metrics.max_wait, wait))
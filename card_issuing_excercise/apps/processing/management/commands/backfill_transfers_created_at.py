@@ -0,0 +1,40 @@
+'''
+Management command for copying creation time of transactions
+to transfers saved before transfers got their own column
+'''
+
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from card_issuing_excercise.apps.processing.models import Transfer
+
+
+class Command(BaseCommand):
+
+    '''
+    Fills creation time of old transfers.
+    Works by chunks of transfers ids,
+    every chunk is updated by one UPDATE in its own database transaction.
+    Can be stopped and rerun at any moment
+    '''
+
+    help = '''Copies transactions creation time to old transfers
+              Usage: backfill_transfers_created_at [--chunk-size N]'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        chunk_size = options.get('chunk_size')
+        ids_range = Transfer.objects.filter(created_at__isnull=True).\
+            aggregate(min_id=models.Min('id'), max_id=models.Max('id'))
+        if ids_range.get('min_id') is None:
+            print('Nothing to backfill')
+            return
+        last_id = ids_range.get('min_id') - 1
+        updated_number = 0
+        while last_id < ids_range.get('max_id'):
+            updated_number += Transfer.objects.backfill_created_at(
+                last_id, last_id + chunk_size)
+            last_id += chunk_size
+            print('Backfilled {} transfers'.format(updated_number))
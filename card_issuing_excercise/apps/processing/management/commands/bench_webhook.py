@@ -0,0 +1,256 @@
+'''
+Management command for load testing the Schema webhook.
+Runs fully offline: requests are sent to WSGI application in process
+by pool of threads, every thread uses its own database connection.
+'''
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import decimal
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.signals import request_started, request_finished
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections, connection, transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from card_issuing_excercise.apps.processing.benchmarks import get_message, \
+    get_random_id
+from card_issuing_excercise.apps.processing.models import Transaction, \
+    UserAccountsUnion
+from card_issuing_excercise.apps.processing.models.accounts import \
+    CARD_ID_LENGTH
+from card_issuing_excercise.apps.processing.models.transactions import \
+    TRANSACTION_ID_LENGTH
+from card_issuing_excercise.apps.processing.timings import StageTimings, \
+    get_percentile, \
+    TOTAL_STAGE
+from card_issuing_excercise.apps.processing.views import \
+    SchemaRequestProcessingMixin
+from card_issuing_excercise.apps.processing.wsgi import \
+    SchemaWebHookApplication
+
+
+CARD_LOAD_AMOUNT = decimal.Decimal(1000)
+# Kinds of sent messages
+AUTHORIZATION_KIND = 'authorization'
+PRESENTMENT_KIND = 'presentment'
+DUPLICATE_KIND = 'duplicate'
+
+
+class Command(BaseCommand):
+
+    '''
+    Creates synthetic cards and sends mix of authorizations,
+    presentments of sent authorizations and duplicates of sent messages.
+    Every card is served by one thread, so messages of card are sent in order.
+    Prints throughput, latency percentiles, statuses and queries.
+    Created cards and transactions are kept:
+    run it against scratch database only
+    '''
+
+    help = '''Load tests the Schema webhook with synthetic cards
+              Usage: bench_webhook [--cards N] [--requests N]
+                     [--concurrency N] [--rate N] [--presentments RATIO]
+                     [--duplicates RATIO] [--lean] [--seed N]'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        # 0 sends requests as fast as possible
+        parser.add_argument('--rate', type=float, default=0)
+        parser.add_argument('--presentments', type=float, default=0.3)
+        parser.add_argument('--duplicates', type=float, default=0.1)
+        parser.add_argument('--lean', action='store_true')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        call_command('initialize_before_startup')
+        random_generator = random.Random(options.get('seed'))
+        card_ids = self._create_cards(options.get('cards'))
+        plans = self._get_workers_plans(card_ids, options, random_generator)
+        application = get_wsgi_application()
+        if options.get('lean'):
+            application = SchemaWebHookApplication(application)
+        # worker threads keep their database connections
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        stage_timings_enabled = \
+            SchemaRequestProcessingMixin.stage_timings_enabled
+        SchemaRequestProcessingMixin.stage_timings_enabled = True
+        StageTimings().reset()
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                results, duration = self._run_workers(
+                    application, plans, options.get('rate'))
+        finally:
+            SchemaRequestProcessingMixin.stage_timings_enabled = \
+                stage_timings_enabled
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        self._print_report(results, duration)
+
+    # Arrangements
+
+    @transaction.atomic
+    def _create_cards(self, cards_number):
+        '''
+        Creates cards with loaded money and returns their ids
+        '''
+        load_money_account = UserAccountsUnion.objects.\
+            get_external_load_money_account()
+        card_ids = []
+        for _ in range(cards_number):
+            card_id = get_random_id(CARD_ID_LENGTH)
+            user = User.objects.create(username='bench_' + card_id)
+            user_account = UserAccountsUnion.objects.create(
+                user=user, card_id=card_id)
+            Transaction.objects.load_money(
+                CARD_LOAD_AMOUNT,
+                load_money_account.base_account,
+                user_account.base_account,
+                code=get_random_id(TRANSACTION_ID_LENGTH))
+            card_ids.append(card_id)
+        print('Created {} cards'.format(len(card_ids)))
+        return card_ids
+
+    def _get_workers_plans(self, card_ids, options, random_generator):
+        '''
+        Splits cards between workers and builds
+        list of (kind, WSGI environ) to send for every worker.
+        Messages of worker cards are interleaved
+        '''
+        concurrency = min(options.get('concurrency'), len(card_ids))
+        requests_per_card = max(options.get('requests') // len(card_ids), 1)
+        request_factory = RequestFactory()
+        plans = []
+        for worker in range(concurrency):
+            cards_messages = [
+                self._get_card_messages(
+                    card_id, requests_per_card, options, random_generator)
+                for card_id in card_ids[worker::concurrency]]
+            plans.append([
+                (kind, request_factory.post(
+                    SchemaWebHookApplication.PATH,
+                    data=json.dumps(message),
+                    content_type='application/json').environ)
+                for messages in zip(*cards_messages)
+                for kind, message in messages])
+        return plans
+
+    def _get_card_messages(self, card_id, requests_number,
+                           options, random_generator):
+        '''
+        Builds list of (kind, message) for one card
+        '''
+        messages = []
+        not_presented_codes = []
+        for _ in range(requests_number):
+            choice = random_generator.random()
+            if messages and choice < options.get('duplicates'):
+                _, message = random_generator.choice(messages)
+                messages.append((DUPLICATE_KIND, message))
+            elif not_presented_codes and \
+                    choice < options.get('duplicates') + \
+                    options.get('presentments'):
+                code = not_presented_codes.pop(
+                    random_generator.randrange(len(not_presented_codes)))
+                messages.append((PRESENTMENT_KIND, get_message(
+                    PRESENTMENT_KIND, card_id, code)))
+            else:
+                # codes are not seeded: they must be new for every run
+                code = get_random_id(TRANSACTION_ID_LENGTH)
+                not_presented_codes.append(code)
+                messages.append((AUTHORIZATION_KIND, get_message(
+                    AUTHORIZATION_KIND, card_id, code)))
+        return messages
+
+    # Load
+
+    def _run_workers(self, application, plans, rate):
+        '''
+        Sends all plans by pool of threads.
+        Returns list of (kind, status, latency) and duration in seconds
+        '''
+        # every worker sends its share of target rate
+        interval = len(plans) / rate if rate else 0
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(plans)) as executor:
+            futures = [
+                executor.submit(self._run_worker, application,
+                                plan, interval, started_at)
+                for plan in plans]
+            results = [result
+                       for future in futures
+                       for result in future.result()]
+        return results, time.perf_counter() - started_at
+
+    def _run_worker(self, application, plan, interval, started_at):
+        results = []
+        try:
+            for index, (kind, environ) in enumerate(plan):
+                if interval:
+                    delay = started_at + index * interval - \
+                        time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                statuses = []
+                request_started_at = time.perf_counter()
+                response = application(
+                    environ,
+                    lambda status, headers: statuses.append(status))
+                if hasattr(response, 'close'):
+                    response.close()
+                results.append((
+                    kind, int(statuses[0].split()[0]),
+                    time.perf_counter() - request_started_at))
+        finally:
+            connection.close()
+        return results
+
+    # Report
+
+    def _print_report(self, results, duration):
+        print('Sent {} requests in {:.2f}s, {:.0f} requests/sec'.format(
+            len(results), duration, len(results) / duration))
+        latencies = defaultdict(list)
+        statuses = defaultdict(Counter)
+        for kind, status, latency in results:
+            latencies[kind].append(latency)
+            latencies['all'].append(latency)
+            statuses[kind][status] += 1
+        print('Latency, ms:')
+        for kind, kind_latencies in sorted(latencies.items()):
+            kind_latencies.sort()
+            print('    {}: p50 {:.2f}, p95 {:.2f}, p99 {:.2f}, '
+                  'max {:.2f}'.format(
+                      kind,
+                      *[1000 * get_percentile(kind_latencies, percentile)
+                        for percentile in (50, 95, 99, 100)]))
+        print('Statuses:')
+        for kind, kind_statuses in sorted(statuses.items()):
+            print('    {}: {}'.format(kind, ', '.join(
+                '{} x{}'.format(status, count)
+                for status, count in sorted(kind_statuses.items()))))
+        self._print_stages()
+
+    def _print_stages(self):
+        stats = StageTimings().get_stats()
+        print('Queries: {} total'.format(sum(
+            stage_stats.queries_total for stage_stats in stats
+            if stage_stats.stage == TOTAL_STAGE)))
+        print('Stages, ms (queries):')
+        for stage_stats in stats:
+            print('    {} {}: p50 {:.2f} ({}), p95 {:.2f} ({}), '
+                  'p99 {:.2f} ({})'.format(
+                      stage_stats.message_type, stage_stats.stage,
+                      1000 * stage_stats.time_p50, stage_stats.queries_p50,
+                      1000 * stage_stats.time_p95, stage_stats.queries_p95,
+                      1000 * stage_stats.time_p99, stage_stats.queries_p99))
@@ -0,0 +1,96 @@
+'''
+Management command for comparing throughput of
+full django pipeline and lean pipeline for the Schema webhook
+'''
+
+from collections import Counter
+import json
+import time
+
+from django.core.wsgi import get_wsgi_application
+from django.core.management.base import BaseCommand
+from django.core.signals import request_started, request_finished
+from django.db import close_old_connections
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from card_issuing_excercise.apps.processing.benchmarks import get_message, \
+    get_random_id
+from card_issuing_excercise.apps.processing.models.transactions import \
+    TRANSACTION_ID_LENGTH
+from card_issuing_excercise.apps.processing.wsgi import \
+    SchemaWebHookApplication
+
+
+class Command(BaseCommand):
+
+    '''
+    Sends authorisation requests of the same card through both pipelines
+    in one process and prints requests/sec.
+    Every request is committed in its own database transaction
+    as in production, so created transactions are kept:
+    use scratch database and card with enough money.
+    '''
+
+    help = '''Compares requests/sec of SchemaWebHook and lean pipeline
+              Usage: benchmark_schema_pipeline <card_id> [--requests N]'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('card_id', type=str)
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        django_application = get_wsgi_application()
+        pipelines = [
+            ('SchemaWebHook', django_application),
+            ('Lean pipeline', SchemaWebHookApplication(django_application))]
+        # connection is kept open between requests of both pipelines,
+        # so connecting time doesn't skew comparison
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for name, application in pipelines:
+                    self._run_pipeline(
+                        name, application,
+                        self._get_environs(options.get('card_id'),
+                                           options.get('requests')))
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+    def _run_pipeline(self, name, application, environs):
+        '''
+        Sends all requests and prints throughput with status codes
+        '''
+        statuses = Counter()
+
+        def start_response(status, headers):
+            statuses[status] += 1
+
+        started_at = time.perf_counter()
+        for environ in environs:
+            response = application(environ, start_response)
+            if hasattr(response, 'close'):
+                response.close()
+        duration = time.perf_counter() - started_at
+        print('{}: {} requests in {:.2f}s, {:.0f} requests/sec'.format(
+            name, len(environs), duration, len(environs) / duration))
+        for status, count in sorted(statuses.items()):
+            print('    {}: {}'.format(status, count))
+
+    def _get_environs(self, card_id, requests_number):
+        '''
+        Builds WSGI environs of authorisation requests in advance.
+        Codes are random: committed transactions of previous runs
+        must not turn requests into duplicates
+        '''
+        request_factory = RequestFactory()
+        return [
+            request_factory.post(
+                SchemaWebHookApplication.PATH,
+                data=json.dumps(get_message(
+                    'authorization', card_id,
+                    get_random_id(TRANSACTION_ID_LENGTH))),
+                content_type='application/json').environ
+            for _ in range(requests_number)]
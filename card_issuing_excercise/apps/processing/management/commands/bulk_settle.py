@@ -2,13 +2,15 @@
 
 import datetime
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from card_issuing_excercise.apps.apis import \
     SchemaAPI, TelegramAPI, \
     SmsAPI, SendgridAPI
 from card_issuing_excercise.apps.processing.models import Transaction, \
     UserAccountsUnion
+from card_issuing_excercise.apps.processing.models.accounts import \
+    EXTERNAL_SETTLEMENT_ACCOUNT_ROLE
 from card_issuing_excercise.apps.utils import to_start_day
 from card_issuing_excercise.settings import AUTHORISATION_TRANSACTION_TTL
 
@@ -37,12 +39,20 @@ class Command(BaseCommand):
         inner_settlement_account = UserAccountsUnion.objects.\
             get_inner_settlement_account()
         external_settlement_account = UserAccountsUnion.objects.\
-            get_external_settlement_account()
+            get_pinned_special_account(EXTERNAL_SETTLEMENT_ACCOUNT_ROLE)
+        if inner_settlement_account is None or \
+                external_settlement_account is None:
+            raise CommandError('Settlement accounts do not exist. '
+                               'Run initialize_before_startup first')
+        # amounts of all shards are read at once
+        # and exactly this amounts are drained after transfer to the Schema
+        inner_settlement_shards = \
+            inner_settlement_account.base_account_shards
         try:
             SchemaAPI().transfer_debts_to_schema(
-                amount=inner_settlement_account.base_amount)
+                amount=sum(shard.amount for shard in inner_settlement_shards))
             self._log_settlement_transaction(
-                inner_settlement_account=inner_settlement_account,
+                inner_settlement_shards=inner_settlement_shards,
                 external_settlement_account=external_settlement_account)
         except SchemaAPI.SchemaError as error:
             self._alarm_schema_error(error.info)
@@ -53,10 +63,10 @@ class Command(BaseCommand):
         '''
         # so error-prone logic. should be rewrighten after requirements are
         # specified
-        Transaction.objects.settle_day_transactions(
-            kwargs.get('inner_settlement_account').base_amount,
-            kwargs.get('inner_settlement_account').base_account,
-            kwargs.get('external_settlement_account').base_account)
+        Transaction.objects.settle_day_transactions_from_shards(
+            {shard.id: shard.amount
+             for shard in kwargs.get('inner_settlement_shards')},
+            kwargs.get('external_settlement_account'))
 
     def _alarm_schema_error(self, err_info):
         '''
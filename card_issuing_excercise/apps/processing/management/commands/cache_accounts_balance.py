@@ -1,20 +1,82 @@
-''' 
-Stub for management command.
-Caches all users balance at the beginning of the day.
+'''
+Management command for caching balances of all accounts
+at the beginning of the day.
 Later this cached balances will be used to determine balance
 at every point of time.
-Command should be indempotent to multiple runs
+Command is indempotent to multiple runs
 '''
 
-from django.core.management.base import BaseCommand
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from card_issuing_excercise.apps.processing.models import AccountDayLog
+from card_issuing_excercise.apps.processing.models.accounts_day_log import \
+    get_committed_moment
+
+
+DATE_FORMAT = '%Y-%m-%d'
 
 
 class Command(BaseCommand):
-    
-    '''Stub for day balance caching command'''
 
-    help = 'Cache active user balances'
+    '''
+    Saves day balances of all accounts by chunks inside of database.
+    Balances are derived from transfers, so command can be run
+    at any time of the day and for any past day.
+    Day is cached only when all transfers made before it are committed:
+    today is available BALANCE_SNAPSHOT_COMMIT_LAG seconds after midnight.
+    Incremental mode derives day from the previous one
+    and transfers of the previous day only,
+    skipping idle accounts leaves only accounts moved during previous day
+    '''
+
+    help = '''Cache balances of all accounts at the beginning of the day
+              Usage: cache_accounts_balance [--date YYYY-MM-DD]
+                     [--backfill-from YYYY-MM-DD] [--chunk-size N]
+                     [--incremental [--skip-idle]]'''
+
+    def add_arguments(self, parser):
+        # the latest day with all previous transfers committed by default
+        parser.add_argument('--date', type=str, default=None)
+        # caches all days from this one till --date
+        parser.add_argument('--backfill-from', type=str, default=None)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        # derives day from the previous one and its transfers
+        parser.add_argument('--incremental', action='store_true')
+        # saves incremental snapshots of moved accounts only
+        parser.add_argument('--skip-idle', action='store_true')
 
     def handle(self, *args, **options):
-        pass
+        committed_date = get_committed_moment().date()
+        last_date = self._parse_date(options.get('date')) or committed_date
+        if last_date > committed_date:
+            raise CommandError(
+                'Transfers before {} can still be committed'.format(
+                    last_date.strftime(DATE_FORMAT)))
+        first_date = self._parse_date(options.get('backfill_from')) or \
+            last_date
+        if first_date > last_date:
+            raise CommandError('--backfill-from is later than --date')
+        if options.get('skip_idle') and not options.get('incremental'):
+            raise CommandError('--skip-idle requires --incremental')
+        save_day_snapshots = AccountDayLog.objects.save_day_snapshots
+        snapshot_options = {'chunk_size': options.get('chunk_size')}
+        if options.get('incremental'):
+            save_day_snapshots = \
+                AccountDayLog.objects.save_incremental_day_snapshots
+            snapshot_options['skip_idle'] = options.get('skip_idle')
+        date = first_date
+        while date <= last_date:
+            save_day_snapshots(date, **snapshot_options)
+            print('Cached balances for {}'.format(date.strftime(DATE_FORMAT)))
+            date += datetime.timedelta(days=1)
 
+    def _parse_date(self, date_str):
+        if not date_str:
+            return None
+        try:
+            return datetime.datetime.strptime(date_str, DATE_FORMAT).date()
+        except ValueError:
+            raise CommandError(
+                'Invalid date {}, expected YYYY-MM-DD'.format(date_str))
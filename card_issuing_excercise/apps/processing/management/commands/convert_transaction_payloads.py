@@ -0,0 +1,68 @@
+'''
+Management command for moving base64 JSON descriptions
+of old transactions to compressed payloads table
+'''
+
+import base64
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from card_issuing_excercise.apps.processing.models import Transaction, \
+    TransactionPayload
+
+
+class Command(BaseCommand):
+
+    '''
+    Converts legacy base64 descriptions to compressed payloads.
+    Works by chunks of transactions ordered by id,
+    every chunk is converted in its own database transaction.
+    Can be stopped and rerun at any moment
+    '''
+
+    help = '''Converts base64 descriptions to compressed payloads
+              Usage: convert_transaction_payloads [--chunk-size N]'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options.get('chunk_size')
+        last_id = 0
+        converted_number = 0
+        while True:
+            chunk = list(
+                Transaction.objects.filter(
+                    id__gt=last_id,
+                    legacy_base64_description__isnull=False).
+                order_by('id').
+                values_list('id', 'legacy_base64_description')[:chunk_size])
+            if not chunk:
+                break
+            self._convert_chunk(chunk)
+            last_id = chunk[-1][0]
+            converted_number += len(chunk)
+            print('Converted {} transactions'.format(converted_number))
+
+    @transaction.atomic
+    def _convert_chunk(self, chunk):
+        '''
+        Saves compressed payloads and clears legacy column
+        for chunk of (transaction_id, base64_description) pairs
+        '''
+        transaction_ids = [transaction_id for transaction_id, _ in chunk]
+        # payload could be saved by previous interrupted run
+        converted_ids = set(
+            TransactionPayload.objects.filter(
+                transaction_id__in=transaction_ids).
+            values_list('transaction_id', flat=True))
+        TransactionPayload.objects.bulk_create([
+            TransactionPayload(
+                transaction_id=transaction_id,
+                data=TransactionPayload.objects.compress_json_bytes(
+                    base64.b64decode(base64_description)))
+            for transaction_id, base64_description in chunk
+            if transaction_id not in converted_ids])
+        Transaction.objects.filter(id__in=transaction_ids).\
+            update(legacy_base64_description=None)
@@ -6,6 +6,8 @@ from django.core.management.base import BaseCommand
 
 from card_issuing_excercise.apps.processing.models import Transaction, \
     UserAccountsUnion
+from card_issuing_excercise.apps.processing.models.accounts import \
+    EXTERNAL_LOAD_MONEY_ACCOUNT_ROLE
 from card_issuing_excercise.apps.currency_converter.converter import \
     Converter
 
@@ -37,9 +39,13 @@ class Command(BaseCommand):
                   format(options.get('card_id')))
             return
         load_money_account = UserAccountsUnion.objects.\
-            get_external_load_money_account()
+            get_pinned_special_account(EXTERNAL_LOAD_MONEY_ACCOUNT_ROLE)
+        if load_money_account is None:
+            print('Load money account does not exist. '
+                  'Run initialize_before_startup first')
+            return
         transaction = Transaction.objects.load_money(
             amount,
-            load_money_account.base_account,
+            load_money_account,
             user_account.base_account)
         transaction.update_descriptions(options)
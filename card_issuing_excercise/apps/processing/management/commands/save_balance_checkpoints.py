@@ -0,0 +1,71 @@
+'''
+Management command for caching balances of moved accounts
+at intraday checkpoints.
+Checkpoints bound number of transfers rolled forward
+to find balance at point of time.
+Command is indempotent to multiple runs
+'''
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from card_issuing_excercise.apps.processing.models import AccountCheckpoint
+from card_issuing_excercise.apps.processing.models.accounts_checkpoint \
+    import get_checkpoint_at
+from card_issuing_excercise.apps.processing.models.accounts_day_log import \
+    get_committed_moment
+from card_issuing_excercise.settings import BALANCE_CHECKPOINT_INTERVAL
+
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+class Command(BaseCommand):
+
+    '''
+    Saves checkpoints of accounts moved during the last interval.
+    Checkpoint is saved only when all transfers made before it
+    are committed, that is BALANCE_SNAPSHOT_COMMIT_LAG seconds after it.
+    Run it every interval right after that,
+    add --intervals N to catch up after missed runs
+    '''
+
+    help = '''Cache balances of moved accounts at intraday checkpoints
+              Usage: save_balance_checkpoints [--at "YYYY-MM-DD HH:MM"]
+                     [--intervals N]'''
+
+    def add_arguments(self, parser):
+        # latest checkpoint with all previous transfers committed by default
+        parser.add_argument('--at', type=str, default=None)
+        # number of checkpoints till --at
+        parser.add_argument('--intervals', type=int, default=1)
+
+    def handle(self, *args, **options):
+        committed_at = get_committed_moment()
+        last_checkpoint_at = get_checkpoint_at(
+            self._parse_datetime(options.get('at')) or committed_at)
+        if last_checkpoint_at > committed_at:
+            raise CommandError(
+                'Transfers before {} can still be committed'.format(
+                    last_checkpoint_at.strftime(DATETIME_FORMAT)))
+        if options.get('intervals') < 1:
+            raise CommandError('--intervals should be positive')
+        interval = datetime.timedelta(seconds=BALANCE_CHECKPOINT_INTERVAL)
+        checkpoint_at = last_checkpoint_at - \
+            (options.get('intervals') - 1) * interval
+        while checkpoint_at <= last_checkpoint_at:
+            AccountCheckpoint.objects.save_checkpoints(checkpoint_at)
+            print('Cached checkpoint {}'.format(
+                checkpoint_at.strftime(DATETIME_FORMAT)))
+            checkpoint_at += interval
+
+    def _parse_datetime(self, datetime_str):
+        if not datetime_str:
+            return None
+        try:
+            return datetime.datetime.strptime(datetime_str, DATETIME_FORMAT)
+        except ValueError:
+            raise CommandError(
+                'Invalid moment {}, expected YYYY-MM-DD HH:MM'.format(
+                    datetime_str))
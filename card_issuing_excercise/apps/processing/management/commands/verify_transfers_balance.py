@@ -0,0 +1,91 @@
+'''
+Management command for verifying running balances of transfers.
+Running balances are recomputed from transfers amounts,
+so command also fills them for transfers saved before they were introduced
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from card_issuing_excercise.apps.processing.models import Transfer
+
+
+class Command(BaseCommand):
+
+    '''
+    Recomputes balance after every transfer of accounts in range
+    of accounts ids and reports mismatched ones,
+    with --fix saves recomputed balances.
+    Transfers of every account are walked in the order
+    balance lookups use: by creation time, then by id.
+    Accounts are processed by chunks of ids.
+    Can be stopped and rerun at any moment
+    '''
+
+    help = '''Verifies (and fixes) running balances of transfers
+              Usage: verify_transfers_balance [--from-account-id N]
+                     [--to-account-id N] [--chunk-size N] [--fix]'''
+
+    def add_arguments(self, parser):
+        # all accounts by default
+        parser.add_argument('--from-account-id', type=int, default=None)
+        parser.add_argument('--to-account-id', type=int, default=None)
+        # number of accounts in chunk
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        # saves recomputed balances of mismatched transfers
+        parser.add_argument('--fix', action='store_true')
+
+    def handle(self, *args, **options):
+        ids_range = Transfer.objects.aggregate(
+            min_id=models.Min('account_id'), max_id=models.Max('account_id'))
+        if ids_range.get('min_id') is None:
+            print('Nothing to verify')
+            return
+        chunk_start = options.get('from_account_id') or \
+            ids_range.get('min_id')
+        last_id = options.get('to_account_id') or ids_range.get('max_id')
+        # lookups skip transfers without creation time
+        if Transfer.objects.filter(
+                account_id__gte=chunk_start, account_id__lte=last_id,
+                created_at__isnull=True).exists():
+            raise CommandError(
+                'Transfers without creation time found, '
+                'run backfill_transfers_created_at first')
+        checked_number = 0
+        mismatched_number = 0
+        while chunk_start <= last_id:
+            chunk_end = min(
+                chunk_start + options.get('chunk_size') - 1, last_id)
+            chunk_checked_number, mismatched_balances = \
+                self._verify_chunk(chunk_start, chunk_end)
+            if options.get('fix'):
+                with transaction.atomic():
+                    Transfer.objects.set_balances_after(mismatched_balances)
+            checked_number += chunk_checked_number
+            mismatched_number += len(mismatched_balances)
+            print('Checked {} transfers, {} mismatched{}'.format(
+                checked_number, mismatched_number,
+                ' and fixed' if options.get('fix') else ''))
+            chunk_start = chunk_end + 1
+
+    def _verify_chunk(self, first_account_id, last_account_id):
+        '''
+        Recomputes running balances of accounts with ids in range.
+        Returns number of checked transfers
+        and dict transfer_id -> recomputed balance of mismatched ones
+        '''
+        balances = {}
+        checked_number = 0
+        mismatched_balances = {}
+        transfers = Transfer.objects.\
+            filter(account_id__gte=first_account_id,
+                   account_id__lte=last_account_id).\
+            order_by('account_id', 'created_at', 'id').\
+            values_list('id', 'account_id', 'amount', 'balance_after')
+        for transfer_id, account_id, amount, balance_after in \
+                transfers.iterator():
+            balances[account_id] = balances.get(account_id, 0) + amount
+            if balance_after != balances[account_id]:
+                mismatched_balances[transfer_id] = balances[account_id]
+            checked_number += 1
+        return checked_number, mismatched_balances
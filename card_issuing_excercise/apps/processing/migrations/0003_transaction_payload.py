@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0002_auto_20170301_1947'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionPayload',
+            fields=[
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='processing.Transaction', verbose_name='Transaction')),
+                ('data', models.BinaryField(verbose_name='Compressed JSON from schema')),
+            ],
+        ),
+        # column is kept as is, only field is renamed
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='transaction',
+                    old_name='base64_description',
+                    new_name='legacy_base64_description',
+                ),
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='legacy_base64_description',
+                    field=models.TextField(blank=True, db_column='base64_description', null=True, verbose_name='JSON from schema in base64'),
+                ),
+            ],
+        ),
+    ]
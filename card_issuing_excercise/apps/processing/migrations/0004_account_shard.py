@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0003_transaction_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Shard'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='account',
+            unique_together=set([('user_account', 'account_type', 'shard')]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0004_account_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='created_at',
+            field=models.DateTimeField(null=True, verbose_name='Created at'),
+        ),
+        migrations.AlterIndexTogether(
+            name='transfer',
+            index_together=set([('account', 'created_at')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0005_transfer_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Checkpoint moment')),
+                ('amount', models.DecimalField(decimal_places=4, default=0.0, max_digits=19, verbose_name='Amount')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='account_checkpoints', to='processing.Account', verbose_name='Account')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountcheckpoint',
+            unique_together=set([('account', 'created_at')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0006_account_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='balance_after',
+            field=models.DecimalField(decimal_places=4, max_digits=19, null=True, verbose_name='Balance after'),
+        ),
+    ]
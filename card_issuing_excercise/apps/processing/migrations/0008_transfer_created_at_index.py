@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('processing', '0007_transfer_balance_after'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transfer',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='Created at'),
+        ),
+    ]
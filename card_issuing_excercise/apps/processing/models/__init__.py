@@ -1,6 +1,8 @@
 '''Transactions and user accounts related models'''
 
 from .accounts import Account, UserAccountsUnion
+from .accounts_checkpoint import AccountCheckpoint
 from .accounts_day_log import AccountDayLog
+from .transaction_payloads import TransactionPayload
 from .transactions import Transaction
 from .transfers import Transfer
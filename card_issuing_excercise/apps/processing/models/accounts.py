@@ -1,21 +1,39 @@
 ''' Handles accounts related business logic '''
 
+import datetime
+import functools
+import logging
+import operator
+import zlib
+
 from django.contrib.auth.models import User
-from django.core.exceptions import MultipleObjectsReturned, \
+from django.core.exceptions import ImproperlyConfigured, \
+    MultipleObjectsReturned, \
     ObjectDoesNotExist
 from django.db import models
-
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from card_issuing_excercise.apps.processing.balance_metrics import \
+    RollForwardMetrics
+from card_issuing_excercise.apps.processing.caches import CardAccounts, \
+    CardAccountsCache, \
+    SpecialAccount, \
+    SpecialAccountsRegistry
 from card_issuing_excercise.apps.processing.models.transfers import Transfer
 from card_issuing_excercise.apps.processing.models.transactions import \
     Transaction, \
     TRANSACTION_AUTHORIZATION_STATUS
 from card_issuing_excercise.apps.utils import \
     timestamp_to_datetime, \
-    to_start_day_from_ts, \
     is_in_future
 from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS, \
-    ROOT_USERNAME, ROOT_PASSWORD
+    BALANCE_ROLL_FORWARD_MAX_DAYS, \
+    ROOT_USERNAME, ROOT_PASSWORD, \
+    SPECIAL_ACCOUNT_SHARDS
+
 
+logger = logging.getLogger(__name__)
 
 CARD_ID_LENGTH = 8
 
@@ -65,6 +83,21 @@ ACCOUNT_ROLE_TYPES = (
     (REVENUE_ACCOUNT_ROLE, 'Inner revenue account')
 )
 
+# Roles of service accounts, created on startup
+SPECIAL_ACCOUNT_ROLES = (
+    INNER_SETTLEMENT_ACCOUNT_ROLE,
+    EXTERNAL_LOAD_MONEY_ACCOUNT_ROLE,
+    EXTERNAL_SETTLEMENT_ACCOUNT_ROLE,
+    REVENUE_ACCOUNT_ROLE,
+)
+
+
+def get_shard(shard_key, shards_number):
+    '''
+    Stable across processes shard number for key
+    '''
+    return zlib.crc32(str(shard_key).encode('utf-8')) % shards_number
+
 
 class UserAccountManager(models.Manager):
 
@@ -73,6 +106,47 @@ class UserAccountManager(models.Manager):
     # Use inheritance not mixins, as all new added functionality won't be
     # reused elsewhere
 
+    def get_amounts_for_ts_batch(self, requests):
+        '''
+        Batch version of get_amounts_for_ts.
+        Accepts list of (user_account, date_ts) pairs
+        (prefetch accounts of user accounts to save queries),
+        returns list of (real_amount, available_amount) in the same order.
+        Amount of account is balance after its latest transfer
+        made at or before point of time: latest transfers of all pairs
+        are found by one query per chunk of pairs.
+        Accounts whose latest transfer has no running balance
+        (saved before it was introduced) are rolled from snapshots
+        '''
+        results = [None] * len(requests)
+        amounts = {}
+        lookups = []
+        for index, (user_account, date_ts) in enumerate(requests):
+            if not date_ts or is_in_future(date_ts):
+                results[index] = user_account.current_amounts_tuple
+                continue
+            date = timestamp_to_datetime(date_ts)
+            if user_account.created_at > date:
+                results[index] = (0, 0)
+                continue
+            amounts[index] = {}
+            lookups += [(index, account, date)
+                        for account in user_account.accounts.all()]
+        balances = Transfer.objects.get_latest_balances(
+            [(account.id, date) for _, account, date in lookups])
+        for lookup_index, (index, account, date) in enumerate(lookups):
+            # accounts which didn't move yet hold zero
+            balance = balances.get(lookup_index, 0)
+            if balance is None:
+                user_account = requests[index][0]
+                balance = user_account._get_rolled_amounts(
+                    [account], date)[account.id]
+            amounts[index][account.id] = balance
+        for index, account_amounts in amounts.items():
+            results[index] = requests[index][0].get_amounts_tuple(
+                account_amounts)
+        return results
+
     def get_account_for_update(self, account_id):
         '''
         Prefetches related "real" accounts safely for next update,
@@ -85,6 +159,48 @@ class UserAccountManager(models.Manager):
             )
         ).get(id=account_id)
 
+    def get_card_accounts(self, card_id):
+        '''
+        Returns ids of user account and its "real" accounts by card_id
+        as CardAccounts tuple or None for unknown card.
+        Uses process level cache, hits database only once per card.
+        '''
+        return self.get_cards_accounts([card_id]).get(card_id)
+
+    def get_cards_accounts(self, card_ids):
+        '''
+        Bulk version of get_card_accounts.
+        Returns dict card_id -> CardAccounts for all known cards.
+        All not cached cards are fetched in one query.
+        '''
+        cache = CardAccountsCache()
+        cards_accounts = {}
+        for card_id in card_ids:
+            card_accounts = cache.get(card_id)
+            if card_accounts is not None:
+                cards_accounts[card_id] = card_accounts
+        not_cached_card_ids = [card_id for card_id in card_ids
+                               if card_id not in cards_accounts]
+        if not not_cached_card_ids:
+            return cards_accounts
+        accounts = Account.objects.\
+            filter(user_account__card_id__in=not_cached_card_ids,
+                   shard=0).\
+            values_list('user_account__card_id', 'user_account_id',
+                        'account_type', 'id')
+        accounts_by_card_id = {}
+        for card_id, user_account_id, account_type, account_id in accounts:
+            card_accounts = accounts_by_card_id.setdefault(
+                card_id, {'user_account_id': user_account_id})
+            card_accounts[account_type] = account_id
+        for card_id, card_accounts in accounts_by_card_id.items():
+            cards_accounts[card_id] = CardAccounts(
+                user_account_id=card_accounts['user_account_id'],
+                base_account_id=card_accounts.get(BASIC_ACCOUNT_TYPE),
+                reserved_account_id=card_accounts.get(RESERVED_ACCOUNT_TYPE))
+            cache.set(card_id, cards_accounts[card_id])
+        return cards_accounts
+
     def create(self, *args, **kwargs):
         '''
         Creates user accounts with all "real" accounts linked.
@@ -96,6 +212,7 @@ class UserAccountManager(models.Manager):
         user_account = super(UserAccountManager, self).create(*args, **kwargs)
         for account_type in linked_account_types:
             user_account.accounts.create(account_type=account_type)
+        CardAccountsCache().invalidate(user_account.card_id)
         return user_account
 
     def _get_linked_account_types(self, **kwargs):
@@ -126,23 +243,49 @@ class UserAccountManager(models.Manager):
         '''Shotcut for revenue account creation'''
         return self.create_special_account(REVENUE_ACCOUNT_ROLE)
 
-    def create_special_account(self, role):
+    def create_special_account(self, role, shards_number=None):
         '''
         Helper for creating special account of specified type.
         For simplicity binds it to root user.
         Fails if there is no one.
         Checks if accout already exists and returns it
-        instead of creating new one
-        '''
+        instead of creating new one.
+        Creates missing basic account shards
+        (number of shards is taken from settings if not specified)
+        '''
+        # pinned account should be resolved again
+        SpecialAccountsRegistry().invalidate(role)
+        if shards_number is None:
+            shards_number = SPECIAL_ACCOUNT_SHARDS.get(role, 1)
         try:
-            return self.get(role=role)
+            user_account = self.get(role=role)
         except ObjectDoesNotExist:
             root_user = self._get_or_create_root_user()
-            return self.create(user=root_user, role=role,
-                               card_id=role, name=role,
-                               linked_account_types=[BASIC_ACCOUNT_TYPE, ])
+            user_account = self.create(
+                user=root_user, role=role,
+                card_id=role, name=role,
+                linked_account_types=[BASIC_ACCOUNT_TYPE, ])
         except MultipleObjectsReturned:
             raise ValueError('More than one {} acc'.format(role))
+        self._create_missing_shards(user_account, shards_number)
+        return user_account
+
+    def _create_missing_shards(self, user_account, shards_number):
+        '''
+        Helper for creating basic account shards of special account.
+        Shards are never deleted: all of them hold money
+        '''
+        existing_shards = set(
+            user_account.accounts.filter(account_type=BASIC_ACCOUNT_TYPE).
+            values_list('shard', flat=True))
+        missing_shards = [shard for shard in range(shards_number)
+                          if shard not in existing_shards]
+        if not missing_shards:
+            return
+        Account.objects.bulk_create([
+            Account(user_account=user_account,
+                    account_type=BASIC_ACCOUNT_TYPE, shard=shard)
+            for shard in missing_shards])
 
     def _get_or_create_root_user(self):
         '''
@@ -187,6 +330,74 @@ class UserAccountManager(models.Manager):
         except MultipleObjectsReturned:
             return None
 
+    ##
+    # Pinned special accounts
+    ##
+
+    def load_special_accounts(self):
+        '''
+        Resolves basic accounts of all special roles in one query
+        and pins them in process memory.
+        Raises ImproperlyConfigured if any special account is missing
+        '''
+        special_accounts = self._get_special_accounts(SPECIAL_ACCOUNT_ROLES)
+        missing_roles = [role for role in SPECIAL_ACCOUNT_ROLES
+                         if role not in special_accounts]
+        if missing_roles:
+            raise ImproperlyConfigured(
+                'Special accounts are missing: {}. '
+                'Run initialize_before_startup first'.format(
+                    ', '.join(missing_roles)))
+        registry = SpecialAccountsRegistry()
+        for role, special_account in special_accounts.items():
+            registry.set(role, special_account)
+
+    def get_pinned_special_account(self, role, shard_key=None):
+        '''
+        Returns basic account of special role.
+        Account is resolved once per process and only its ids are pinned,
+        so amount of returned account is not loaded.
+        For sharded account shard is chosen by hash of shard_key
+        (card_id for example), first shard is returned without it.
+        Returns None if there is no such special account
+        '''
+        registry = SpecialAccountsRegistry()
+        special_account = registry.get(role)
+        if special_account is None:
+            special_account = self._get_special_accounts([role]).get(role)
+            if special_account is None:
+                return None
+            registry.set(role, special_account)
+        shard = 0
+        if shard_key is not None:
+            shard = get_shard(shard_key,
+                              len(special_account.base_account_ids))
+        return Account.objects.get_reference(
+            special_account.base_account_ids[shard],
+            user_account_id=special_account.user_account_id,
+            account_type=BASIC_ACCOUNT_TYPE, shard=shard)
+
+    def _get_special_accounts(self, roles):
+        '''
+        Helper for getting ids of special accounts by roles.
+        Returns dict role -> SpecialAccount
+        '''
+        accounts = Account.objects.\
+            filter(user_account__role__in=roles,
+                   account_type=BASIC_ACCOUNT_TYPE).\
+            order_by('shard').\
+            values_list('user_account__role', 'user_account_id', 'id')
+        accounts_by_role = {}
+        for role, user_account_id, account_id in accounts:
+            user_account_id, account_ids = accounts_by_role.setdefault(
+                role, (user_account_id, []))
+            account_ids.append(account_id)
+        return {
+            role: SpecialAccount(user_account_id=user_account_id,
+                                 base_account_ids=tuple(account_ids))
+            for role, (user_account_id, account_ids) in
+            accounts_by_role.items()}
+
 
 class UserAccountsUnion(models.Model):
 
@@ -265,20 +476,35 @@ class UserAccountsUnion(models.Model):
         '''
         return self._get_account_by_type(RESERVED_ACCOUNT_TYPE)
 
+    @property
+    def base_account_shards(self):
+        '''
+        All basic account shards ordered by shard number.
+        Only special accounts can have more than one shard
+        '''
+        return sorted(
+            [account for account in self.accounts.all()
+             if account.account_type == BASIC_ACCOUNT_TYPE],
+            key=lambda account: account.shard)
+
     def _get_account_by_type(self, account_type):
         '''
-        Helper for getting related account by type
+        Helper for getting related account (its first shard) by type.
+        Uses prefetched accounts if they were fetched already
         '''
-        return self.accounts.filter(account_type=account_type).first()
+        for account in self.accounts.all():
+            if account.account_type == account_type and not account.shard:
+                return account
+        return None
 
     def _get_account_amount_by_type(self, account_type):
         '''
-        Helper for getting related account amount by account_type
+        Helper for getting related account amount by account_type.
+        Sums amounts of all shards
         '''
-        account = self._get_account_by_type(account_type)
-        if not account:
-            return 0
-        return account.amount
+        return sum(
+            account.amount for account in self.accounts.all()
+            if account.account_type == account_type)
 
     def get_amounts_for_ts(self, date_ts=None):
         '''
@@ -286,89 +512,279 @@ class UserAccountsUnion(models.Model):
         For non set date_ts returns current amount.
         Return two amounts: real_amount (base + reserved) and available amount (just base)
         '''
-        if not date_ts:
-            return self.current_amounts_tuple
-        if is_in_future(date_ts):
-            return self.current_amounts_tuple
-        start_day_date = to_start_day_from_ts(date_ts)
-        date = timestamp_to_datetime(date_ts)
-        if self.created_at > date:
-            return (0, 0)
-        if self.created_at > start_day_date:
-            # don't have any logs yet at this point
-            base_amount, reserved_amount = (0, 0)
+        return UserAccountsUnion.objects.get_amounts_for_ts_batch(
+            [(self, date_ts)])[0]
+
+    def get_amounts_series(self, begin_ts, end_ts, step):
+        '''
+        Returns list of (ts, real_amount, available_amount)
+        for every step (in seconds) from begin_ts till end_ts.
+        Balance at begin_ts is found once, than transfers made till end_ts
+        are streamed in time order by one range query and summed up
+        '''
+        account_types = {
+            account.id: account.account_type
+            for account in self.accounts.all()}
+        if begin_ts == 0:
+            # zero ts is current balance for balance lookups,
+            # but series starts from epoch then: nothing was posted before it
+            total_amount, available_amount = 0, 0
         else:
-            base_amount, reserved_amount = self._get_amounts_for_date(
-                start_day_date)
-        base_amount_diff, reserved_amount_diff = \
-            self._roll_forward_in_time_range(start_day_date, date)
-        available_amount = base_amount + base_amount_diff
+            total_amount, available_amount = self.get_amounts_for_ts(begin_ts)
+        transfers = Transfer.objects.\
+            filter(account_id__in=list(account_types)).\
+            filter(created_at__gt=timestamp_to_datetime(begin_ts),
+                   created_at__lte=timestamp_to_datetime(end_ts)).\
+            order_by('created_at', 'id').\
+            values_list('account_id', 'created_at', 'amount').\
+            iterator()
+        transfer = next(transfers, None)
+        series = []
+        point_ts = begin_ts
+        while point_ts <= end_ts:
+            point_date = timestamp_to_datetime(point_ts)
+            while transfer is not None and transfer[1] <= point_date:
+                account_id, _, amount = transfer
+                total_amount += amount
+                if account_types[account_id] == BASIC_ACCOUNT_TYPE:
+                    available_amount += amount
+                transfer = next(transfers, None)
+            series.append((point_ts, total_amount, available_amount))
+            point_ts += step
+        return series
+
+    def get_amounts_tuple(self, amounts):
+        '''
+        Sums amounts of linked accounts by account type.
+        Accepts dict account_id -> amount, accounts without amount hold zero.
+        Returns real_amount (base + reserved) and available amount (just base)
+        '''
+        amounts_by_type = {}
+        for account in self.accounts.all():
+            amounts_by_type[account.account_type] = \
+                amounts_by_type.get(account.account_type, 0) + \
+                amounts.get(account.id, 0)
+        available_amount = amounts_by_type.get(BASIC_ACCOUNT_TYPE, 0)
         total_amount = available_amount + \
-            reserved_amount + reserved_amount_diff
+            amounts_by_type.get(RESERVED_ACCOUNT_TYPE, 0)
         return total_amount, \
             available_amount
 
-    def _get_amounts_for_date(self, start_day_date):
-        '''
-        Find amount for particular point at time.
-        Don't check whether they exists or not.
-        '''
-        nearest_accounts = self.accounts.\
-            filter(account_logs__date=start_day_date).\
-            values('account_type', 'account_logs__amount')
-        nearest_accounts = {
-            account['account_type']: account['account_logs__amount']
-            for account in nearest_accounts}
-        return nearest_accounts.get(BASIC_ACCOUNT_TYPE, 0), \
-            nearest_accounts.get(RESERVED_ACCOUNT_TYPE, 0)
-
-    def _roll_forward_in_time_range(self, begin_date, end_date):
-        '''
-        Calculates the result of all transfers in given time period
-        for all linked accounts
-        '''
-        time_range = [begin_date, end_date]
-        account_ids = [a.id for a in self.accounts.all()]
-        transfer_diffs = Transfer.objects.\
-            filter(transaction__created_at__range=time_range).\
-            filter(account_id__in=account_ids).\
-            values('account__account_type').\
+    def _get_rolled_amounts(self, accounts, date):
+        '''
+        Find amounts of accounts for particular point at time by account id.
+        Every account starts from its nearest previous checkpoint
+        or day snapshot and transfers made since then are rolled forward.
+        If roll forward window is longer than cap and current moment
+        is closer, transfers made after point of time are rolled back
+        from current amount instead
+        '''
+        max_window = datetime.timedelta(days=BALANCE_ROLL_FORWARD_MAX_DAYS)
+        now = datetime.datetime.now()
+        amounts = {}
+        forward_starts = {}
+        backward_account_ids = []
+        for account in accounts:
+            start_date, amount = self._get_nearest_snapshot(account, date)
+            window = date - (start_date or self.created_at)
+            cap_exceeded = window > max_window
+            RollForwardMetrics().record(window, cap_exceeded)
+            if cap_exceeded:
+                logger.warning(
+                    'Balance of account %s is rolled forward for %s: '
+                    'day snapshots are missing', account.id, window)
+            if cap_exceeded and now - date < window:
+                amounts[account.id] = account.amount
+                backward_account_ids.append(account.id)
+            else:
+                amounts[account.id] = amount
+                forward_starts[account.id] = start_date
+        for account_id, amount_diff in \
+                self._roll_forward(forward_starts, date).items():
+            amounts[account_id] += amount_diff
+        for account_id, amount_diff in \
+                self._roll_back(backward_account_ids, date).items():
+            amounts[account_id] -= amount_diff
+        return amounts
+
+    def _get_nearest_snapshot(self, account, date):
+        '''
+        Returns moment and amount of the latest intraday checkpoint
+        or day snapshot (taken at the beginning of the day)
+        of account at or before date, whichever is later.
+        Returns None and zero amount if there are no snapshots yet
+        '''
+        checkpoint = account.account_checkpoints.\
+            filter(created_at__lte=date).\
+            order_by('-created_at').\
+            values_list('created_at', 'amount').\
+            first()
+        start_day = datetime.datetime.combine(date.date(), datetime.time.min)
+        if checkpoint is not None and checkpoint[0] >= start_day:
+            # no day snapshot can be later
+            return checkpoint
+        snapshot = account.account_logs.\
+            filter(date__lte=date.date()).\
+            order_by('-date').\
+            values_list('date', 'amount').\
+            first()
+        if snapshot is not None:
+            snapshot_date, amount = snapshot
+            snapshot = \
+                datetime.datetime.combine(snapshot_date, datetime.time.min), \
+                amount
+        snapshots = [s for s in (checkpoint, snapshot) if s is not None]
+        if not snapshots:
+            return None, 0
+        return max(snapshots, key=lambda s: s[0])
+
+    def _roll_forward(self, start_dates, end_date):
+        '''
+        Calculates the result of transfers of every account
+        since its start date (since the beginning for None) till end date.
+        All accounts are aggregated by one query
+        '''
+        if not start_dates:
+            return {}
+        accounts_filters = []
+        for account_id, start_date in start_dates.items():
+            account_filter = models.Q(account_id=account_id)
+            if start_date is not None:
+                account_filter &= models.Q(created_at__gte=start_date)
+            accounts_filters.append(account_filter)
+        return self._get_transfer_diffs(
+            Transfer.objects.
+            filter(functools.reduce(operator.or_, accounts_filters)).
+            filter(created_at__lte=end_date))
+
+    def _roll_back(self, account_ids, begin_date):
+        '''
+        Calculates the result of transfers of every account
+        made after begin date
+        '''
+        if not account_ids:
+            return {}
+        return self._get_transfer_diffs(
+            Transfer.objects.
+            filter(account_id__in=account_ids).
+            filter(created_at__gt=begin_date))
+
+    def _get_transfer_diffs(self, transfers):
+        transfer_diffs = transfers.\
+            values('account_id').\
             annotate(amount_diff=models.Sum('amount'))
-        transfer_diffs = {
-            t['account__account_type']: t['amount_diff']
+        return {
+            t['account_id']: t['amount_diff']
             for t in transfer_diffs}
-        return transfer_diffs.get(BASIC_ACCOUNT_TYPE, 0), \
-            transfer_diffs.get(RESERVED_ACCOUNT_TYPE, 0)
 
     def get_transactions(self, **kwargs):
         '''
         Get all transactions for account in time range
+        ordered by creation time and id in descending order.
+        Transactions are selected by one query
+        with subquery over transfers of base account.
         Accepts:
         - begin_ts
         - end_ts
         All parameters are not required
         '''
+        transfers = self.base_account.transfers.filter(
+            **self._get_time_range_filter(**kwargs))
+        transfers_for_display_qs = Transfer.objects.filter(
+            account_id=self.base_account.id)
+        return Transaction.objects.prefetch_related(
+            models.Prefetch('transfers',
+                            queryset=transfers_for_display_qs)
+        ).filter(id__in=transfers.values('transaction')).\
+            exclude(status=TRANSACTION_AUTHORIZATION_STATUS).\
+            order_by('-created_at', '-id')
+
+    def get_transactions_transfers(self, **kwargs):
+        '''
+        Get transfers of base account in time range
+        which represent transactions of history,
+        ordered by posting time and id in descending order.
+        Filter and order are served by account and posting time index,
+        so transactions are paged by their transfers
+        (see Transfer.objects.get_transactions_page).
+        Accepts the same parameters as get_transactions
+        '''
+        # transfers saved before posting time was added
+        # are paged after backfill_transfers_created_at only
+        return self.base_account.transfers.\
+            filter(created_at__isnull=False,
+                   **self._get_time_range_filter(**kwargs)).\
+            exclude(transaction__status=TRANSACTION_AUTHORIZATION_STATUS).\
+            select_related('transaction').\
+            order_by('-created_at', '-id')
+
+    def _get_time_range_filter(self, **kwargs):
+        '''
+        Helper for building filter of transfers by begin_ts and end_ts
+        '''
         KWARGS_TO_FILTER_PARAMS = {
-            'end_ts': 'transaction__created_at__lt',
-            'begin_ts': 'transaction__created_at__gte'}
+            'end_ts': 'created_at__lt',
+            'begin_ts': 'created_at__gte'}
         filter_params = {}
         for ts_key, filter_param in KWARGS_TO_FILTER_PARAMS.items():
             if not kwargs.get(ts_key):
                 continue
             filter_params[filter_param] = timestamp_to_datetime(
                 kwargs.get(ts_key))
-        transfers = self.base_account.transfers.filter(**filter_params)
-        transaction_ids = [
-            transfer.transaction_id
-            for transfer in transfers]
-        transfers_for_display_qs = Transfer.objects.filter(
-            account_id=self.base_account.id)
-        return Transaction.objects.prefetch_related(
-            models.Prefetch('transfers',
-                            queryset=transfers_for_display_qs)
-        ).filter(id__in=transaction_ids).\
-            exclude(status=TRANSACTION_AUTHORIZATION_STATUS).\
-            order_by('-created_at')
+        return filter_params
+
+
+@receiver(post_delete, sender=UserAccountsUnion)
+def invalidate_account_caches(sender, instance, **kwargs):
+    '''
+    Drops deleted user account from card_id cache
+    and unpins it if it was special account
+    '''
+    CardAccountsCache().invalidate(instance.card_id)
+    if instance.role in SPECIAL_ACCOUNT_ROLES:
+        SpecialAccountsRegistry().invalidate(instance.role)
+
+
+class AccountManager(models.Manager):
+
+    '''Helpers for "real" accounts management'''
+
+    def get_for_update(self, *account_ids):
+        '''
+        Locks accounts by primary keys with one SELECT ... FOR UPDATE.
+        Returns accounts in the same order as ids.
+        Should be called inside database transaction
+        '''
+        accounts = {
+            account.id: account
+            for account in self.select_for_update().filter(
+                id__in=account_ids)}
+        return [accounts.get(account_id) for account_id in account_ids]
+
+    def modify_amounts(self, amount_diffs):
+        '''
+        Modifies amounts of many accounts by one CASE-based UPDATE
+        without performing any additional checks on sums.
+        Accepts dict account_id -> amount difference
+        '''
+        if not amount_diffs:
+            return
+        amount_field = models.DecimalField(**AMOUNT_PRECISION_SETTINGS)
+        amount_diff_cases = [
+            models.When(id=account_id,
+                        then=models.Value(amount_diff,
+                                          output_field=amount_field))
+            for account_id, amount_diff in sorted(amount_diffs.items())]
+        self.filter(id__in=list(amount_diffs)).update(
+            amount=models.F('amount') + models.Case(
+                *amount_diff_cases, output_field=amount_field))
+
+    def get_reference(self, account_id, **kwargs):
+        '''
+        Returns account by primary key without hitting database.
+        Amount of returned account is not loaded
+        '''
+        return self.model(id=account_id, amount=None, **kwargs)
 
 
 class Account(models.Model):
@@ -386,6 +802,12 @@ class Account(models.Model):
     user_account = models.ForeignKey(
         UserAccountsUnion,
         related_name='accounts', verbose_name='User account')
+    # hot special accounts are split into many rows
+    # to avoid contention on one row
+    shard = models.PositiveSmallIntegerField(
+        verbose_name='Shard', default=0)
+
+    objects = AccountManager()
 
     def modify_amount(self, amount):
         '''
@@ -396,3 +818,19 @@ class Account(models.Model):
         self.save(update_fields=['amount'])
         # to get rid of F() effect and prevent any double changes
         self.refresh_from_db()
+
+    def debit_if_enough(self, amount):
+        '''
+        Deducts amount only if account holds enough money.
+        Check and deduction are done by one conditional UPDATE,
+        so account doesn't need to be selected for update.
+        Doesn't refresh amount in memory.
+        Returns whether amount was deducted
+        '''
+        updated_rows = Account.objects.\
+            filter(id=self.id, amount__gte=amount).\
+            update(amount=models.F('amount') - amount)
+        return updated_rows == 1
+
+    class Meta:
+        unique_together = ('user_account', 'account_type', 'shard')
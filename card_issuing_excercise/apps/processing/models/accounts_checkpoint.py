@@ -0,0 +1,105 @@
+'''Model for caching balance at intraday checkpoints'''
+
+import datetime
+
+from django.db import connection, models
+
+from card_issuing_excercise.apps.processing.models.accounts import Account
+from card_issuing_excercise.apps.processing.models.accounts_day_log import \
+    read_committed, \
+    MYSQL_UPSERT
+from card_issuing_excercise.apps.processing.models.transfers import Transfer
+from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS, \
+    BALANCE_CHECKPOINT_INTERVAL
+
+
+# Balances at checkpoint of accounts moved during interval before it.
+# Derived from current amounts and transfers made since checkpoint,
+# which are few if job runs right after interval end
+CHECKPOINT_SQL = '''
+    INSERT INTO {checkpoint} ({account_id}, {created_at}, {amount})
+    SELECT account.id, %s, account.amount - COALESCE((
+        SELECT SUM(transfer.amount)
+        FROM {transfer} transfer
+        WHERE transfer.account_id = account.id
+            AND transfer.created_at >= %s), 0)
+    FROM {account} account
+    WHERE account.id IN (
+        SELECT transfer.account_id
+        FROM {transfer} transfer
+        WHERE transfer.created_at >= %s
+            AND transfer.created_at < %s)
+    {upsert}'''
+DEFAULT_UPSERT = '''ON CONFLICT ({account_id}, {created_at})
+    DO UPDATE SET {amount} = excluded.{amount}'''
+
+
+def get_checkpoint_at(date):
+    '''
+    Latest checkpoint moment at or before date.
+    Checkpoints are counted from the beginning of the day
+    '''
+    start_day = datetime.datetime.combine(date.date(), datetime.time.min)
+    seconds = int((date - start_day).total_seconds())
+    return start_day + datetime.timedelta(
+        seconds=seconds - seconds % BALANCE_CHECKPOINT_INTERVAL)
+
+
+class AccountCheckpointManager(models.Manager):
+
+    '''Intraday checkpoints management'''
+
+    def save_checkpoints(self, checkpoint_at):
+        '''
+        Saves balances at checkpoint moment
+        of accounts moved during interval before it
+        by one INSERT ... SELECT inside of database
+        without locking accounts rows.
+        Existing checkpoints are overwritten, so reruns are safe.
+        '''
+        interval = datetime.timedelta(seconds=BALANCE_CHECKPOINT_INTERVAL)
+        with read_committed(), connection.cursor() as cursor:
+            cursor.execute(
+                self._get_sql(CHECKPOINT_SQL),
+                [checkpoint_at, checkpoint_at,
+                 checkpoint_at - interval, checkpoint_at])
+
+    def _get_sql(self, sql_template):
+        '''
+        Helper for building checkpoint query for current database
+        '''
+        quote_name = connection.ops.quote_name
+        columns = {
+            column_key: quote_name(
+                self.model._meta.get_field(field_name).column)
+            for column_key, field_name in [('account_id', 'account'),
+                                           ('created_at', 'created_at'),
+                                           ('amount', 'amount')]}
+        upsert = MYSQL_UPSERT if connection.vendor == 'mysql' \
+            else DEFAULT_UPSERT
+        return sql_template.format(
+            checkpoint=quote_name(self.model._meta.db_table),
+            account=quote_name(Account._meta.db_table),
+            transfer=quote_name(Transfer._meta.db_table),
+            upsert=upsert.format(**columns),
+            **columns)
+
+
+class AccountCheckpoint(models.Model):
+
+    '''
+    Stores account balance at intraday checkpoint:
+    all transfers made before checkpoint moment are included.
+    Created only for accounts moved during interval before checkpoint.
+    '''
+
+    account = models.ForeignKey(
+        'Account', related_name='account_checkpoints', verbose_name='Account')
+    created_at = models.DateTimeField(verbose_name='Checkpoint moment')
+    amount = models.DecimalField(
+        verbose_name='Amount', default=0.0, **AMOUNT_PRECISION_SETTINGS)
+
+    objects = AccountCheckpointManager()
+
+    class Meta:
+        unique_together = ('account', 'created_at')
@@ -1,8 +1,172 @@
 '''Model for caching balance for specified day'''
 
-from django.db import models
+from contextlib import contextmanager
+import datetime
 
-from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS
+from django.db import connection, models, transaction
+
+from card_issuing_excercise.apps.processing.models.accounts import Account
+from card_issuing_excercise.apps.processing.models.transfers import Transfer
+from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS, \
+    BALANCE_SNAPSHOT_COMMIT_LAG
+
+
+# Balances of accounts at the beginning of the day.
+# Derived from current amounts and transfers made since then,
+# so snapshot of any past day can be (re)built at any moment
+DAY_SNAPSHOT_SQL = '''
+    INSERT INTO {day_log} ({account_id}, {date}, {amount})
+    SELECT account.id, %s, account.amount - COALESCE((
+        SELECT SUM(transfer.amount)
+        FROM {transfer} transfer
+        WHERE transfer.account_id = account.id
+            AND transfer.created_at >= %s), 0)
+    FROM {account} account
+    WHERE account.id > %s AND account.id <= %s
+    {upsert}'''
+# Incremental snapshot: balances of the previous day are carried forward
+# and accounts moved during previous day get
+# their nearest previous snapshot plus sum of day transfers
+CARRY_FORWARD_SQL = '''
+    INSERT INTO {day_log} ({account_id}, {date}, {amount})
+    SELECT previous.{account_id}, %s, previous.{amount}
+    FROM {day_log} previous
+    WHERE previous.{date} = %s
+    {upsert}'''
+DAY_MOVEMENTS_SQL = '''
+    INSERT INTO {day_log} ({account_id}, {date}, {amount})
+    SELECT moved.account_id, %s, moved.amount_diff + COALESCE((
+        SELECT previous.{amount}
+        FROM {day_log} previous
+        WHERE previous.{account_id} = moved.account_id
+            AND previous.{date} < %s
+        ORDER BY previous.{date} DESC
+        LIMIT 1), 0)
+    FROM (
+        SELECT transfer.account_id, SUM(transfer.amount) AS amount_diff
+        FROM {transfer} transfer
+        WHERE transfer.created_at >= %s
+            AND transfer.created_at < %s
+        GROUP BY transfer.account_id) moved
+    WHERE 1 = 1
+    {upsert}'''
+MYSQL_UPSERT = 'ON DUPLICATE KEY UPDATE {amount} = VALUES({amount})'
+DEFAULT_UPSERT = '''ON CONFLICT ({account_id}, {date})
+    DO UPDATE SET {amount} = excluded.{amount}'''
+
+
+def get_committed_moment():
+    '''
+    Latest moment all transfers stamped before which are committed
+    '''
+    return datetime.datetime.now() - \
+        datetime.timedelta(seconds=BALANCE_SNAPSHOT_COMMIT_LAG)
+
+
+@contextmanager
+def read_committed():
+    '''
+    Runs transactions started inside the block with READ COMMITTED
+    isolation on MySQL. Under default REPEATABLE READ InnoDB reads source
+    rows of INSERT ... SELECT with shared locks, which would block
+    debits of accounts till snapshot statement ends.
+    READ COMMITTED reads them by consistent non-locking read.
+    Other databases don't lock source rows, so nothing is changed there
+    '''
+    if connection.vendor != 'mysql':
+        yield
+        return
+    variable = 'transaction_isolation' \
+        if connection.mysql_version >= (5, 7, 20) else 'tx_isolation'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT @@SESSION.{}'.format(variable))
+        isolation = cursor.fetchone()[0]
+        cursor.execute(
+            'SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SET SESSION {} = %s'.format(variable), [isolation])
+
+
+class AccountDayLogManager(models.Manager):
+
+    '''Day snapshots management'''
+
+    def save_day_snapshots(self, date, chunk_size=10000):
+        '''
+        Saves balances of all accounts at the beginning of the date.
+        Accounts are processed by chunks of ids,
+        every chunk by one INSERT ... SELECT inside of database
+        without locking accounts rows.
+        Existing snapshots are overwritten, so reruns are safe.
+        Returns number of processed chunks
+        '''
+        ids_range = Account.objects.aggregate(
+            min_id=models.Min('id'), max_id=models.Max('id'))
+        if ids_range.get('min_id') is None:
+            return 0
+        sql = self._get_sql(DAY_SNAPSHOT_SQL)
+        start_day = datetime.datetime.combine(date, datetime.time.min)
+        chunks_number = 0
+        last_id = ids_range.get('min_id') - 1
+        with read_committed(), connection.cursor() as cursor:
+            while last_id < ids_range.get('max_id'):
+                cursor.execute(
+                    sql, [date, start_day, last_id, last_id + chunk_size])
+                last_id += chunk_size
+                chunks_number += 1
+        return chunks_number
+
+    def save_incremental_day_snapshots(self, date, chunk_size=10000,
+                                       skip_idle=False):
+        '''
+        Saves balances of all accounts at the beginning of the date
+        from snapshots of the previous day and its transfers.
+        Transfers are aggregated by one grouped query,
+        so cost depends on the day activity, not on the history.
+        With skip_idle only accounts moved during previous day get snapshots:
+        balance lookup uses the nearest previous snapshot anyway.
+        Falls back to full snapshots if previous day wasn't cached.
+        Existing snapshots are overwritten, so reruns are safe
+        '''
+        previous_date = date - datetime.timedelta(days=1)
+        if not self.filter(date=previous_date).exists():
+            self.save_day_snapshots(date, chunk_size=chunk_size)
+            return
+        start_day = datetime.datetime.combine(date, datetime.time.min)
+        # readers never see carried forward balances of moved accounts
+        with read_committed(), transaction.atomic(), \
+                connection.cursor() as cursor:
+            if not skip_idle:
+                cursor.execute(self._get_sql(CARRY_FORWARD_SQL),
+                               [date, previous_date])
+            cursor.execute(self._get_sql(DAY_MOVEMENTS_SQL),
+                           [date, date,
+                            start_day - datetime.timedelta(days=1),
+                            start_day])
+
+    def _get_sql(self, sql_template):
+        '''
+        Helper for building snapshot query for current database
+        '''
+        quote_name = connection.ops.quote_name
+        columns = {
+            column_key: quote_name(
+                self.model._meta.get_field(field_name).column)
+            for column_key, field_name in [('account_id', 'account'),
+                                           ('date', 'date'),
+                                           ('amount', 'amount')]}
+        upsert = MYSQL_UPSERT if connection.vendor == 'mysql' \
+            else DEFAULT_UPSERT
+        return sql_template.format(
+            day_log=quote_name(self.model._meta.db_table),
+            account=quote_name(Account._meta.db_table),
+            transfer=quote_name(Transfer._meta.db_table),
+            upsert=upsert.format(**columns),
+            **columns)
 
 
 class AccountDayLog(models.Model):
@@ -18,5 +182,7 @@ class AccountDayLog(models.Model):
     amount = models.DecimalField(
         verbose_name='Amount', default=0.0, **AMOUNT_PRECISION_SETTINGS)
 
+    objects = AccountDayLogManager()
+
     class Meta:
         unique_together = ('account', 'date')
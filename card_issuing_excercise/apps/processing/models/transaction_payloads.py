@@ -0,0 +1,99 @@
+'''Stores raw Schema payloads of transactions'''
+
+import base64
+import zlib
+
+from django.db import connection, models
+
+from card_issuing_excercise.apps.utils import dict_to_json_bytes
+
+
+PAYLOAD_COMPRESSION_LEVEL = 6
+
+# Descriptions could be updated many times:
+# payloads of same transaction are overwritten
+PAYLOADS_SQL = '''
+    INSERT INTO {payload} ({transaction_id}, {data})
+    VALUES {values}
+    {upsert}'''
+MYSQL_UPSERT = 'ON DUPLICATE KEY UPDATE {data} = VALUES({data})'
+DEFAULT_UPSERT = '''ON CONFLICT ({transaction_id})
+    DO UPDATE SET {data} = excluded.{data}'''
+
+
+class TransactionPayloadManager(models.Manager):
+
+    '''
+    Compresses and saves payloads
+    '''
+
+    def save_payloads(self, transactions_infos):
+        '''
+        Saves compressed payloads of many transactions by one INSERT.
+        Existing payloads are overwritten.
+        Accepts dict transaction_id -> info_in_json
+        '''
+        if not transactions_infos:
+            return
+        data_field = self.model._meta.get_field('data')
+        values, params = [], []
+        for transaction_id, info_in_json in \
+                sorted(transactions_infos.items()):
+            data = data_field.get_db_prep_value(
+                self.compress(info_in_json), connection)
+            values.append('(%s, {})'.format(
+                connection.ops.binary_placeholder_sql(data)))
+            params.extend([transaction_id, data])
+        with connection.cursor() as cursor:
+            cursor.execute(self._get_sql(', '.join(values)), params)
+
+    def compress(self, info_in_json):
+        '''
+        Compresses dict as JSON with all values converted to str
+        '''
+        return self.compress_json_bytes(dict_to_json_bytes(info_in_json))
+
+    def compress_json_bytes(self, json_bytes):
+        return zlib.compress(json_bytes, PAYLOAD_COMPRESSION_LEVEL)
+
+    def _get_sql(self, values):
+        '''
+        Helper for building payloads upsert for current database
+        '''
+        quote_name = connection.ops.quote_name
+        columns = {
+            'transaction_id': quote_name(
+                self.model._meta.get_field('transaction').column),
+            'data': quote_name(self.model._meta.get_field('data').column)}
+        upsert = MYSQL_UPSERT if connection.vendor == 'mysql' \
+            else DEFAULT_UPSERT
+        return PAYLOADS_SQL.format(
+            payload=quote_name(self.model._meta.db_table),
+            values=values,
+            upsert=upsert.format(**columns),
+            **columns)
+
+
+class TransactionPayload(models.Model):
+
+    '''
+    Raw JSON from the Schema compressed by zlib.
+    Lives in separate table to keep transactions table small:
+    payloads are rarely read and never scanned.
+    '''
+
+    transaction = models.OneToOneField(
+        'Transaction', primary_key=True,
+        related_name='payload', verbose_name='Transaction')
+    data = models.BinaryField(verbose_name='Compressed JSON from schema')
+
+    objects = TransactionPayloadManager()
+
+    def to_json_bytes(self):
+        return zlib.decompress(bytes(self.data))
+
+    def to_base64(self):
+        '''
+        Represents payload same way as it was stored before compression
+        '''
+        return base64.b64encode(self.to_json_bytes()).decode('ascii')
@@ -3,17 +3,25 @@
 import datetime
 import decimal
 
+from django.apps import apps
 from django.db import models, \
     transaction, IntegrityError
 
-from card_issuing_excercise.settings import AUTHORISATION_OVERHEAD
+from card_issuing_excercise.settings import AUTHORISATION_OVERHEAD, \
+    AUTHORISATION_CONDITIONAL_DEBIT, AMOUNT_PRECISION_SETTINGS
 from card_issuing_excercise.apps.unique_id_generator.generator import \
     UniqueIDGenerator
-from card_issuing_excercise.apps.utils import dict_to_base64
+from card_issuing_excercise.apps.processing.models.transaction_payloads import \
+    TransactionPayload
+from card_issuing_excercise.apps.processing.models.transfers import Transfer
 
 
 TRANSACTION_ID_LENGTH = 9
 
+# smallest amount which can be stored in amount fields
+AMOUNT_QUANTUM = decimal.Decimal(1).scaleb(
+    -AMOUNT_PRECISION_SETTINGS['decimal_places'])
+
 # Transaction statuses
 
 TRANSACTION_AUTHORIZATION_STATUS = 'a'
@@ -23,6 +31,11 @@ TRANSACTION_PRESENTMANT_IS_TOO_LATE_STATUS = 't'
 TRANSACTION_ROLLBACKED_STATUS = 'r'
 TRANSACTION_LOAD_MONEY_STATUS = 'l'
 TRANSACTION_SETTLEMENT_STATUS = 's'
+# Reserved amount of authorisation is released by any of these
+TRANSACTION_RELEASED_STATUSES = (
+    TRANSACTION_ROLLBACKED_STATUS,
+    TRANSACTION_PRESENTMENT_STATUS,
+    TRANSACTION_PRESENTMANT_IS_TOO_LATE_STATUS)
 
 TRANSACTION_STATUS_CHOICES = (
     (TRANSACTION_AUTHORIZATION_STATUS, 'Authorization'),
@@ -77,22 +90,27 @@ class TransactionManager(models.Manager):
     Raises IssuerTransactionError with string error code on failure 
     '''
 
-    def try_authorise_transaction(self, code, amount, **accounts):
+    def try_authorise_transaction(self, code, amount,
+                                  conditional_debit=AUTHORISATION_CONDITIONAL_DEBIT,
+                                  **accounts):
         '''
         Tries to authorise transaction or logs it as declined because of money shortage.
-        Assume that form_account has already selected for update 
+        In conditional debit mode balance check and deduction are done
+        by one guarded UPDATE, so from_account doesn't need to be locked.
+        Otherwise assume that form_account has already selected for update 
         and therefore is robust to race conditions.
         '''
         from_account, to_account = self._validate_base_accounts(**accounts)
         amount_for_reserve = self.get_amount_for_reserve(amount)
+        statuses = self._get_statuses(code)
+        if TRANSACTION_AUTHORIZATION_STATUS in statuses:
+            raise IssuerTransactionError(TRANSACTION_ERROR_ALREADY_DONE)
+        if conditional_debit:
+            return self._authorise_with_conditional_debit(
+                code, amount_for_reserve, from_account, to_account, statuses)
         if from_account.amount < amount_for_reserve:
             # decline
-            try:
-                self.create(
-                    code=code, status=TRANSACTION_MONEY_SHORTAGE_STATUS)
-            # it is ok if transaction has already been processed
-            except IntegrityError:
-                pass
+            self._log_declined_transaction(code, statuses)
             raise IssuerTransactionError(
                 TRANSACTION_ERROR_NOT_ENOUGH_MONEY)
         try:
@@ -101,10 +119,54 @@ class TransactionManager(models.Manager):
                 to_account=to_account,
                 code=code, amount=amount_for_reserve,
                 status=TRANSACTION_AUTHORIZATION_STATUS)
-        except IntegrityError:  # transaction have already been processed
+        except IntegrityError:  # concurrent duplicate won the race
+            raise IssuerTransactionError(TRANSACTION_ERROR_ALREADY_DONE)
+
+    def _authorise_with_conditional_debit(self, code, amount,
+                                          from_account, to_account, statuses):
+        '''
+        Authorises transaction without holding row lock in advance:
+        "from" account is debited by UPDATE ... WHERE amount >= X
+        and affected rows count decides whether transaction is approved.
+        Accounts amounts are not refreshed in memory.
+        '''
+        # guard compares with stored amount and legs are stored rounded,
+        # so both are done with amount of stored precision
+        amount = decimal.Decimal(amount).quantize(AMOUNT_QUANTUM)
+        try:
+            with transaction.atomic(savepoint=False):
+                debited = from_account.debit_if_enough(amount)
+                if debited:
+                    issuer_transaction = self.create(
+                        code=code, status=TRANSACTION_AUTHORIZATION_STATUS)
+                    self.post_transfers(
+                        [(issuer_transaction, [(to_account.id, amount),
+                                               (from_account.id, -amount)])],
+                        debited_account_ids=[from_account.id])
+        except IntegrityError:  # concurrent duplicate won the race
             raise IssuerTransactionError(TRANSACTION_ERROR_ALREADY_DONE)
+        if not debited:
+            # nothing was written, so decline is logged on its own
+            self._log_declined_transaction(code, statuses)
+            raise IssuerTransactionError(TRANSACTION_ERROR_NOT_ENOUGH_MONEY)
+        return issuer_transaction
+
+    def _log_declined_transaction(self, code, statuses):
+        '''
+        Saves transaction declined because of money shortage.
+        Accepts statuses already saved for code to skip duplicates
+        '''
+        # it is ok if transaction has already been declined
+        if TRANSACTION_MONEY_SHORTAGE_STATUS in statuses:
+            return
+        try:
+            # declines are rare, so savepoint is cheap here
+            with transaction.atomic():
+                self.create(code=code,
+                            status=TRANSACTION_MONEY_SHORTAGE_STATUS)
+        except IntegrityError:
+            pass  # concurrent duplicate has already logged decline
 
-    @transaction.atomic  # too many atomics in prod -- bad for perfomance
     def present_transaction(self, code, billable_amount,
                             settlement_amount, **accounts):
         '''
@@ -116,12 +178,13 @@ class TransactionManager(models.Manager):
         - extra_account -
         account to which difference btw billable and settlement will be transfered
 
+        Saved statuses of code are read with lock before any writes,
+        so concurrent presentment or late rollback of the same code
+        waits for this one and sees its statuses.
+        Rollback and presentment are written in one transaction
+        without savepoints.
         Returns presented transaction, not rollbacked one.
         '''
-        # TODO: in real production all changes in account amounts should be bulked.
-        # It's better to bulk them on lower level, may be custom extention for connector,
-        # and let code on higher levels of abstractions call rollbacks and
-        # presentment methods one by one.
         billable_amount = decimal.Decimal(billable_amount)
         settlement_amount = decimal.Decimal(settlement_amount)
         from_account, to_account = self._validate_base_accounts(**accounts)
@@ -129,35 +192,41 @@ class TransactionManager(models.Manager):
         extra_account = accounts.get('extra_account')
         if billable_amount != settlement_amount and not extra_account:
             raise ValueError('Extra account needed')
+        # TODO: checks for transactions "sanity" should be placed here
+        # from_account should be equal from_account
+        presentment_legs = [(to_account.id, settlement_amount),
+                            (from_account.id, -settlement_amount)]
+        if amount_diff:
+            # Transfer amount difference to extra_account
+            presentment_legs += [(extra_account.id, amount_diff),
+                                 (from_account.id, -amount_diff)]
+        presntment_transaction = None
         try:
-            # TODO: checks for transactions "sanity" should be placed here
-            # from_account should be equal from_account
-            self._rollback(code)
-        except Transaction.DoesNotExist:
+            with transaction.atomic(savepoint=False):
+                statuses = self._get_statuses(code, for_update=True)
+                if TRANSACTION_AUTHORIZATION_STATUS in statuses and \
+                        not self._is_released(statuses):
+                    rollback_legs = self._get_rollback_legs(
+                        statuses[TRANSACTION_AUTHORIZATION_STATUS])
+                    rollback_transaction = self.create(
+                        code=code, status=TRANSACTION_ROLLBACKED_STATUS)
+                    presntment_transaction = self.create(
+                        code=code, status=TRANSACTION_PRESENTMENT_STATUS)
+                    # rollback and presentment are posted at once
+                    self.post_transfers([
+                        (rollback_transaction, rollback_legs),
+                        (presntment_transaction, presentment_legs)])
+        except IntegrityError:  # concurrent duplicate won the race
+            raise IssuerTransactionError(TRANSACTION_ERROR_ALREADY_DONE)
+        if TRANSACTION_AUTHORIZATION_STATUS not in statuses:
             # there was no authorisation transaction
             raise IssuerTransactionError(
                 TRANSACTION_ERROR_DOES_NOT_EXISTS)
-        except IntegrityError:
-            # transaction was already rollbacked
+        if presntment_transaction is None:
             # TODO: place for consistency checking
             # What if transactions was rollback, but was not presented?
             raise IssuerTransactionError(
                 TRANSACTION_ERROR_ALREADY_DONE)
-        try:
-            presntment_transaction = self._create_with_transfer(
-                from_account=from_account, to_account=to_account,
-                code=code, status=TRANSACTION_PRESENTMENT_STATUS,
-                amount=settlement_amount)
-        except IntegrityError:
-            # rollback was not done but presentment transaction was created
-            # TODO: should definetly go through consistency checking
-            raise IssuerTransactionError(TRANSACTION_ERROR_ALREADY_DONE)
-
-        if not amount_diff:
-            return presntment_transaction
-        # Transfer amount difference to extra_account
-        presntment_transaction.add_transfer(
-            from_account, extra_account, amount_diff)
         return presntment_transaction
 
     def rollback_late_presentment(self, code):
@@ -175,21 +244,41 @@ class TransactionManager(models.Manager):
         Logs day settlement as our inner transfers.
         Indempotent to multiple runs
         '''
+        return self.settle_day_transactions_from_shards(
+            {from_account.id: amount}, to_account)
+
+    def settle_day_transactions_from_shards(self, from_amounts, to_account):
+        '''
+        Logs day settlement from sharded account.
+        Accepts dict shard account id -> settled amount,
+        all shards are drained in one database transaction.
+        Indempotent to multiple runs
+        '''
         code = self.get_code_for_date_and_status(TRANSACTION_SETTLEMENT_STATUS)
+        settlement_transaction = self.filter(
+            code=code, status=TRANSACTION_SETTLEMENT_STATUS).first()
+        if settlement_transaction is not None:
+            return settlement_transaction
+        legs = [(to_account.id, sum(from_amounts.values()))] + [
+            (account_id, -amount)
+            for account_id, amount in sorted(from_amounts.items())]
         try:
-            return self._create_with_transfer(
-                from_account=from_account, amount=amount,
-                to_account=to_account, code=code,
-                status=TRANSACTION_SETTLEMENT_STATUS)
+            with transaction.atomic(savepoint=False):
+                settlement_transaction = self.create(
+                    code=code, status=TRANSACTION_SETTLEMENT_STATUS)
+                self.post_transfers([(settlement_transaction, legs)])
         except IntegrityError:
             return self.get(code=code,
                             status=TRANSACTION_SETTLEMENT_STATUS)
+        return settlement_transaction
 
-    def load_money(self, amount, from_account, to_account):
+    def load_money(self, amount, from_account, to_account, code=None):
         '''
-        Logs loading money as transfering some "external" account
+        Logs loading money as transfering some "external" account.
+        Code is generated if not specified
         '''
-        code = UniqueIDGenerator().get_new(length=TRANSACTION_ID_LENGTH)
+        if code is None:
+            code = UniqueIDGenerator().get_new(length=TRANSACTION_ID_LENGTH)
         return self._create_with_transfer(from_account=from_account,
                                           to_account=to_account, code=code,
                                           status=TRANSACTION_LOAD_MONEY_STATUS,
@@ -227,6 +316,82 @@ class TransactionManager(models.Manager):
             lambda code: completed_transaction_codes.get(code) is None,
             authorized_transactions_codes)
 
+    def post_transfers(self, postings, debited_account_ids=()):
+        '''
+        Posting engine: saves balanced transfers of one or more transactions.
+        Accepts list of (transaction, legs) pairs,
+        where legs are (account_id, amount) pairs.
+        Legs of every transaction should sum to zero.
+        Account amounts are modified by one CASE-based UPDATE first,
+        so accounts rows stay locked till commit and every transfer
+        gets balance of its account after it.
+        Transfers are stamped with posting time after rows are locked,
+        so time order of transfers of account is the order
+        their running balances are computed in.
+        All transfers are saved by one INSERT.
+        Amounts of "debited_account_ids" are considered already modified
+        (by conditional debit) and are not modified again.
+        Doesn't refresh accounts amounts in memory.
+        '''
+        transfers = []
+        amount_diffs = {}
+        for issuer_transaction, legs in postings:
+            self._validate_legs_are_balanced(issuer_transaction, legs)
+            for account_id, amount in legs:
+                amount = decimal.Decimal(amount)
+                transfers.append(Transfer(
+                    transaction=issuer_transaction,
+                    account_id=account_id,
+                    amount=amount))
+                amount_diffs[account_id] = \
+                    amount_diffs.get(account_id, 0) + amount
+        account_ids = list(amount_diffs)
+        for account_id in debited_account_ids:
+            amount_diffs.pop(account_id, None)
+        account_model = self._get_account_model()
+        account_model.objects.modify_amounts(amount_diffs)
+        # rows are locked by this transaction,
+        # so amounts include all transfers before these ones
+        balances = dict(account_model.objects.
+                        filter(id__in=account_ids).
+                        values_list('id', 'amount'))
+        posted_at = datetime.datetime.now()
+        for transfer in reversed(transfers):
+            transfer.created_at = posted_at
+            transfer.balance_after = balances[transfer.account_id]
+            balances[transfer.account_id] -= transfer.amount
+        Transfer.objects.bulk_create(transfers)
+
+    def bulk_update_descriptions(self, transactions_infos):
+        '''
+        Saves descriptions of many transactions at once:
+        human readable descriptions by one CASE-based UPDATE
+        and compressed payloads by one INSERT.
+        Accepts list of (transaction, info_in_json) pairs
+        '''
+        if not transactions_infos:
+            return
+        transactions_infos = sorted(
+            transactions_infos,
+            key=lambda transaction_info: transaction_info[0].id)
+        description_field = models.TextField()
+        self.filter(id__in=[
+            issuer_transaction.id
+            for issuer_transaction, _ in transactions_infos]).update(
+            human_readable_description=models.Case(
+                *[models.When(id=issuer_transaction.id,
+                              then=models.Value(
+                                  issuer_transaction.
+                                  generate_human_readable_description(
+                                      info_in_json=info_in_json),
+                                  output_field=description_field))
+                  for issuer_transaction, info_in_json in
+                  transactions_infos],
+                output_field=description_field))
+        TransactionPayload.objects.save_payloads({
+            issuer_transaction.id: info_in_json
+            for issuer_transaction, info_in_json in transactions_infos})
+
     def get_amount_for_reserve(self, amount):
         '''
         Calculates real ammount that have to be stored including overhead
@@ -246,7 +411,36 @@ class TransactionManager(models.Manager):
             raise ValueError('to_account is required')
         return from_account, to_account
 
-    @transaction.atomic  # can affect perfomance badly -- to long transaction
+    def _validate_legs_are_balanced(self, issuer_transaction, legs):
+        '''
+        Helper for checking the accounting equation for transaction legs
+        '''
+        if sum(decimal.Decimal(amount) for _, amount in legs):
+            raise ValueError(
+                'Transfers of transaction {} are not balanced'.format(
+                    issuer_transaction.code))
+
+    def _get_account_model(self):
+        '''
+        Helper for getting Account model.
+        Can't be imported directly: accounts depend on transactions
+        '''
+        return apps.get_model('processing', 'Account')
+
+    def _get_statuses(self, code, for_update=False):
+        '''
+        Returns dict with ids of transactions saved for code by their statuses.
+        Used for detecting duplicates on (code, status) before any writes.
+        Rows are locked till the end of transaction if for_update is set
+        '''
+        transactions = self.filter(code=code)
+        if for_update:
+            transactions = transactions.select_for_update()
+        return {
+            status: transaction_id
+            for transaction_id, status in
+            transactions.values_list('id', 'status')}
+
     def _create_with_transfer(self, *args, **kwargs):
         '''
         Extends basic create transaction functionality with modifying account balances 
@@ -262,30 +456,57 @@ class TransactionManager(models.Manager):
             raise ValueError('"amount" kwarg is required')
         for key in ['from_account', 'to_account', 'amount']:
             del kwargs[key]
-        with transaction.atomic():  # for correct Integrity error processing
+        with transaction.atomic(savepoint=False):
             issuer_transaction = self.create(*args, **kwargs)
-        issuer_transaction.add_transfer(from_account, to_account, amount)
+            self.post_transfers(
+                [(issuer_transaction, [(to_account.id, amount),
+                                       (from_account.id, -amount)])])
         return issuer_transaction
 
-    @transaction.atomic
     def _rollback(self, code, rollback_status=TRANSACTION_ROLLBACKED_STATUS):
         '''
-        Rollbacks existed authorisation transaction if it wasn't rollbacked already
+        Rollbacks existed authorisation transaction
+        if it wasn't rollbacked or presented already.
+        Saved statuses are read with lock same way as on presentment.
         Raises DoesNotExist for fake code, Type or ValueError for invalid code
         Raises IntegrityError on already rollbacked transaction.
         '''
-        authorization_transaction = self.get(
-            status=TRANSACTION_AUTHORIZATION_STATUS, code=code)
-        with transaction.atomic():
-            rollback_transaction = self.create(
-                code=code, status=rollback_status)
+        rollback_transaction = None
+        with transaction.atomic(savepoint=False):
+            statuses = self._get_statuses(code, for_update=True)
+            if TRANSACTION_AUTHORIZATION_STATUS in statuses and \
+                    not self._is_released(statuses):
+                rollback_legs = self._get_rollback_legs(
+                    statuses[TRANSACTION_AUTHORIZATION_STATUS])
+                rollback_transaction = self.create(
+                    code=code, status=rollback_status)
+                self.post_transfers([(rollback_transaction, rollback_legs)])
+        if TRANSACTION_AUTHORIZATION_STATUS not in statuses:
+            raise Transaction.DoesNotExist(
+                'No authorisation transaction for {}'.format(code))
+        if rollback_transaction is None:
+            raise IntegrityError(
+                'Transaction {} is already rollbacked'.format(code))
+        return rollback_transaction
+
+    def _is_released(self, statuses):
+        '''
+        Checks if reserved amount of authorisation is already released
+        '''
+        return any(status in statuses
+                   for status in TRANSACTION_RELEASED_STATUSES)
+
+    def _get_rollback_legs(self, authorization_transaction_id):
+        '''
+        Returns legs which reverse transfers of authorisation transaction
+        '''
         # Don't use select_for_update here as it is redundant:
         # Our authorisation system proved that account has enough money already
-        for transfer in authorization_transaction.transfers.\
-                select_related('account').all():
-            rollback_transaction.transfer_amount(
-                transfer.account, -transfer.amount)
-        return rollback_transaction
+        return [
+            (account_id, -amount)
+            for account_id, amount in Transfer.objects.filter(
+                transaction_id=authorization_transaction_id).
+            values_list('account_id', 'amount')]
 
 
 class Transaction(models.Model):
@@ -301,28 +522,23 @@ class Transaction(models.Model):
         verbose_name='Created at', auto_now_add=True)
     human_readable_description = models.TextField(
         verbose_name='Human readable description', null=True, blank=True)
-    base64_description = models.TextField(
-        verbose_name='JSON from schema in base64', null=True, blank=True)
+    # TODO: drop when all rows are converted by convert_transaction_payloads
+    legacy_base64_description = models.TextField(
+        verbose_name='JSON from schema in base64', null=True, blank=True,
+        db_column='base64_description')
     status = models.CharField(
         verbose_name='Status', max_length=1,
         choices=TRANSACTION_STATUS_CHOICES)
 
     objects = TransactionManager()
 
-    @transaction.atomic
     def add_transfer(self, from_account, to_account, amount):
         '''
         Transfers sum from one account to another in one database transaction
         '''
-        self.transfer_amount(to_account, amount)
-        self.transfer_amount(from_account, -amount)
-
-    def transfer_amount(self, account, amount):
-        '''
-        Helper for saving transfer for one participant
-        '''
-        account.modify_amount(amount)
-        self.transfers.create(account=account, amount=amount)
+        with transaction.atomic(savepoint=False):
+            Transaction.objects.post_transfers(
+                [(self, [(to_account.id, amount), (from_account.id, -amount)])])
 
     # Update descriptions logic
     # Was deleberately taken out form transaction generation
@@ -331,17 +547,28 @@ class Transaction(models.Model):
     def update_descriptions(self, info_in_json):
         '''
         Forms short description for user
-        And saves whole json in base64
+        And saves whole json compressed in separate table
         '''
         self.human_readable_description = \
             self.generate_human_readable_description(
                 info_in_json=info_in_json)
-        # TODO: can be non utf-8 encodings
-        # we should manage encoding according to our headers
-        self.base64_description = dict_to_base64(info_in_json)
-        update_fields = ['human_readable_description', 'base64_description']
         self.save(
-            update_fields=update_fields)
+            update_fields=['human_readable_description'])
+        TransactionPayload.objects.save_payloads({self.id: info_in_json})
+
+    @property
+    def base64_description(self):
+        '''
+        Whole json from the Schema in base64.
+        Old transactions store it in legacy column,
+        new ones -- in compressed payload which is loaded lazily
+        '''
+        if self.legacy_base64_description is not None:
+            return self.legacy_base64_description
+        try:
+            return self.payload.to_base64()
+        except TransactionPayload.DoesNotExist:
+            return None
 
     # TODO:
     def generate_human_readable_description(self, **kwargs):
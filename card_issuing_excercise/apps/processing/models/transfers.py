@@ -1,10 +1,149 @@
 '''Stores particular transafers'''
 
-from django.db import models
+from collections import OrderedDict
+
+from django.db import connection, models
 
 from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS
 
 
+# Copies creation time of transactions to their transfers
+BACKFILL_CREATED_AT_SQL = '''
+    UPDATE {transfer}
+    SET created_at = (
+        SELECT issuer_transaction.created_at
+        FROM {transaction} issuer_transaction
+        WHERE issuer_transaction.id = {transfer}.transaction_id)
+    WHERE id > %s AND id <= %s AND created_at IS NULL'''
+# Latest transfer of account at or before moment, one per lookup.
+# Lookups are joined by UNION ALL, so every one uses
+# account and creation time index on its own
+LATEST_TRANSFER_SQL = '''
+    SELECT %s, transfer.id, transfer.balance_after
+    FROM {transfer} transfer
+    WHERE transfer.id = (
+        SELECT latest.id
+        FROM {transfer} latest
+        WHERE latest.account_id = %s AND latest.created_at <= %s
+        ORDER BY latest.created_at DESC, latest.id DESC
+        LIMIT 1)'''
+# Number of lookups in one query (three parameters each)
+LATEST_TRANSFERS_CHUNK_SIZE = 300
+
+
+class TransferManager(models.Manager):
+
+    '''Transfers maintenance'''
+
+    def backfill_created_at(self, after_id, last_id):
+        '''
+        Copies creation time of transactions to transfers
+        with ids in (after_id, last_id] which don't have it yet.
+        Done by one UPDATE inside of database.
+        Returns number of updated transfers
+        '''
+        quote_name = connection.ops.quote_name
+        transaction_model = self.model._meta.get_field(
+            'transaction').related_model
+        with connection.cursor() as cursor:
+            cursor.execute(
+                BACKFILL_CREATED_AT_SQL.format(
+                    transfer=quote_name(self.model._meta.db_table),
+                    transaction=quote_name(
+                        transaction_model._meta.db_table)),
+                [after_id, last_id])
+            return cursor.rowcount
+
+    def get_latest_balances(self, lookups):
+        '''
+        Finds balances after the latest transfers
+        for many (account_id, moment) lookups
+        by one query per chunk of lookups.
+        Returns dict lookup index -> balance after the latest transfer
+        at or before moment. Balance is None if transfer doesn't have it,
+        lookups of accounts which didn't move till moment are missing
+        '''
+        transfer_table = connection.ops.quote_name(self.model._meta.db_table)
+        sql = LATEST_TRANSFER_SQL.format(transfer=transfer_table)
+        balance_field = self.model._meta.get_field('balance_after')
+        balances = {}
+        with connection.cursor() as cursor:
+            for chunk_start in range(
+                    0, len(lookups), LATEST_TRANSFERS_CHUNK_SIZE):
+                chunk = lookups[
+                    chunk_start:chunk_start + LATEST_TRANSFERS_CHUNK_SIZE]
+                params = []
+                for index, (account_id, date) in \
+                        enumerate(chunk, chunk_start):
+                    params += [index, account_id, date]
+                cursor.execute(
+                    ' UNION ALL '.join([sql] * len(chunk)), params)
+                for index, _, balance_after in cursor.fetchall():
+                    # raw cursor doesn't convert decimals on every backend
+                    balances[index] = balance_field.to_python(balance_after)
+        return balances
+
+    def get_transactions_page(self, transfers, size, position=None):
+        '''
+        Selects page of transactions by keyset over transfers of one account
+        ordered by created_at and id in descending order.
+        Accepts (created_at, id) of the last transfer of the previous page.
+        Transfers of one transaction are posted together,
+        so they are neighbours in this order and only the first one
+        adds transaction to page: transaction is never split btw pages.
+        Transfers are read by chunks till page is full.
+        Returns transactions with prefetched transfers of the same account,
+        position of the last transfer of the page
+        and whether next page exists
+        '''
+        transactions = OrderedDict()
+        account_id = None
+        has_next = False
+        chunk_size = size + 1
+        while not has_next:
+            chunk = transfers
+            if position is not None:
+                created_at, transfer_id = position
+                chunk = chunk.filter(
+                    models.Q(created_at__lt=created_at) |
+                    models.Q(created_at=created_at, id__lt=transfer_id))
+            chunk = list(chunk[:chunk_size])
+            for transfer in chunk:
+                if transfer.transaction_id not in transactions:
+                    if len(transactions) == size:
+                        # one more transaction tells that next page exists
+                        has_next = True
+                        break
+                    transactions[transfer.transaction_id] = \
+                        transfer.transaction
+                account_id = transfer.account_id
+                position = (transfer.created_at, transfer.id)
+            if len(chunk) < chunk_size:
+                break
+        transactions = list(transactions.values())
+        models.prefetch_related_objects(
+            transactions,
+            models.Prefetch('transfers',
+                            queryset=self.filter(account_id=account_id)))
+        return transactions, position, has_next
+
+    def set_balances_after(self, balances_after):
+        '''
+        Saves running balances of many transfers by one CASE-based UPDATE.
+        Accepts dict transfer_id -> balance after transfer
+        '''
+        if not balances_after:
+            return
+        amount_field = models.DecimalField(**AMOUNT_PRECISION_SETTINGS)
+        balance_cases = [
+            models.When(id=transfer_id,
+                        then=models.Value(balance, output_field=amount_field))
+            for transfer_id, balance in sorted(balances_after.items())]
+        self.filter(id__in=list(balances_after)).update(
+            balance_after=models.Case(
+                *balance_cases, output_field=amount_field))
+
+
 class Transfer(models.Model):
 
     '''
@@ -23,3 +162,26 @@ class Transfer(models.Model):
                                 verbose_name='Account')
     amount = models.DecimalField(
         verbose_name='Amount', default=0.0, **AMOUNT_PRECISION_SETTINGS)
+    # posting time, stamped while account row is locked
+    # (transaction creation time for transfers saved before):
+    # balances and history are filtered by account and time without join.
+    # Null only for transfers saved before the column was added.
+    # Indexed on its own for jobs which select transfers
+    # of all accounts by time range (day snapshots, checkpoints)
+    created_at = models.DateTimeField(
+        verbose_name='Created at', null=True, db_index=True)
+    # running balance of account after transfer:
+    # balance at point of time is balance after the latest transfer.
+    # Null for transfers saved before the column was added
+    balance_after = models.DecimalField(
+        verbose_name='Balance after', null=True, **AMOUNT_PRECISION_SETTINGS)
+
+    objects = TransferManager()
+
+    class Meta:
+        index_together = ('account', 'created_at')
+
+    def save(self, *args, **kwargs):
+        if self.created_at is None:
+            self.created_at = self.transaction.created_at
+        super(Transfer, self).save(*args, **kwargs)
@@ -1,4 +1,5 @@
 ''' Tests for transactions and accounts business logic'''
 
 from .functional import *
+from .stress import *
 from .units import *
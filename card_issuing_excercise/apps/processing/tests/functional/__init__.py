@@ -1,8 +1,15 @@
 '''Functional tests cases for processing app'''
 
 from .authorization_request_test_case import AuthorizationRequest
+from .batch_request_test_case import BatchRequest
 from .bulk_settle_test_case import BulkSettle
 from .cache_accounts_balance_test_case import CacheAccountsBalance
+from .card_locks_test_case import CardLocks
+from .deferred_descriptions_test_case import DeferredDescriptions
+from .idempotent_request_test_case import IdempotentRequest
 from .initialize_before_startup_test_case import InitializeBeforeStatup
+from .lean_request_test_case import LeanRequest
 from .load_money_test_case import LoadMoney
 from .presentment_request_test_case import PresentmentRequest
+from .save_balance_checkpoints_test_case import SaveBalanceCheckpoints
+from .stage_timings_test_case import StageTimingsCollection
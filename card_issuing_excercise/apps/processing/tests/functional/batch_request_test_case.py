@@ -0,0 +1,114 @@
+''' Tests Schema batch webhook'''
+
+import decimal
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction
+from card_issuing_excercise.apps.processing.views import SchemaBatchWebHook
+from card_issuing_excercise.apps.utils.tests import ShemaWebHookBaseTestCase
+
+
+class BatchRequest(ShemaWebHookBaseTestCase):
+
+    '''
+    Functional test for batch Schema webhook.
+    Checks per message ret codes and modification in database.
+    '''
+
+    def setUp(self):
+        self.user_account = self.create_account_with_amount()
+        self.poor_user_account = self.create_account()
+        self.arrange_amounts()
+
+    ##
+    # Helpers
+    ##
+
+    # Arrangements
+
+    def arrange_amounts(self):
+        self.base_amount = self.user_account.base_account.amount
+        self.transfer_amount = decimal.Decimal(0.5) * self.base_amount
+        self.real_transfer_amount = Transaction.objects.\
+            get_amount_for_reserve(self.transfer_amount)
+
+    # Shortcuts
+
+    def create_batch_by_request(self, messages):
+        '''
+        Helper for sending batch of messages using API
+        '''
+        request_factory = APIRequestFactory()
+        request = request_factory.post('/api/v1/request/batch/',
+                                       messages, format='json')
+        return SchemaBatchWebHook.as_view()(request)
+
+    def create_mixed_batch_by_request(self):
+        '''
+        Sends valid, not enough money and invalid user messages in one batch
+        '''
+        return self.create_batch_by_request([
+            self.create_schema_request(
+                card_id=self.user_account.card_id,
+                transaction_code='VALID',
+                amount=self.transfer_amount),
+            self.create_schema_request(
+                card_id=self.poor_user_account.card_id,
+                transaction_code='POOR',
+                amount=self.transfer_amount),
+            self.create_schema_request(
+                card_id='INVALID',
+                transaction_code='INVALID',
+                amount=self.transfer_amount)])
+
+    def get_statuses(self, response):
+        return [result['status'] for result in response.data]
+
+    ##
+    # Tests
+    ##
+
+    def test__mixed_batch__retcode(self):
+        response = self.create_mixed_batch_by_request()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test__mixed_batch__per_message_retcodes(self):
+        response = self.create_mixed_batch_by_request()
+        self.assertEqual(self.get_statuses(response), [
+            status.HTTP_200_OK,
+            status.HTTP_403_FORBIDDEN,
+            status.HTTP_406_NOT_ACCEPTABLE])
+
+    def test__mixed_batch__valid_message_amount_deducted(self):
+        self.create_mixed_batch_by_request()
+        self.check_account_result_amount(
+            self.user_account.base_account.id,
+            self.base_amount - self.real_transfer_amount)
+
+    def test__mixed_batch__declined_message_amount_not_modified(self):
+        self.create_mixed_batch_by_request()
+        self.check_account_result_amount(
+            self.poor_user_account.base_account.id, 0.0)
+
+    def test__duplicate_in_batch__second_message_conflicts(self):
+        # both messages fit into balance, so only duplicate check declines
+        message = self.create_schema_request(
+            card_id=self.user_account.card_id,
+            transaction_code='DUBLE',
+            amount=self.transfer_amount / 2)
+        response = self.create_batch_by_request([message, message])
+        self.assertEqual(self.get_statuses(response), [
+            status.HTTP_200_OK, status.HTTP_409_CONFLICT])
+
+    def test__invalid_message_in_batch__bad_request(self):
+        response = self.create_batch_by_request(['INVALID'])
+        self.assertEqual(self.get_statuses(response),
+                         [status.HTTP_400_BAD_REQUEST])
+
+    def test__not_array__bad_request(self):
+        response = self.create_batch_by_request(
+            self.create_schema_request(card_id=self.user_account.card_id))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
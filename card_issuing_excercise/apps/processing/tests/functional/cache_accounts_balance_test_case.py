@@ -1,23 +1,224 @@
 '''
-Stub for "cache_accounts_balance" management command test case
-Checks if command can be run only at specific time interval and saves
-proper balances for all presented accounts
+Tests "cache_accounts_balance" management command.
+Checks that reruns are safe and proper balances are saved
+for all presented accounts and requested days
 '''
 
+import datetime
+import decimal
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
 
+from card_issuing_excercise.apps.processing.models import Account, \
+    AccountDayLog
+from card_issuing_excercise.apps.processing.models.accounts_day_log import \
+    read_committed
+from card_issuing_excercise.apps.utils import to_start_day
+from card_issuing_excercise.apps.utils.tests import CreateAccountMixin, \
+    CreateTransactionMixin
+from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS
+
 
-class CacheAccountsBalance(TestCase):
+class CacheAccountsBalance(CreateAccountMixin,
+                           CreateTransactionMixin, TestCase):
 
     '''
-    Stub for "cache_accounts_balance" management command test case
+    Functional test for "cache_accounts_balance" management command
     '''
 
+    def setUp(self):
+        # today is cached right after midnight
+        commit_lag_patcher = self.patch_commit_lag(0)
+        commit_lag_patcher.start()
+        self.addCleanup(commit_lag_patcher.stop)
+        self.arrange_dates()
+        self.arrange_accounts()
+        self.arrange_transactions()
+
+    ##
+    # Helpers
+    ##
+
+    # Arrangements
+
+    def arrange_dates(self):
+        self.today = to_start_day(datetime.datetime.now())
+        self.yesterday = self.today - datetime.timedelta(days=1)
+        self.day_before_yesterday = self.yesterday - datetime.timedelta(days=1)
+
+    def arrange_accounts(self):
+        self.load_money_account = self.create_account()
+        self.user_account = self.create_account()
+        self.load_amount = decimal.Decimal(10)
+        self.reserve_amount = decimal.Decimal(3)
+
+    def arrange_transactions(self):
+        # money was loaded yesterday
+        self.create_transaction(
+            from_account=self.load_money_account.base_account,
+            to_account=self.user_account.base_account,
+            amount=self.load_amount,
+            created_at=self.yesterday + datetime.timedelta(hours=10))
+        # and reserved today
+        self.create_transaction(
+            from_account=self.user_account.base_account,
+            to_account=self.user_account.reserved_account,
+            amount=self.reserve_amount)
+
+    def patch_commit_lag(self, seconds):
+        return mock.patch(
+            'card_issuing_excercise.apps.processing.models.accounts_day_log.'
+            'BALANCE_SNAPSHOT_COMMIT_LAG', seconds)
+
+    def patch_mysql_connection(self):
+        '''
+        Replaces connection of snapshot module by MySQL one
+        which records executed statements
+        '''
+        mysql_connection = mock.MagicMock(
+            vendor='mysql', mysql_version=(5, 7, 20))
+        cursor = mysql_connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = ('REPEATABLE-READ',)
+        return mock.patch(
+            'card_issuing_excercise.apps.processing.models.accounts_day_log.'
+            'connection', mysql_connection)
+
+    def get_executed_statements(self, mysql_connection):
+        cursor = mysql_connection.cursor.return_value.__enter__.return_value
+        return [call[0] for call in cursor.execute.call_args_list]
+
+    # Shortcuts
+
+    def cache_balances(self, *args):
+        call_command('cache_accounts_balance', *args)
+
+    def check_day_log_amount(self, account, date, expected_amount):
+        day_log = AccountDayLog.objects.get(account=account, date=date.date())
+        self.assertAlmostEqual(
+            day_log.amount, decimal.Decimal(expected_amount),
+            places=AMOUNT_PRECISION_SETTINGS.get('decimal_places'))
+
+    ##
+    # Tests
+    ##
+
     def test__already_processed__fail_silently(self):
-        pass
+        self.cache_balances()
+        self.cache_balances()
+        self.assertEqual(
+            AccountDayLog.objects.filter(date=self.today.date()).count(),
+            Account.objects.count())
 
     def test__valid_run__all_balances_saved(self):
-        pass
+        self.cache_balances()
+        self.assertEqual(
+            set(AccountDayLog.objects.filter(date=self.today.date()).
+                values_list('account_id', flat=True)),
+            set(Account.objects.values_list('id', flat=True)))
 
     def test__valid_run__proper_balance_saved(self):
-        pass
+        self.cache_balances()
+        # today's reservation is not included
+        self.check_day_log_amount(
+            self.user_account.base_account, self.today, self.load_amount)
+        self.check_day_log_amount(
+            self.user_account.reserved_account, self.today, 0)
+
+    def test__rerun_after_changed_balance__balance_overwritten(self):
+        AccountDayLog.objects.create(
+            account=self.user_account.base_account,
+            date=self.today.date(), amount=1)
+        self.cache_balances()
+        self.check_day_log_amount(
+            self.user_account.base_account, self.today, self.load_amount)
+
+    def test__run_for_date__proper_balance_saved(self):
+        self.cache_balances(
+            '--date', self.yesterday.strftime('%Y-%m-%d'))
+        self.check_day_log_amount(
+            self.user_account.base_account, self.yesterday, 0)
+
+    def test__backfill__all_days_saved(self):
+        self.cache_balances(
+            '--backfill-from', self.day_before_yesterday.strftime('%Y-%m-%d'),
+            '--chunk-size', '1')
+        for date, expected_amount in [(self.day_before_yesterday, 0),
+                                      (self.yesterday, 0),
+                                      (self.today, self.load_amount)]:
+            self.check_day_log_amount(
+                self.user_account.base_account, date, expected_amount)
+
+    def test__incremental_run__moved_balance_saved(self):
+        self.cache_balances('--date', self.yesterday.strftime('%Y-%m-%d'))
+        self.cache_balances('--incremental')
+        self.check_day_log_amount(
+            self.user_account.base_account, self.today, self.load_amount)
+        self.check_day_log_amount(
+            self.load_money_account.base_account, self.today,
+            -self.load_amount)
+
+    def test__incremental_run__idle_balance_carried_forward(self):
+        idle_account = self.create_account()
+        Account.objects.filter(id=idle_account.base_account.id).\
+            update(amount=5)
+        self.cache_balances('--date', self.yesterday.strftime('%Y-%m-%d'))
+        self.cache_balances('--incremental')
+        self.check_day_log_amount(idle_account.base_account, self.today, 5)
+
+    def test__incremental_run_without_previous_day__full_balance_saved(self):
+        self.cache_balances('--incremental')
+        self.check_day_log_amount(
+            self.user_account.base_account, self.today, self.load_amount)
+
+    def test__incremental_run_skipping_idle__only_moved_balances_saved(self):
+        idle_account = self.create_account()
+        self.cache_balances('--date', self.yesterday.strftime('%Y-%m-%d'))
+        self.cache_balances('--incremental', '--skip-idle')
+        self.check_day_log_amount(
+            self.user_account.base_account, self.today, self.load_amount)
+        self.assertFalse(
+            AccountDayLog.objects.filter(
+                account=idle_account.base_account,
+                date=self.today.date()).exists())
+
+    def test__skip_idle_without_incremental__fail(self):
+        with self.assertRaises(CommandError):
+            self.cache_balances('--skip-idle')
+
+    def test__backfill_from_future__fail(self):
+        with self.assertRaises(CommandError):
+            self.cache_balances(
+                '--backfill-from',
+                (self.today + datetime.timedelta(days=1)).strftime('%Y-%m-%d'))
+
+    def test__day_with_uncommitted_transfers__fail(self):
+        # transfers made before today could be committed in 2 days
+        with self.patch_commit_lag(2 * 24 * 60 * 60):
+            with self.assertRaises(CommandError):
+                self.cache_balances('--date', self.today.strftime('%Y-%m-%d'))
+
+    def test__run_with_commit_lag__latest_committed_day_saved(self):
+        with self.patch_commit_lag(2 * 24 * 60 * 60):
+            self.cache_balances()
+        self.assertEqual(
+            set(AccountDayLog.objects.values_list('date', flat=True)),
+            {(datetime.datetime.now() - datetime.timedelta(days=2)).date()})
+
+    def test__mysql__snapshot_read_without_locks(self):
+        with self.patch_mysql_connection() as mysql_connection, \
+                read_committed():
+            statements = self.get_executed_statements(mysql_connection)
+        self.assertEqual(statements, [
+            ('SELECT @@SESSION.transaction_isolation',),
+            ('SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED',)])
+
+    def test__mysql__session_isolation_restored(self):
+        with self.patch_mysql_connection() as mysql_connection:
+            with read_committed():
+                pass
+            statements = self.get_executed_statements(mysql_connection)
+        self.assertEqual(statements[-1], (
+            'SET SESSION transaction_isolation = %s', ['REPEATABLE-READ']))
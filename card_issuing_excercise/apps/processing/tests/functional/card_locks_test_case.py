@@ -0,0 +1,96 @@
+''' Tests in-process card locks of Schema webhook'''
+
+import decimal
+import threading
+import time
+
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+
+from card_issuing_excercise.apps.processing.locks import CardLockManager
+from card_issuing_excercise.apps.processing.views import SchemaWebHook
+from card_issuing_excercise.apps.utils.tests import ShemaWebHookBaseTestCase
+
+
+class CardLocks(ShemaWebHookBaseTestCase):
+
+    '''
+    Functional test for per card striped locks and their metrics
+    '''
+
+    def setUp(self):
+        CardLockManager().reset_metrics()
+        self.user_account = self.create_account_with_amount()
+        self.stripe = CardLockManager().get_stripe(self.user_account.card_id)
+
+    ##
+    # Helpers
+    ##
+
+    def create_authorization_transaction_by_request(self):
+        request = APIRequestFactory().post(
+            '/api/v1/request/',
+            self.create_schema_request(
+                card_id=self.user_account.card_id,
+                amount=decimal.Decimal(0.5) *
+                self.user_account.base_account.amount),
+            format='json')
+        return SchemaWebHook.as_view(card_locks_enabled=True)(request)
+
+    def hold_card_lock(self, locked, seconds):
+        with CardLockManager().lock(self.user_account.card_id):
+            locked.set()
+            time.sleep(seconds)
+
+    def get_stripe_metrics(self):
+        return CardLockManager().get_metrics()[self.stripe]
+
+    def get_lock_metrics(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get('/api/v1/request/locks/')
+
+    ##
+    # Tests
+    ##
+
+    def test__same_card__same_stripe(self):
+        self.assertEqual(
+            CardLockManager().get_stripe(self.user_account.card_id),
+            self.stripe)
+
+    def test__locked_card__wait_recorded(self):
+        locked = threading.Event()
+        holder = threading.Thread(target=self.hold_card_lock,
+                                  args=(locked, 0.05))
+        holder.start()
+        locked.wait()
+        with CardLockManager().lock(self.user_account.card_id):
+            pass
+        holder.join()
+        metrics = self.get_stripe_metrics()
+        self.assertEqual(metrics.contended_acquisitions, 1)
+        self.assertGreater(metrics.max_wait, 0)
+
+    def test__request_with_card_locks__retcode(self):
+        response = self.create_authorization_transaction_by_request()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test__request_with_card_locks__acquisition_recorded(self):
+        self.create_authorization_transaction_by_request()
+        self.assertEqual(self.get_stripe_metrics().acquisitions, 1)
+
+    def test__get_lock_metrics_by_admin__acquired_stripes_returned(self):
+        self.create_authorization_transaction_by_request()
+        admin = self.create_user()
+        admin.is_staff = True
+        admin.save()
+        response = self.get_lock_metrics(admin)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['stripe'], self.stripe)
+        self.assertEqual(response.data[0]['acquisitions'], 1)
+
+    def test__get_lock_metrics_by_user__forbidden(self):
+        response = self.get_lock_metrics(self.create_user())
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,93 @@
+''' Tests saving transactions descriptions off the webhook critical path'''
+
+import decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from card_issuing_excercise.apps.processing.descriptions import \
+    DescriptionsWriter, \
+    DESCRIPTIONS_DEFERRED_MODE, \
+    DESCRIPTIONS_SYNC_MODE
+from card_issuing_excercise.apps.processing.models import \
+    Transaction, \
+    UserAccountsUnion
+from card_issuing_excercise.apps.processing.views import SchemaWebHook
+from card_issuing_excercise.apps.utils import dict_to_base64
+from card_issuing_excercise.apps.utils.tests import ShemaWebHookBaseTestCase
+
+
+class DeferredDescriptions(ShemaWebHookBaseTestCase):
+
+    '''
+    Functional test for deferred descriptions mode of Schema Webhook
+    and batch descriptions writer
+    '''
+
+    def setUp(self):
+        self.user_account = self.create_account_with_amount()
+        # balance is enough for both compared requests
+        self.transfer_amount = decimal.Decimal(0.25) * \
+            self.user_account.base_account.amount
+        self.transactions = [self.create_transaction() for _ in range(2)]
+        # card lookup is cached and shouldn't affect queries count
+        UserAccountsUnion.objects.get_card_accounts(self.user_account.card_id)
+
+    ##
+    # Helpers
+    ##
+
+    def create_authorization_transaction_by_request(
+            self, descriptions_mode, transaction_code='DEFERRED'):
+        request = APIRequestFactory().post(
+            '/api/v1/request/',
+            self.create_schema_request(
+                card_id=self.user_account.card_id,
+                transaction_code=transaction_code,
+                amount=self.transfer_amount),
+            format='json')
+        return SchemaWebHook.as_view(
+            descriptions_mode=descriptions_mode)(request)
+
+    def count_request_queries(self, descriptions_mode, transaction_code):
+        with CaptureQueriesContext(connection) as context:
+            response = self.create_authorization_transaction_by_request(
+                descriptions_mode, transaction_code)
+        # declined request doesn't save descriptions at all
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def write_descriptions(self):
+        DescriptionsWriter().write([
+            (transaction, {'transaction_id': transaction.code})
+            for transaction in self.transactions])
+
+    ##
+    # Tests
+    ##
+
+    def test__deferred_mode__descriptions_not_saved_in_request(self):
+        self.create_authorization_transaction_by_request(
+            DESCRIPTIONS_DEFERRED_MODE)
+        self.assertIsNone(
+            Transaction.objects.get(code='DEFERRED').base64_description)
+
+    def test__deferred_mode__no_descriptions_queries_in_request(self):
+        # sync mode updates description and inserts payload
+        self.assertEqual(
+            self.count_request_queries(DESCRIPTIONS_DEFERRED_MODE, 'DEFERRED'),
+            self.count_request_queries(DESCRIPTIONS_SYNC_MODE, 'SYNC') - 2)
+
+    def test__write_batch__one_update_and_one_insert(self):
+        with self.assertNumQueries(2):
+            self.write_descriptions()
+
+    def test__write_batch__all_descriptions_saved(self):
+        self.write_descriptions()
+        for transaction in self.transactions:
+            transaction.refresh_from_db()
+            self.assertEqual(
+                transaction.base64_description,
+                dict_to_base64({'transaction_id': transaction.code}))
@@ -0,0 +1,90 @@
+''' Tests answering Schema retries by remembered outcomes'''
+
+import decimal
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from card_issuing_excercise.apps.processing.idempotency import \
+    IdempotencyStore
+from card_issuing_excercise.apps.processing.models import Transaction
+from card_issuing_excercise.apps.processing.views import SchemaWebHook
+from card_issuing_excercise.apps.utils.tests import ShemaWebHookBaseTestCase
+
+
+class IdempotentRequest(ShemaWebHookBaseTestCase):
+
+    '''
+    Functional test for retried messages of Schema Webhook.
+    '''
+
+    def setUp(self):
+        self.user_account = self.create_account_with_amount()
+        self.transfer_amount = decimal.Decimal(0.5) * \
+            self.user_account.base_account.amount
+
+    ##
+    # Helpers
+    ##
+
+    def create_authorization_transaction_by_request(self, **kwargs):
+        '''
+        Helper for transaction creation using API
+        '''
+        schema_params = {
+            'amount': self.transfer_amount,
+            'card_id': self.user_account.card_id,
+            'transaction_code': 'RETRY'}
+        schema_params.update(kwargs)
+        request = APIRequestFactory().post(
+            '/api/v1/request/',
+            self.create_schema_request(**schema_params),
+            format='json')
+        return SchemaWebHook.as_view()(request)
+
+    ##
+    # Tests
+    ##
+
+    def test__retry_approved_message__approved_retcode(self):
+        self.create_authorization_transaction_by_request()
+        response = self.create_authorization_transaction_by_request()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test__retry_approved_message__amount_deducted_once(self):
+        base_amount = self.user_account.base_account.amount
+        self.create_authorization_transaction_by_request()
+        self.create_authorization_transaction_by_request()
+        self.check_account_result_amount(
+            self.user_account.base_account.id,
+            base_amount - Transaction.objects.get_amount_for_reserve(
+                self.transfer_amount))
+
+    def test__retry_duplicate_message__conflict_retcode(self):
+        self.create_authorization_transaction_by_request()
+        IdempotencyStore().backend.clear()
+        # duplicate is answered by database and its answer is remembered
+        self.create_authorization_transaction_by_request()
+        response = self.create_authorization_transaction_by_request()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test__retry_processed_message__no_queries(self):
+        self.create_authorization_transaction_by_request()
+        with self.assertNumQueries(0):
+            self.create_authorization_transaction_by_request()
+
+    def test__retry_with_other_payload__conflict_flagged(self):
+        self.create_authorization_transaction_by_request()
+        with self.assertLogs(
+                'card_issuing_excercise.apps.processing.idempotency',
+                level='WARNING'):
+            response = self.create_authorization_transaction_by_request(
+                amount=self.transfer_amount / 2)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test__retry_declined_message__processed_again(self):
+        self.create_authorization_transaction_by_request(
+            amount=3 * self.transfer_amount)
+        response = self.create_authorization_transaction_by_request(
+            amount=3 * self.transfer_amount)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,129 @@
+''' Tests lean WSGI pipeline for the Schema webhook'''
+
+import decimal
+
+from django.core.signals import request_started, request_finished
+from django.db import close_old_connections
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction
+from card_issuing_excercise.apps.processing.serializers import \
+    SchemaRequestSerializer
+from card_issuing_excercise.apps.processing.validators import \
+    CompiledSchemaRequestValidator
+from card_issuing_excercise.apps.processing.wsgi import \
+    SchemaWebHookApplication
+from card_issuing_excercise.apps.utils.tests import ShemaWebHookBaseTestCase
+
+
+class LeanRequest(ShemaWebHookBaseTestCase):
+
+    '''
+    Functional test for lean Schema Webhook pipeline.
+    Checks ret codes, modification in database
+    and that compiled validator matches serializer
+    '''
+
+    def setUp(self):
+        # same as django test client does:
+        # connections should not be closed inside of test transaction
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        self.user_account = self.create_account_with_amount()
+        self.base_amount = self.user_account.base_account.amount
+        self.transfer_amount = decimal.Decimal(0.5) * self.base_amount
+
+    ##
+    # Helpers
+    ##
+
+    def create_transaction_by_lean_request(self, data, **kwargs):
+        '''
+        Calls lean application with WSGI environ of POST request.
+        Returns status code
+        '''
+        environ = APIRequestFactory().post(
+            SchemaWebHookApplication.PATH, data, **kwargs).environ
+        statuses = []
+        application = SchemaWebHookApplication(None)
+        application(environ,
+                    lambda status, headers: statuses.append(status))
+        return int(statuses[0].split()[0])
+
+    def create_authorization_schema_request(self, **kwargs):
+        schema_params = {
+            'amount': self.transfer_amount,
+            'card_id': self.user_account.card_id}
+        schema_params.update(kwargs)
+        return self.create_schema_request(**schema_params)
+
+    def get_serializer_data(self, message):
+        serializer = SchemaRequestSerializer(data=message)
+        if not serializer.is_valid():
+            return None
+        return dict(serializer.data)
+
+    def get_validator_data(self, message):
+        data = CompiledSchemaRequestValidator().validate(message)
+        if data is None:
+            return None
+        return dict(data)
+
+    ##
+    # Tests
+    ##
+
+    def test__valid_transaction__retcode(self):
+        self.assertEqual(
+            self.create_transaction_by_lean_request(
+                self.create_authorization_schema_request(), format='json'),
+            status.HTTP_200_OK)
+
+    def test__valid_transaction__base_amount_deducted(self):
+        self.create_transaction_by_lean_request(
+            self.create_authorization_schema_request(), format='json')
+        self.check_account_result_amount(
+            self.user_account.base_account.id,
+            self.base_amount -
+            Transaction.objects.get_amount_for_reserve(self.transfer_amount))
+
+    def test__invalid_format__retcode(self):
+        self.assertEqual(
+            self.create_transaction_by_lean_request(
+                self.create_authorization_schema_request(
+                    transaction_code='TOOLONGTRANSACTION'),
+                format='json'),
+            status.HTTP_400_BAD_REQUEST)
+
+    def test__not_json__retcode(self):
+        self.assertEqual(
+            self.create_transaction_by_lean_request(
+                'card_id=TEST', content_type='text/plain'),
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test__validator_matches_serializer(self):
+        valid_message = self.create_authorization_schema_request()
+        messages = [
+            valid_message,
+            dict(valid_message, billing_amount='12.3'),
+            dict(valid_message, billing_amount=12.5),
+            dict(valid_message, billing_amount='1.23456'),
+            dict(valid_message, billing_amount='123456789012345.1'),
+            dict(valid_message, billing_amount='NaN'),
+            dict(valid_message, billing_amount='abc'),
+            dict(valid_message, settlement_amount='1.5',
+                 settlement_currency='USD'),
+            dict(valid_message, settlement_amount=None),
+            dict(valid_message, transaction_id=' TRIMMED '),
+            dict(valid_message, transaction_id='TOOLONGTRANSACTION'),
+            dict(valid_message, card_id=''),
+            {key: value for key, value in valid_message.items()
+             if key != 'type'},
+            []]
+        for message in messages:
+            self.assertEqual(self.get_validator_data(message),
+                             self.get_serializer_data(message))
@@ -0,0 +1,173 @@
+'''
+Tests "save_balance_checkpoints" management command.
+Checks that only accounts moved during interval get checkpoints
+and proper balances are saved
+'''
+
+import datetime
+import decimal
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from card_issuing_excercise.apps.processing.models import AccountCheckpoint
+from card_issuing_excercise.apps.processing.models.accounts_checkpoint \
+    import get_checkpoint_at
+from card_issuing_excercise.apps.processing.models.accounts_day_log import \
+    read_committed
+from card_issuing_excercise.apps.utils import datetime_to_timestamp, \
+    to_start_day
+from card_issuing_excercise.apps.utils.tests import CreateAccountMixin, \
+    CreateTransactionMixin
+from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS
+
+
+class SaveBalanceCheckpoints(CreateAccountMixin,
+                             CreateTransactionMixin, TestCase):
+
+    '''
+    Functional test for "save_balance_checkpoints" management command
+    with hourly checkpoints
+    '''
+
+    def setUp(self):
+        self.arrange_dates()
+        self.arrange_accounts()
+        self.arrange_transactions()
+
+    ##
+    # Helpers
+    ##
+
+    # Arrangements
+
+    def arrange_dates(self):
+        self.yesterday = to_start_day(datetime.datetime.now()) - \
+            datetime.timedelta(days=1)
+        self.checkpoint_at = self.yesterday + datetime.timedelta(hours=11)
+
+    def arrange_accounts(self):
+        self.load_money_account = self.create_account()
+        self.user_account = self.create_account(self.yesterday)
+        self.idle_account = self.create_account()
+        self.load_amount = decimal.Decimal(10)
+        self.reserve_amount = decimal.Decimal(3)
+
+    def arrange_transactions(self):
+        # money was loaded during interval before checkpoint
+        self.create_transaction(
+            from_account=self.load_money_account.base_account,
+            to_account=self.user_account.base_account,
+            amount=self.load_amount,
+            created_at=self.checkpoint_at - datetime.timedelta(minutes=30))
+        # and reserved after checkpoint
+        self.create_transaction(
+            from_account=self.user_account.base_account,
+            to_account=self.user_account.reserved_account,
+            amount=self.reserve_amount,
+            created_at=self.checkpoint_at + datetime.timedelta(minutes=30))
+
+    def patch_commit_lag(self, seconds):
+        return mock.patch(
+            'card_issuing_excercise.apps.processing.models.accounts_day_log.'
+            'BALANCE_SNAPSHOT_COMMIT_LAG', seconds)
+
+    # Shortcuts
+
+    def save_checkpoints(self, *args):
+        call_command('save_balance_checkpoints', *args)
+
+    def save_checkpoint_at(self, checkpoint_at):
+        self.save_checkpoints(
+            '--at', checkpoint_at.strftime('%Y-%m-%d %H:%M'))
+
+    def check_checkpoint_amount(self, account, expected_amount):
+        checkpoint = AccountCheckpoint.objects.get(
+            account=account, created_at=self.checkpoint_at)
+        self.assertAlmostEqual(
+            checkpoint.amount, decimal.Decimal(expected_amount),
+            places=AMOUNT_PRECISION_SETTINGS.get('decimal_places'))
+
+    ##
+    # Tests
+    ##
+
+    def test__valid_run__accounts_read_without_locks(self):
+        with mock.patch(
+                'card_issuing_excercise.apps.processing.models.'
+                'accounts_checkpoint.read_committed',
+                wraps=read_committed) as read_committed_mock:
+            self.save_checkpoint_at(self.checkpoint_at)
+        read_committed_mock.assert_called_once_with()
+
+    def test__valid_run__moved_accounts_saved(self):
+        self.save_checkpoint_at(self.checkpoint_at)
+        self.assertEqual(
+            set(AccountCheckpoint.objects.values_list('account_id', flat=True)),
+            {self.load_money_account.base_account.id,
+             self.user_account.base_account.id})
+
+    def test__valid_run__proper_balance_saved(self):
+        self.save_checkpoint_at(self.checkpoint_at)
+        # reservation after checkpoint is not included
+        self.check_checkpoint_amount(
+            self.user_account.base_account, self.load_amount)
+
+    def test__run_inside_of_interval__aligned_to_checkpoint(self):
+        self.save_checkpoint_at(
+            self.checkpoint_at + datetime.timedelta(minutes=15))
+        self.check_checkpoint_amount(
+            self.user_account.base_account, self.load_amount)
+
+    def test__rerun__fail_silently(self):
+        self.save_checkpoint_at(self.checkpoint_at)
+        self.save_checkpoint_at(self.checkpoint_at)
+        self.assertEqual(AccountCheckpoint.objects.count(), 2)
+
+    def test__catch_up_run__all_intervals_saved(self):
+        self.save_checkpoints(
+            '--at', (self.checkpoint_at + datetime.timedelta(hours=1)).
+            strftime('%Y-%m-%d %H:%M'),
+            '--intervals', '2')
+        # reservation was made during second interval
+        self.assertEqual(
+            set(AccountCheckpoint.objects.
+                filter(account=self.user_account.reserved_account).
+                values_list('created_at', flat=True)),
+            {self.checkpoint_at + datetime.timedelta(hours=1)})
+        self.check_checkpoint_amount(
+            self.user_account.base_account, self.load_amount)
+
+    def test__invalid_moment__fail(self):
+        with self.assertRaises(CommandError):
+            self.save_checkpoints('--at', 'yesterday')
+
+    def test__checkpoint_with_uncommitted_transfers__fail(self):
+        # transfers of the last two hours are in flight
+        with self.patch_commit_lag(2 * 60 * 60), \
+                self.assertRaises(CommandError):
+            self.save_checkpoint_at(datetime.datetime.now())
+
+    def test__default_run__in_flight_transfer_not_missed(self):
+        last_checkpoint_at = get_checkpoint_at(datetime.datetime.now())
+        # transfers of the last minute before checkpoint are in flight
+        commit_lag = (datetime.datetime.now() - last_checkpoint_at).\
+            total_seconds() + 60
+        with self.patch_commit_lag(commit_lag):
+            self.save_checkpoints()
+        # in flight transfer is committed after run
+        self.create_transaction(
+            from_account=self.load_money_account.base_account,
+            to_account=self.user_account.base_account,
+            amount=1,
+            created_at=last_checkpoint_at - datetime.timedelta(seconds=30))
+        self.assertFalse(
+            AccountCheckpoint.objects.filter(
+                created_at__gte=last_checkpoint_at).exists())
+        total_amount, _ = self.user_account.get_amounts_for_ts(
+            datetime_to_timestamp(last_checkpoint_at))
+        self.assertAlmostEqual(
+            total_amount, self.load_amount + 1,
+            places=AMOUNT_PRECISION_SETTINGS.get('decimal_places'))
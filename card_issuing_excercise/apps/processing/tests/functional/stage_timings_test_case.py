@@ -0,0 +1,98 @@
+''' Tests per stage timings of Schema webhook'''
+
+import decimal
+
+from django.db import connection
+
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+
+from card_issuing_excercise.apps.processing.timings import StageTimings, \
+    TOTAL_STAGE
+from card_issuing_excercise.apps.processing.models import Account
+from card_issuing_excercise.apps.processing.views import SchemaWebHook
+from card_issuing_excercise.apps.utils.tests import ShemaWebHookBaseTestCase
+
+
+class StageTimingsCollection(ShemaWebHookBaseTestCase):
+
+    '''
+    Functional test for stage timings collection and internal endpoint
+    '''
+
+    def setUp(self):
+        StageTimings().reset()
+        self.user_account = self.create_account_with_amount()
+
+    ##
+    # Helpers
+    ##
+
+    def create_authorization_transaction_by_request(self, timings_enabled):
+        request = APIRequestFactory().post(
+            '/api/v1/request/',
+            self.create_schema_request(
+                card_id=self.user_account.card_id,
+                amount=decimal.Decimal(0.5) *
+                self.user_account.base_account.amount),
+            format='json')
+        return SchemaWebHook.as_view(
+            stage_timings_enabled=timings_enabled)(request)
+
+    def get_stats_by_stage(self):
+        return {
+            (stage_stats.message_type, stage_stats.stage): stage_stats
+            for stage_stats in StageTimings().get_stats()}
+
+    def get_timings(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get('/api/v1/request/timings/')
+
+    ##
+    # Tests
+    ##
+
+    def test__timings_disabled__nothing_collected(self):
+        self.create_authorization_transaction_by_request(False)
+        self.assertEqual(StageTimings().get_stats(), [])
+
+    def test__timings_enabled__all_stages_collected(self):
+        self.create_authorization_transaction_by_request(True)
+        self.assertEqual(
+            set(self.get_stats_by_stage().keys()),
+            {('authorization', stage) for stage in [
+                TOTAL_STAGE, 'validation', 'fraud_check', 'conversion',
+                'card_lookup', 'transaction', 'descriptions']})
+
+    def test__timings_enabled__transaction_queries_counted(self):
+        self.create_authorization_transaction_by_request(True)
+        stage_stats = self.get_stats_by_stage().get(
+            ('authorization', 'transaction'))
+        self.assertEqual(stage_stats.count, 1)
+        self.assertGreater(stage_stats.queries_p50, 0)
+
+    def test__timed_request__queries_counted_without_debug_cursor(self):
+        timings = StageTimings()
+        with timings.request('authorization'):
+            self.assertFalse(connection.queries_logged)
+            with timings.stage('card_lookup'):
+                Account.objects.count()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+        stage_stats = self.get_stats_by_stage().get(
+            ('authorization', 'card_lookup'))
+        self.assertEqual(stage_stats.queries_total, 2)
+
+    def test__get_timings_by_admin__stats_returned(self):
+        self.create_authorization_transaction_by_request(True)
+        admin = self.create_user()
+        admin.is_staff = True
+        admin.save()
+        response = self.get_timings(admin)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 7)
+
+    def test__get_timings_by_user__forbidden(self):
+        response = self.get_timings(self.create_user())
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
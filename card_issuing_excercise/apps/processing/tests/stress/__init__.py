@@ -0,0 +1,3 @@
+'''Stress tests for money movement under concurrency'''
+
+from .money_movement_stress_test_case import MoneyMovementStress
@@ -0,0 +1,239 @@
+''' Stress tests concurrent money movement on the same cards'''
+
+from collections import Counter
+import decimal
+import os
+import random
+import string
+import threading
+import time
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import TransactionTestCase
+
+from card_issuing_excercise.apps.processing.caches import \
+    SpecialAccountsRegistry
+from card_issuing_excercise.apps.processing.models import Account, \
+    Transaction, \
+    UserAccountsUnion
+from card_issuing_excercise.apps.processing.models.accounts import \
+    BASIC_ACCOUNT_TYPE, \
+    RESERVED_ACCOUNT_TYPE, \
+    REAL_USER_ACCOUNT_ROLE
+from card_issuing_excercise.apps.processing.models.transactions import \
+    IssuerTransactionError, \
+    TRANSACTION_ID_LENGTH, \
+    TRANSACTION_PRESENTMENT_STATUS, \
+    TRANSACTION_PRESENTMANT_IS_TOO_LATE_STATUS
+from card_issuing_excercise.apps.processing.models.transfers import Transfer
+from card_issuing_excercise.apps.utils.tests import CreateAccountMixin
+from card_issuing_excercise.settings import AMOUNT_PRECISION_SETTINGS
+
+
+# Stress suite is slow and needs database with row locks
+# (not sqlite), so it is run only if STRESS_TESTS is set
+STRESS_TESTS = bool(os.environ.get('STRESS_TESTS'))
+# Parameters of stress run
+STRESS_THREADS = int(os.environ.get('STRESS_THREADS', 4))
+STRESS_DURATION = float(os.environ.get('STRESS_DURATION', 2))
+STRESS_CARDS = int(os.environ.get('STRESS_CARDS', 2))
+
+CARD_LOAD_AMOUNT = decimal.Decimal(100)
+
+
+def get_random_code(random_generator):
+    return ''.join(
+        random_generator.choice(string.ascii_uppercase + string.digits)
+        for _ in range(TRANSACTION_ID_LENGTH))
+
+
+@skipUnless(STRESS_TESTS, 'Set STRESS_TESTS=1 to run stress suite')
+class MoneyMovementStress(CreateAccountMixin, TransactionTestCase):
+
+    '''
+    Fires authorizations, presentments, their duplicates
+    and late presentment rollbacks at the same cards from many threads,
+    every thread with its own database connection.
+    Checks money invariants afterwards.
+    Number of threads, duration in seconds and number of cards are taken
+    from STRESS_THREADS, STRESS_DURATION and STRESS_CARDS
+    environment variables. Suite is run only if STRESS_TESTS is set
+    '''
+
+    def setUp(self):
+        SpecialAccountsRegistry().clear()
+        self.settlement_account = self.create_settlement_account()
+        self.load_money_account = \
+            UserAccountsUnion.objects.create_external_load_money_account()
+        self.cards = [self.create_card() for _ in range(STRESS_CARDS)]
+        # codes are shared by threads to make them race on same transactions
+        self.codes = []
+        self.codes_lock = threading.Lock()
+        # operations which have written something
+        self.succeeded = Counter()
+        self.errors = []
+
+    def tearDown(self):
+        SpecialAccountsRegistry().clear()
+
+    ##
+    # Helpers
+    ##
+
+    def create_card(self):
+        '''
+        Creates card with money loaded by transfer,
+        so account amounts match transfers from the start
+        '''
+        user_account = self.create_account()
+        Transaction.objects.load_money(
+            CARD_LOAD_AMOUNT,
+            self.load_money_account.base_account,
+            user_account.base_account,
+            code=get_random_code(random))
+        return user_account
+
+    def run_stress(self):
+        deadline = time.monotonic() + STRESS_DURATION
+        threads = [
+            threading.Thread(target=self.run_worker, args=(deadline, seed))
+            for seed in range(STRESS_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_worker(self, deadline, seed):
+        random_generator = random.Random(seed)
+        try:
+            while time.monotonic() < deadline:
+                self.fire_random_operation(random_generator)
+        finally:
+            connection.close()
+
+    def fire_random_operation(self, random_generator):
+        '''
+        Fires one random operation.
+        Expected business errors are ignored, others are collected
+        '''
+        known_code = self.get_known_code(random_generator)
+        choice = random_generator.random()
+        if known_code is None or choice < 0.4:
+            operation = 'authorization'
+            known_code = (
+                get_random_code(random_generator),
+                decimal.Decimal(random_generator.randint(1, 10)),
+                random_generator.choice(self.cards))
+            # other threads can present code before it is authorised
+            with self.codes_lock:
+                self.codes.append(known_code)
+        elif choice < 0.55:
+            operation = 'duplicate_authorization'
+        elif choice < 0.9:
+            operation = 'presentment'
+        else:
+            operation = 'late_presentment_rollback'
+        code, amount, card = known_code
+        try:
+            result = self.fire_operation(operation, code, amount, card)
+        except (IssuerTransactionError, Transaction.DoesNotExist):
+            pass
+        except Exception as err:
+            with self.codes_lock:
+                self.errors.append((operation, code, repr(err)))
+        else:
+            # late rollback returns nothing if code is already released
+            if result is not None:
+                with self.codes_lock:
+                    self.succeeded[operation] += 1
+
+    def get_known_code(self, random_generator):
+        '''
+        Returns random (code, amount, card) of sent authorizations
+        '''
+        with self.codes_lock:
+            if not self.codes:
+                return None
+            return random_generator.choice(self.codes)
+
+    def fire_operation(self, operation, code, amount, card):
+        '''
+        Fires operation and returns created transaction
+        '''
+        if operation in ('authorization', 'duplicate_authorization'):
+            return Transaction.objects.try_authorise_transaction(
+                code, amount,
+                from_account=Account.objects.get_reference(
+                    card.base_account.id),
+                to_account=Account.objects.get_reference(
+                    card.reserved_account.id))
+        elif operation == 'presentment':
+            return Transaction.objects.present_transaction(
+                code, amount, amount,
+                from_account=Account.objects.get_reference(
+                    card.base_account.id),
+                to_account=Account.objects.get_reference(
+                    self.settlement_account.base_account.id))
+        else:
+            return Transaction.objects.rollback_late_presentment(code)
+
+    ##
+    # Tests
+    ##
+
+    def test__concurrent_money_movement__invariants_hold(self):
+        self.run_stress()
+        self.assertEqual(self.errors, [])
+        # account amount equals sum of its transfers
+        transfers_totals = dict(
+            Transfer.objects.values('account_id').
+            annotate(total=Sum('amount')).
+            values_list('account_id', 'total'))
+        for account_id, amount in \
+                Account.objects.values_list('id', 'amount'):
+            self.assertAlmostEqual(
+                amount, transfers_totals.get(account_id, 0),
+                places=AMOUNT_PRECISION_SETTINGS.get('decimal_places'))
+        # transfers of every transaction are balanced
+        self.assertEqual(
+            list(Transfer.objects.values('transaction_id').
+                 annotate(total=Sum('amount')).
+                 exclude(total=0).
+                 values_list('transaction_id', flat=True)),
+            [])
+        # cardholders never spend more than they have
+        self.assertFalse(
+            Account.objects.filter(
+                account_type=BASIC_ACCOUNT_TYPE,
+                user_account__role=REAL_USER_ACCOUNT_ROLE,
+                amount__lt=0).exists())
+        # reserved amounts are never released twice:
+        # running balances of reserved accounts never go negative
+        self.assertFalse(
+            Account.objects.filter(
+                account_type=RESERVED_ACCOUNT_TYPE,
+                amount__lt=0).exists())
+        self.assertFalse(
+            Transfer.objects.filter(
+                account__account_type=RESERVED_ACCOUNT_TYPE,
+                balance_after__lt=0).exists())
+        # every transaction is presented at most once
+        self.assertEqual(
+            list(Transaction.objects.
+                 filter(status=TRANSACTION_PRESENTMENT_STATUS).
+                 values('code').
+                 annotate(presentments=Count('id')).
+                 filter(presentments__gt=1).
+                 values_list('code', flat=True)),
+            [])
+        # all successful presentments and late rollbacks are saved
+        self.assertEqual(
+            Transaction.objects.filter(
+                status=TRANSACTION_PRESENTMENT_STATUS).count(),
+            self.succeeded['presentment'])
+        self.assertEqual(
+            Transaction.objects.filter(
+                status=TRANSACTION_PRESENTMANT_IS_TOO_LATE_STATUS).count(),
+            self.succeeded['late_presentment_rollback'])
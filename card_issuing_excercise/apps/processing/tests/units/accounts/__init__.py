@@ -3,3 +3,6 @@
 from .create_account_test_case import CreateNewAccount
 from .get_account_test_case import GetAccount
 from .get_balance_test_case import GetUserBalance
+from .get_card_accounts_test_case import GetCardAccounts
+from .pinned_special_accounts_test_case import PinnedSpecialAccounts
+from .sharded_special_accounts_test_case import ShardedSpecialAccounts
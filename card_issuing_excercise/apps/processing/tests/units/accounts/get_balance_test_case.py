@@ -1,9 +1,12 @@
 '''Tests user balance getter in different time points'''
 
 import datetime
+from unittest import mock
 
 from django.test import TestCase
 
+from card_issuing_excercise.apps.processing.balance_metrics import \
+    RollForwardMetrics
 from card_issuing_excercise.apps.processing.models.accounts import \
     BASIC_ACCOUNT_TYPE, \
     REVENUE_ACCOUNT_ROLE
@@ -124,6 +127,22 @@ class GetUserBalance(CreateAccountMixin,
             filter(account_type=acc_type).\
             update(amount=amount)
 
+    def replace_yesterday_logs_with_day_before(self):
+        '''
+        Leaves gap in day snapshots: yesterday is missing.
+        Day before yesterday snapshot differs from zero,
+        so lookups which ignore it are caught
+        '''
+        self.base_account.account_logs.all().delete()
+        self.reserved_account.account_logs.all().delete()
+        self.base_account.account_logs.create(
+            date=self.day_before_yesterday.date(), amount=1)
+
+    def disable_roll_forward_cap(self):
+        return mock.patch(
+            'card_issuing_excercise.apps.processing.models.accounts.'
+            'BALANCE_ROLL_FORWARD_MAX_DAYS', 0)
+
     def get_day_before(self, date):
         '''
         Get day before date in args 
@@ -191,3 +210,48 @@ class GetUserBalance(CreateAccountMixin,
         amount_tuple = self.get_past_amount_for_first_day()
         self.assertEqual(
             self.get_available_amount(amount_tuple), 12.5)
+
+    def test__get_past_amount_with_missing_snapshot__nearest_snapshot_used(self):
+        self.replace_yesterday_logs_with_day_before()
+        amount_tuple = self.get_past_amount_for_second_day()
+        self.assertEqual(
+            self.get_available_amount(amount_tuple), 11.0)
+        self.assertEqual(
+            self.get_total_amount(amount_tuple), 16.0)
+
+    def test__get_past_amount_with_checkpoint__checkpoint_used(self):
+        # checkpoint after second day transaction differs from logs,
+        # so lookups which ignore it are caught
+        self.base_account.account_checkpoints.create(
+            created_at=self.yesterday + datetime.timedelta(hours=1, minutes=30),
+            amount=20)
+        amount_tuple = self.get_past_amount_for_second_day()
+        self.assertEqual(
+            self.get_available_amount(amount_tuple), 20.0)
+        self.assertEqual(
+            self.get_total_amount(amount_tuple), 25.0)
+
+    def test__get_past_amount_over_cap__metric_counted(self):
+        RollForwardMetrics().reset()
+        with self.disable_roll_forward_cap():
+            amount_tuple = self.get_past_amount_for_second_day()
+        self.assertEqual(
+            self.get_available_amount(amount_tuple), 10.0)
+        stats = RollForwardMetrics().get_stats()
+        # basic and reserved accounts
+        self.assertEqual(stats.lookups, 2)
+        self.assertEqual(stats.cap_exceeded, 2)
+
+    def test__get_recent_amount_over_cap__rolled_back_from_current(self):
+        now = datetime.datetime.now()
+        self.add_transfer(transaction_code='A3TEST',
+                          status=TRANSACTION_AUTHORIZATION_STATUS,
+                          account=self.base_account,
+                          amount=-1,
+                          datetime=now - datetime.timedelta(seconds=30))
+        with self.disable_roll_forward_cap():
+            amount_tuple = self.user_account.get_amounts_for_ts(
+                datetime_to_timestamp(now - datetime.timedelta(minutes=1)))
+        # current amount is 10, transfer after point of time is rolled back
+        self.assertEqual(
+            self.get_available_amount(amount_tuple), 11.0)
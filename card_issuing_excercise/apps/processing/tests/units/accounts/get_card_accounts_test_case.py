@@ -0,0 +1,75 @@
+''' Tests cached card_id -> accounts lookups'''
+
+from django.test import TestCase
+
+from card_issuing_excercise.apps.processing.caches import CardAccountsCache
+from card_issuing_excercise.apps.processing.models.accounts import \
+    Account, \
+    UserAccountsUnion
+from card_issuing_excercise.apps.utils.tests import \
+    CreateAccountMixin
+
+
+class GetCardAccounts(CreateAccountMixin,
+                      TestCase):
+
+    '''
+    Tests card accounts getters and process level cache invalidation
+    '''
+
+    def setUp(self):
+        CardAccountsCache().clear()
+        self.user_account = self.create_account()
+
+    ##
+    # Helpers
+    ##
+
+    def get_card_accounts(self):
+        return UserAccountsUnion.objects.\
+            get_card_accounts(self.user_account.card_id)
+
+    ##
+    # Tests
+    ##
+
+    def test__get_card_accounts__ids_are_valid(self):
+        card_accounts = self.get_card_accounts()
+        self.assertEqual(
+            (card_accounts.user_account_id,
+             card_accounts.base_account_id,
+             card_accounts.reserved_account_id),
+            (self.user_account.id,
+             self.user_account.base_account.id,
+             self.user_account.reserved_account.id))
+
+    def test__get_cached_card_accounts__no_queries(self):
+        self.get_card_accounts()
+        with self.assertNumQueries(0):
+            self.get_card_accounts()
+
+    def test__get_unknown_card__none_returned(self):
+        self.assertIsNone(
+            UserAccountsUnion.objects.get_card_accounts('INVALID'))
+
+    def test__get_many_cards__one_query(self):
+        other_user_account = self.create_account()
+        with self.assertNumQueries(1):
+            cards_accounts = UserAccountsUnion.objects.get_cards_accounts(
+                [self.user_account.card_id, other_user_account.card_id])
+        self.assertEqual(len(cards_accounts), 2)
+
+    def test__delete_account__cache_invalidated(self):
+        self.get_card_accounts()
+        self.user_account.delete()
+        self.assertIsNone(self.get_card_accounts())
+
+    def test__get_accounts_for_update__ordered_by_ids(self):
+        card_accounts = self.get_card_accounts()
+        base_account, reserved_account = Account.objects.get_for_update(
+            card_accounts.base_account_id,
+            card_accounts.reserved_account_id)
+        self.assertEqual(
+            (base_account.id, reserved_account.id),
+            (card_accounts.base_account_id,
+             card_accounts.reserved_account_id))
@@ -0,0 +1,57 @@
+''' Tests special accounts pinned in process memory'''
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase
+
+from card_issuing_excercise.apps.processing.caches import \
+    SpecialAccountsRegistry
+from card_issuing_excercise.apps.processing.models.accounts import \
+    UserAccountsUnion, \
+    REVENUE_ACCOUNT_ROLE
+from card_issuing_excercise.apps.utils.tests import \
+    CreateAccountMixin
+
+
+class PinnedSpecialAccounts(CreateAccountMixin,
+                            TestCase):
+
+    '''
+    Tests resolving and pinning of special accounts
+    '''
+
+    def setUp(self):
+        SpecialAccountsRegistry().clear()
+
+    def test__get_pinned_account__base_account_returned(self):
+        revenue_account = self.create_revenue_account()
+        account = UserAccountsUnion.objects.\
+            get_pinned_special_account(REVENUE_ACCOUNT_ROLE)
+        self.assertEqual(account.id, revenue_account.base_account.id)
+
+    def test__get_pinned_account_twice__no_queries(self):
+        self.create_revenue_account()
+        UserAccountsUnion.objects.\
+            get_pinned_special_account(REVENUE_ACCOUNT_ROLE)
+        with self.assertNumQueries(0):
+            UserAccountsUnion.objects.\
+                get_pinned_special_account(REVENUE_ACCOUNT_ROLE)
+
+    def test__get_not_created_pinned_account__none_returned(self):
+        self.assertIsNone(
+            UserAccountsUnion.objects.
+            get_pinned_special_account(REVENUE_ACCOUNT_ROLE))
+
+    def test__load_all_special_accounts__all_pinned(self):
+        call_command('initialize_before_startup')
+        SpecialAccountsRegistry().clear()
+        UserAccountsUnion.objects.load_special_accounts()
+        with self.assertNumQueries(0):
+            account = UserAccountsUnion.objects.\
+                get_pinned_special_account(REVENUE_ACCOUNT_ROLE)
+        self.assertIsNotNone(account)
+
+    def test__load_with_missing_special_accounts__fail_fast(self):
+        self.create_revenue_account()
+        with self.assertRaises(ImproperlyConfigured):
+            UserAccountsUnion.objects.load_special_accounts()
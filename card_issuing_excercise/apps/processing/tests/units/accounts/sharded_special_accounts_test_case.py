@@ -0,0 +1,88 @@
+''' Tests special accounts split into basic account shards'''
+
+import decimal
+
+from card_issuing_excercise.apps.processing.caches import \
+    SpecialAccountsRegistry
+from card_issuing_excercise.apps.processing.models.accounts import \
+    Account, \
+    UserAccountsUnion, \
+    INNER_SETTLEMENT_ACCOUNT_ROLE
+from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction
+from card_issuing_excercise.apps.utils.tests import TransactionBaseTestCase
+
+
+class ShardedSpecialAccounts(TransactionBaseTestCase):
+
+    '''
+    Tests creation, shard choice, amounts and settlement
+    of sharded special accounts
+    '''
+
+    SHARDS_NUMBER = 4
+
+    def setUp(self):
+        SpecialAccountsRegistry().clear()
+        self.settlement_account = UserAccountsUnion.objects.\
+            create_special_account(INNER_SETTLEMENT_ACCOUNT_ROLE,
+                                   shards_number=self.SHARDS_NUMBER)
+
+    ##
+    # Helpers
+    ##
+
+    def arrange_shard_amounts(self):
+        shards = self.settlement_account.base_account_shards
+        for index, shard in enumerate(shards):
+            Account.objects.filter(id=shard.id).\
+                update(amount=decimal.Decimal(index + 1))
+        return UserAccountsUnion.objects.get(id=self.settlement_account.id)
+
+    ##
+    # Tests
+    ##
+
+    def test__create_sharded_account__all_shards_created(self):
+        shards = self.settlement_account.base_account_shards
+        self.assertEqual([shard.shard for shard in shards],
+                         list(range(self.SHARDS_NUMBER)))
+
+    def test__create_sharded_account_twice__no_shards_duplicated(self):
+        UserAccountsUnion.objects.create_special_account(
+            INNER_SETTLEMENT_ACCOUNT_ROLE, shards_number=self.SHARDS_NUMBER)
+        self.assertEqual(
+            len(self.settlement_account.base_account_shards),
+            self.SHARDS_NUMBER)
+
+    def test__get_base_amount__shards_summed(self):
+        settlement_account = self.arrange_shard_amounts()
+        self.assertEqual(settlement_account.base_amount, decimal.Decimal(10))
+
+    def test__get_pinned_account_by_key__same_shard_returned(self):
+        first_account = UserAccountsUnion.objects.get_pinned_special_account(
+            INNER_SETTLEMENT_ACCOUNT_ROLE, shard_key='CARD_ID')
+        second_account = UserAccountsUnion.objects.get_pinned_special_account(
+            INNER_SETTLEMENT_ACCOUNT_ROLE, shard_key='CARD_ID')
+        self.assertEqual(first_account.id, second_account.id)
+
+    def test__get_pinned_accounts_by_keys__many_shards_used(self):
+        account_ids = set(
+            UserAccountsUnion.objects.get_pinned_special_account(
+                INNER_SETTLEMENT_ACCOUNT_ROLE,
+                shard_key='CARD_{}'.format(index)).id
+            for index in range(100))
+        self.assertGreater(len(account_ids), 1)
+
+    def test__settle_from_shards__all_shards_drained(self):
+        settlement_account = self.arrange_shard_amounts()
+        external_settlement_account = \
+            self.create_external_settlement_account()
+        shards = settlement_account.base_account_shards
+        Transaction.objects.settle_day_transactions_from_shards(
+            {shard.id: shard.amount for shard in shards},
+            external_settlement_account.base_account)
+        for shard in shards:
+            self.check_account_result_amount(shard.id, 0.0)
+        self.check_account_result_amount(
+            external_settlement_account.base_account.id, 10.0)
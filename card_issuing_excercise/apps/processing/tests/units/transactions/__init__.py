@@ -1,10 +1,21 @@
 ''' Unit tests for transactions'''
 
 from .authorization_transaction_test_case import AuthorisationTransaction
+from .conditional_authorization_test_case import \
+    ConditionalAuthorisationTransaction
 from .create_transfer_test_case import TransactionTransferManagement
 from .get_reserve_amount_test_case import GetReserveAmount
 from .load_money_transaction_test_case import LoadMoneyTransaction
 from .outdated_transaction_test_case import RollbackNonPresentmentTransaction
+from .post_transfers_test_case import PostTransfers
+from .presentment_batching_test_case import \
+    DeadlockedPresentmentBatching, \
+    PresentmentBatching
 from .presentment_transaction_test_case import PresentmentTransaction
 from .settlement_transaction_test_case import SettlementTransaction
+from .transaction_payload_test_case import TransactionPayloadStorage
+from .transfer_balance_after_test_case import \
+    ConcurrentTransferBalanceAfter, \
+    TransferBalanceAfter
+from .transfer_created_at_test_case import TransferCreatedAt
 from .update_description_test_case import UpdateDescription
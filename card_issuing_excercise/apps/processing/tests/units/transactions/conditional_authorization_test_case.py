@@ -0,0 +1,95 @@
+'''Tests authorization by conditional debit'''
+
+import decimal
+
+from card_issuing_excercise.apps.processing.models.accounts import Account
+from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction, \
+    IssuerTransactionError, \
+    TRANSACTION_MONEY_SHORTAGE_STATUS
+from card_issuing_excercise.apps.utils.tests import \
+    TransactionBaseTestCase
+
+
+class ConditionalAuthorisationTransaction(TransactionBaseTestCase):
+
+    '''
+    Test for authorization transaction
+    which checks and deducts amount by one guarded UPDATE
+    '''
+
+    def setUp(self):
+        self.user_account = self.create_account_with_amount()
+        self.base_amount = self.user_account.base_account.amount
+        self.transfer_amount = decimal.Decimal(0.5) * self.base_amount
+        self.real_transfer_amount = Transaction.objects.\
+            get_amount_for_reserve(self.transfer_amount)
+        # looked up once, so statements of authorisation only are counted
+        self.base_account_id = self.user_account.base_account.id
+        self.reserved_account_id = self.user_account.reserved_account.id
+
+    ##
+    # Helpers
+    ##
+
+    def authorise(self, code, amount, conditional_debit=True):
+        '''
+        Shortcut for authorization by accounts references
+        '''
+        return Transaction.objects.try_authorise_transaction(
+            code, amount,
+            conditional_debit=conditional_debit,
+            from_account=Account.objects.get_reference(self.base_account_id),
+            to_account=Account.objects.get_reference(
+                self.reserved_account_id))
+
+    ##
+    # Tests
+    ##
+
+    def test__valid_transaction__base_amount_deducted(self):
+        self.authorise('VALID', self.transfer_amount)
+        self.check_account_result_amount(
+            self.user_account.base_account.id,
+            self.base_amount - self.real_transfer_amount)
+
+    def test__valid_transaction__reserved_amount_increased(self):
+        self.authorise('VALID', self.transfer_amount)
+        self.check_account_result_amount(
+            self.user_account.reserved_account.id,
+            self.real_transfer_amount)
+
+    def test__not_enough_money__base_amount_not_modified(self):
+        try:
+            self.authorise('TOOMUCH', 3 * self.transfer_amount)
+        except IssuerTransactionError:
+            pass
+        self.check_account_result_amount(
+            self.user_account.base_account.id, self.base_amount)
+
+    def test__not_enough_money__declined_transaction_logged(self):
+        try:
+            self.authorise('TOOMUCH', 3 * self.transfer_amount)
+        except IssuerTransactionError:
+            pass
+        self.assertEqual(
+            list(Transaction.objects.filter(code='TOOMUCH').
+                 values_list('status', flat=True)),
+            [TRANSACTION_MONEY_SHORTAGE_STATUS])
+
+    def test__reserve_above_balance_by_rounding__whole_balance_reserved(self):
+        # reserve differs from balance beyond stored precision only
+        amount = (self.base_amount + decimal.Decimal('0.00004')) / \
+            Transaction.objects.get_amount_for_reserve(1)
+        self.authorise('ROUNDED', amount)
+        self.check_account_result_amount(
+            self.user_account.base_account.id, 0)
+        self.check_account_result_amount(
+            self.user_account.reserved_account.id, self.base_amount)
+
+    def test__conditional_debit__statements_count_is_fixed(self):
+        # statuses read, guarded debit, transaction insert,
+        # reserved amount update, running balances read
+        # and transfers insert. No savepoints
+        with self.assertNumQueries(6):
+            self.authorise('COND', self.transfer_amount)
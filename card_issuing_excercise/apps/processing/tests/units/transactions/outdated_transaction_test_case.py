@@ -5,6 +5,7 @@ import decimal
 
 from card_issuing_excercise.apps.processing.models.transactions import \
     Transaction, \
+    IssuerTransactionError, \
     TRANSACTION_PRESENTMENT_STATUS, \
     TRANSACTION_PRESENTMANT_IS_TOO_LATE_STATUS
 from card_issuing_excercise.apps.utils.tests import TransactionBaseTestCase
@@ -74,6 +75,13 @@ class RollbackNonPresentmentTransaction(TransactionBaseTestCase):
         Transaction.objects.rollback_late_presentment(
             self.transaction_for_double_rollback.code)
 
+    def present_valid_rollback(self):
+        return Transaction.objects.present_transaction(
+            self.transaction_for_valid_rollback.code,
+            self.transfer_amount, self.transfer_amount,
+            from_account=self.user_account.base_account,
+            to_account=self.create_account().base_account)
+
     ##
     # Tests
     ##
@@ -121,3 +129,18 @@ class RollbackNonPresentmentTransaction(TransactionBaseTestCase):
             self.user_account.reserved_account.id,
             -self.transfer_amount,
             transaction.id)
+
+    def test__presentment_after_late_rollback__already_done(self):
+        self.create_valid_rollback()
+        with self.assertRaises(IssuerTransactionError):
+            self.present_valid_rollback()
+        self.check_account_result_amount(
+            self.user_account.reserved_account.id,
+            self.transfer_amount * (self.transactions_number - 1))
+
+    def test__late_rollback_after_presentment__reserved_amount_not_modified(self):
+        self.present_valid_rollback()
+        self.assertIsNone(self.create_valid_rollback())
+        self.check_account_result_amount(
+            self.user_account.reserved_account.id,
+            self.transfer_amount * (self.transactions_number - 1))
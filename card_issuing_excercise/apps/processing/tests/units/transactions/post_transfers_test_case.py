@@ -0,0 +1,88 @@
+''' Tests posting engine'''
+
+import decimal
+
+from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction
+from card_issuing_excercise.apps.utils.tests import TransactionBaseTestCase
+
+
+class PostTransfers(TransactionBaseTestCase):
+
+    '''
+    Test for posting balanced transfer legs in bulk.
+    '''
+
+    def setUp(self):
+        self.user_account = self.create_account_with_amount()
+        self.other_user_account = self.create_account()
+        self.base_amount = self.user_account.base_amount
+        self.transfer_amount = decimal.Decimal(0.2) * self.base_amount
+        self.transactions = [self.create_transaction() for _ in range(2)]
+
+    ##
+    # Helpers
+    ##
+
+    def get_legs(self, amount):
+        '''
+        Shortcut for legs from user base account
+        to reserved account and to other user
+        '''
+        return [
+            (self.user_account.reserved_account.id, amount),
+            (self.other_user_account.base_account.id, amount),
+            (self.user_account.base_account.id, -2 * amount)]
+
+    def post_transfers(self):
+        Transaction.objects.post_transfers([
+            (transaction, self.get_legs(self.transfer_amount))
+            for transaction in self.transactions])
+
+    ##
+    # Tests
+    ##
+
+    def test__post_many_transactions__sender_amount_deducted(self):
+        self.post_transfers()
+        self.check_account_result_amount(
+            self.user_account.base_account.id,
+            self.base_amount - 4 * self.transfer_amount)
+
+    def test__post_many_transactions__reciever_amount_increased(self):
+        self.post_transfers()
+        self.check_account_result_amount(
+            self.other_user_account.base_account.id,
+            2 * self.transfer_amount)
+
+    def test__post_many_transactions__all_transfers_exist(self):
+        self.post_transfers()
+        for transaction in self.transactions:
+            self.check_transfer_exists(
+                self.user_account.base_account.id,
+                -2 * self.transfer_amount,
+                transaction.id)
+
+    def test__post_many_transactions__one_update_one_select_and_one_insert(self):
+        accounts_legs = self.get_legs(self.transfer_amount)
+        # amounts update, running balances read and transfers insert
+        with self.assertNumQueries(3):
+            Transaction.objects.post_transfers([
+                (transaction, accounts_legs)
+                for transaction in self.transactions])
+
+    def test__post_not_balanced_legs__error_raised(self):
+        with self.assertRaises(ValueError):
+            Transaction.objects.post_transfers([
+                (self.transactions[0],
+                 [(self.user_account.base_account.id, self.transfer_amount)])])
+
+    def test__post_not_balanced_legs__amount_not_modified(self):
+        try:
+            Transaction.objects.post_transfers([
+                (self.transactions[0],
+                 [(self.user_account.base_account.id, self.transfer_amount)])])
+        except ValueError:
+            pass
+        self.check_account_result_amount(
+            self.user_account.base_account.id, self.base_amount)
@@ -0,0 +1,169 @@
+'''Tests group commit of presentments'''
+
+import decimal
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import TransactionTestCase
+
+from card_issuing_excercise.apps.processing.batching import \
+    PresentmentBatcher, \
+    PresentmentItem, \
+    MYSQL_DEADLOCK_ERROR
+from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction, \
+    IssuerTransactionError, \
+    TRANSACTION_PRESENTMENT_STATUS
+from card_issuing_excercise.apps.utils.tests import CreateAccountMixin, \
+    CreateTransactionMixin, \
+    TestTransactionMixin, \
+    TransactionBaseTestCase
+
+
+class PresentmentBatchingMixin:
+
+    '''
+    Arranges authorisations to present and helpers for posting them
+    '''
+
+    def setUp(self):
+        self.sender_account = self.create_account_with_amount()
+        self.reciever_account = self.create_account()
+        self.transfer_amount = decimal.Decimal(0.1) * \
+            self.sender_account.base_account.amount
+        self.authorization_transactions = [
+            self.create_transaction(
+                from_account=self.sender_account.base_account,
+                to_account=self.sender_account.reserved_account,
+                amount=self.transfer_amount)
+            for _ in range(2)]
+
+    ##
+    # Helpers
+    ##
+
+    def create_presentment_item(self, code):
+        return PresentmentItem(
+            code, self.transfer_amount, self.transfer_amount,
+            from_account=self.sender_account.base_account,
+            to_account=self.reciever_account.base_account)
+
+    def post_items(self, codes):
+        items = [self.create_presentment_item(code) for code in codes]
+        PresentmentBatcher().post(items)
+        return items
+
+
+class PresentmentBatching(PresentmentBatchingMixin, TransactionBaseTestCase):
+
+    '''
+    Tests that batch of presentments is posted at once
+    and every presentment gets its own outcome
+    '''
+
+    ##
+    # Tests
+    ##
+
+    def test__post_batch__all_presentments_saved(self):
+        items = self.post_items([
+            transaction.code
+            for transaction in self.authorization_transactions])
+        for item in items:
+            self.assertEqual(item.get_result().status,
+                             TRANSACTION_PRESENTMENT_STATUS)
+        self.check_account_result_amount(
+            self.reciever_account.base_account.id, 2 * self.transfer_amount)
+
+    def test__post_batch_with_not_existing__other_presentments_saved(self):
+        items = self.post_items([
+            'NOTEXISTING', self.authorization_transactions[0].code])
+        with self.assertRaises(IssuerTransactionError) as err:
+            items[0].get_result()
+        self.assertEqual(err.exception.code,
+                         Transaction.Errors.DOES_NOT_EXISTS)
+        self.check_account_result_amount(
+            self.reciever_account.base_account.id, self.transfer_amount)
+
+    def test__post_batch_with_duplicate__duplicate_fails(self):
+        code = self.authorization_transactions[0].code
+        items = self.post_items([code, code])
+        self.assertIsNotNone(items[0].get_result())
+        with self.assertRaises(IssuerTransactionError) as err:
+            items[1].get_result()
+        self.assertEqual(err.exception.code,
+                         Transaction.Errors.ALREADY_DONE)
+        self.check_account_result_amount(
+            self.reciever_account.base_account.id, self.transfer_amount)
+
+    def test__post_batch__all_items_done(self):
+        items = self.post_items(['NOTEXISTING', 'NOTEXISTING2'])
+        for item in items:
+            self.assertTrue(item.done.is_set())
+
+    def test__present_inside_transaction__posted_right_away(self):
+        transaction = PresentmentBatcher().present(
+            self.authorization_transactions[0].code,
+            self.transfer_amount, self.transfer_amount,
+            from_account=self.sender_account.base_account,
+            to_account=self.reciever_account.base_account)
+        self.assertEqual(transaction.status, TRANSACTION_PRESENTMENT_STATUS)
+
+
+class DeadlockedPresentmentBatching(PresentmentBatchingMixin,
+                                    CreateAccountMixin,
+                                    CreateTransactionMixin,
+                                    TestTransactionMixin,
+                                    TransactionTestCase):
+
+    '''
+    Tests that batch rolled back by deadlock
+    is posted again presentment by presentment.
+    Batch is posted out of test transaction, as batcher thread does
+    '''
+
+    ##
+    # Helpers
+    ##
+
+    def post_items_with_deadlocks(self, codes, deadlocks_count):
+        '''
+        Posts items while first presentments fail with deadlock
+        '''
+        present_transaction = Transaction.objects.present_transaction
+        calls = []
+
+        def deadlocking_present_transaction(*args, **kwargs):
+            calls.append(args)
+            if len(calls) <= deadlocks_count:
+                raise OperationalError(MYSQL_DEADLOCK_ERROR, 'Deadlock found')
+            return present_transaction(*args, **kwargs)
+
+        with mock.patch.object(Transaction.objects, 'present_transaction',
+                               deadlocking_present_transaction):
+            return self.post_items(codes)
+
+    ##
+    # Tests
+    ##
+
+    def test__deadlock_in_batch__presentments_posted_separately(self):
+        items = self.post_items_with_deadlocks([
+            transaction.code
+            for transaction in self.authorization_transactions], 1)
+        for item in items:
+            self.assertEqual(item.get_result().status,
+                             TRANSACTION_PRESENTMENT_STATUS)
+        self.check_account_result_amount(
+            self.reciever_account.base_account.id, 2 * self.transfer_amount)
+
+    def test__deadlock_on_retry__only_deadlocked_presentment_fails(self):
+        items = self.post_items_with_deadlocks([
+            transaction.code
+            for transaction in self.authorization_transactions], 2)
+        with self.assertRaises(OperationalError):
+            items[0].get_result()
+        self.assertEqual(items[1].get_result().status,
+                         TRANSACTION_PRESENTMENT_STATUS)
+        self.check_account_result_amount(
+            self.reciever_account.base_account.id, self.transfer_amount)
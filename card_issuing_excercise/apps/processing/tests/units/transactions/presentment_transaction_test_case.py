@@ -32,6 +32,10 @@ class PresentmentTransaction(TransactionBaseTestCase):
         self.reciever_account = self.create_account()
         self.revenue_account = self.create_account()
         self.settlement_coeff = decimal.Decimal(0.7)
+        # looked up once, so statements of presentment only are counted
+        self.sender_base_account = self.sender_account.base_account
+        self.reciever_base_account = self.reciever_account.base_account
+        self.revenue_base_account = self.revenue_account.base_account
 
     def arrange_amounts(self):
         self.base_amount = self.sender_account.base_account.amount
@@ -49,17 +53,17 @@ class PresentmentTransaction(TransactionBaseTestCase):
         return Transaction.objects.present_transaction(
             self.authoriazation_transaction.code, self.transfer_amount, 
             self.transfer_amount,
-            from_account=self.sender_account.base_account,
-            to_account=self.reciever_account.base_account)
+            from_account=self.sender_base_account,
+            to_account=self.reciever_base_account)
 
     def create_valid_transaction_with_revenue(self):
         return  Transaction.objects.present_transaction(
             self.authoriazation_transaction.code, 
             self.transfer_amount, 
             self.settlement_coeff * self.transfer_amount,
-            from_account=self.sender_account.base_account,
-            to_account=self.reciever_account.base_account,
-            extra_account=self.revenue_account.base_account)
+            from_account=self.sender_base_account,
+            to_account=self.reciever_base_account,
+            extra_account=self.revenue_base_account)
 
     def duplicate_transaction(self):
         self.create_transaction(
@@ -175,3 +179,18 @@ class PresentmentTransaction(TransactionBaseTestCase):
         self.check_account_result_amount(
              self.reciever_account.base_account.id, self.transfer_amount)
 
+    # statements count
+
+    def test__valid_transaction__statements_count_is_fixed(self):
+        # statuses and authorisation legs reads,
+        # rollback and presentment inserts, one update for all amounts,
+        # running balances read and transfers insert. No savepoints
+        with self.assertNumQueries(7):
+            self.create_valid_transaction_with_revenue()
+
+    def test__duplicate_transaction__nothing_written(self):
+        self.create_valid_transaction_without_revenue()
+        # only statuses are read
+        with self.assertNumQueries(1):
+            with self.assertRaises(IssuerTransactionError):
+                self.create_valid_transaction_without_revenue()
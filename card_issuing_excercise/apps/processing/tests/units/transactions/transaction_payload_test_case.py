@@ -0,0 +1,80 @@
+'''Tests compressed storage of transactions payloads'''
+
+from django.core.management import call_command
+
+from card_issuing_excercise.apps.processing.models import Transaction
+from card_issuing_excercise.apps.utils import dict_to_base64
+from card_issuing_excercise.apps.utils.tests import TransactionBaseTestCase
+
+
+class TransactionPayloadStorage(TransactionBaseTestCase):
+
+    '''
+    Test for compressed payloads and compatibility
+    with base64 descriptions
+    '''
+
+    def setUp(self):
+        self.transaction = self.create_transaction()
+        self.info_in_json = {'transaction_id': self.transaction.code,
+                             'billing_amount': '10.0000',
+                             'merchant_name': 'это юникод'}
+
+    ##
+    # Helpers
+    ##
+
+    def create_legacy_transaction(self):
+        transaction = self.create_transaction()
+        Transaction.objects.filter(id=transaction.id).update(
+            legacy_base64_description=dict_to_base64(self.info_in_json))
+        return Transaction.objects.get(id=transaction.id)
+
+    ##
+    # Tests
+    ##
+
+    def test__update_descriptions__base64_description_is_compatible(self):
+        self.transaction.update_descriptions(self.info_in_json)
+        transaction = Transaction.objects.get(id=self.transaction.id)
+        self.assertEqual(transaction.base64_description,
+                         dict_to_base64(self.info_in_json))
+
+    def test__update_descriptions__legacy_column_is_empty(self):
+        self.transaction.update_descriptions(self.info_in_json)
+        transaction = Transaction.objects.get(id=self.transaction.id)
+        self.assertIsNone(transaction.legacy_base64_description)
+
+    def test__update_descriptions_twice__payload_is_overwritten(self):
+        self.transaction.update_descriptions(self.info_in_json)
+        info_in_json = dict(self.info_in_json, billing_amount='20.0000')
+        self.transaction.update_descriptions(info_in_json)
+        transaction = Transaction.objects.get(id=self.transaction.id)
+        self.assertEqual(transaction.base64_description,
+                         dict_to_base64(info_in_json))
+
+    def test__bulk_update_descriptions_twice__payload_is_overwritten(self):
+        Transaction.objects.bulk_update_descriptions(
+            [(self.transaction, self.info_in_json)])
+        info_in_json = dict(self.info_in_json, billing_amount='20.0000')
+        Transaction.objects.bulk_update_descriptions(
+            [(self.transaction, info_in_json)])
+        transaction = Transaction.objects.get(id=self.transaction.id)
+        self.assertEqual(transaction.base64_description,
+                         dict_to_base64(info_in_json))
+
+    def test__no_descriptions__base64_description_is_none(self):
+        self.assertIsNone(self.transaction.base64_description)
+
+    def test__legacy_transaction__base64_description_is_legacy(self):
+        transaction = self.create_legacy_transaction()
+        self.assertEqual(transaction.base64_description,
+                         dict_to_base64(self.info_in_json))
+
+    def test__convert_legacy_transaction__base64_description_is_same(self):
+        transaction = self.create_legacy_transaction()
+        call_command('convert_transaction_payloads', chunk_size=1)
+        transaction = Transaction.objects.get(id=transaction.id)
+        self.assertIsNone(transaction.legacy_base64_description)
+        self.assertEqual(transaction.base64_description,
+                         dict_to_base64(self.info_in_json))
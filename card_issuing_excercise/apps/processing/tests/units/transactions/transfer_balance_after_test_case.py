@@ -0,0 +1,199 @@
+'''Tests running balances of accounts saved on transfers'''
+
+import datetime
+import decimal
+import threading
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction as db_transaction
+from django.test import TransactionTestCase
+
+from card_issuing_excercise.apps.processing.models import Transfer
+from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction
+from card_issuing_excercise.apps.utils import datetime_to_timestamp
+from card_issuing_excercise.apps.utils.tests import CreateAccountMixin, \
+    CreateTransactionMixin, \
+    TransactionBaseTestCase
+
+
+class TransferBalanceAfter(TransactionBaseTestCase):
+
+    '''
+    Tests that transfers get balance of account after them on posting,
+    balance at point of time uses it
+    and verification command recomputes it
+    '''
+
+    def setUp(self):
+        self.load_money_account = self.create_account()
+        # created before transfers moved to the past by tests
+        self.user_account = self.create_account(
+            datetime.datetime.now() - datetime.timedelta(hours=2))
+        self.load_amount = decimal.Decimal(10)
+        self.spent_amount = decimal.Decimal(3)
+        self.load_transaction = self.create_transaction()
+        self.spend_transaction = self.create_transaction()
+        self.post_transfers()
+
+    ##
+    # Helpers
+    ##
+
+    def post_transfers(self):
+        base_account_id = self.user_account.base_account.id
+        Transaction.objects.post_transfers([
+            (self.load_transaction,
+             [(base_account_id, self.load_amount),
+              (self.load_money_account.base_account.id, -self.load_amount)]),
+            (self.spend_transaction,
+             [(self.user_account.reserved_account.id, self.spent_amount),
+              (base_account_id, -self.spent_amount)])])
+
+    def get_balances_after(self):
+        '''
+        Shortcut for running balances of user base account in posting order
+        '''
+        return list(
+            Transfer.objects.
+            filter(account=self.user_account.base_account).
+            order_by('id').
+            values_list('balance_after', flat=True))
+
+    def check_balances_after(self):
+        self.assertEqual(
+            self.get_balances_after(),
+            [self.load_amount, self.load_amount - self.spent_amount])
+
+    ##
+    # Tests
+    ##
+
+    def test__post_transfers__running_balances_saved(self):
+        self.check_balances_after()
+
+    def test__post_transfers_for_moved_account__previous_balance_included(self):
+        Transaction.objects.load_money(
+            self.load_amount,
+            self.load_money_account.base_account,
+            self.user_account.base_account,
+            code='LTEST')
+        self.assertEqual(
+            self.get_balances_after()[-1],
+            2 * self.load_amount - self.spent_amount)
+
+    def test__get_past_amount__running_balance_used(self):
+        Transfer.objects.update(
+            created_at=datetime.datetime.now() - datetime.timedelta(hours=1))
+        # differs from transfers sum, so lookups which ignore it are caught
+        Transfer.objects.\
+            filter(account=self.user_account.reserved_account).\
+            update(balance_after=1)
+        total_amount, available_amount = \
+            self.user_account.get_amounts_for_ts(datetime_to_timestamp(
+                datetime.datetime.now() - datetime.timedelta(minutes=30)))
+        self.assertEqual(available_amount, self.load_amount - self.spent_amount)
+        self.assertEqual(total_amount, available_amount + 1)
+
+    def test__verify_with_fix__missing_balances_recomputed(self):
+        Transfer.objects.update(balance_after=None)
+        call_command('verify_transfers_balance', '--chunk-size', '1', '--fix')
+        self.check_balances_after()
+
+    def test__verify_with_fix__balances_recomputed_in_time_order(self):
+        # spending is earlier by time, but later by id
+        Transfer.objects.filter(transaction=self.spend_transaction).update(
+            created_at=datetime.datetime.now() - datetime.timedelta(hours=1))
+        call_command('verify_transfers_balance', '--fix')
+        self.assertEqual(
+            self.get_balances_after(),
+            [self.load_amount - self.spent_amount, -self.spent_amount])
+
+    def test__verify_transfers_without_created_at__fail(self):
+        Transfer.objects.update(created_at=None)
+        with self.assertRaises(CommandError):
+            call_command('verify_transfers_balance')
+
+    def test__verify_without_fix__balances_not_changed(self):
+        Transfer.objects.update(balance_after=None)
+        call_command('verify_transfers_balance')
+        self.assertEqual(self.get_balances_after(), [None, None])
+
+
+class ConcurrentTransferBalanceAfter(CreateAccountMixin,
+                                     CreateTransactionMixin,
+                                     TransactionTestCase):
+
+    '''
+    Tests that running balances follow time order of transfers
+    used by balance lookups when transaction created first
+    is posted last by concurrent thread
+    '''
+
+    def setUp(self):
+        self.load_money_account = self.create_account()
+        self.user_account = self.create_account()
+        self.early_amount = decimal.Decimal(10)
+        self.late_amount = decimal.Decimal(3)
+        self.post_concurrently()
+
+    ##
+    # Helpers
+    ##
+
+    def post_concurrently(self):
+        created = threading.Event()
+        posted = threading.Event()
+        late_poster = threading.Thread(
+            target=self.post_late, args=(created, posted))
+        late_poster.start()
+        created.wait()
+        self.post_load(self.create_transaction(), self.early_amount)
+        posted.set()
+        late_poster.join()
+
+    def post_late(self, created, other_posted):
+        '''
+        Creates transaction first and posts it after other one
+        '''
+        try:
+            issuer_transaction = self.create_transaction()
+            created.set()
+            other_posted.wait()
+            self.post_load(issuer_transaction, self.late_amount)
+        finally:
+            connection.close()
+
+    def post_load(self, issuer_transaction, amount):
+        with db_transaction.atomic():
+            Transaction.objects.post_transfers([
+                (issuer_transaction,
+                 [(self.user_account.base_account.id, amount),
+                  (self.load_money_account.base_account.id, -amount)])])
+
+    def get_transfers_in_time_order(self):
+        return list(
+            Transfer.objects.
+            filter(account=self.user_account.base_account).
+            order_by('created_at', 'id').
+            values_list('created_at', 'amount', 'balance_after'))
+
+    ##
+    # Tests
+    ##
+
+    def test__created_first_posted_last__balances_follow_time_order(self):
+        balance = 0
+        for _, amount, balance_after in self.get_transfers_in_time_order():
+            balance += amount
+            self.assertEqual(balance_after, balance)
+
+    def test__created_first_posted_last__lookup_returns_running_balance(self):
+        account_id = self.user_account.base_account.id
+        for created_at, _, balance_after in \
+                self.get_transfers_in_time_order():
+            self.assertEqual(
+                Transfer.objects.get_latest_balances(
+                    [(account_id, created_at)]),
+                {0: balance_after})
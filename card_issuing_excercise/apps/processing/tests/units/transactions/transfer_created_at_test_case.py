@@ -0,0 +1,56 @@
+'''Tests creation time of transfers'''
+
+import datetime
+
+from django.core.management import call_command
+
+from card_issuing_excercise.apps.processing.models import Transfer
+from card_issuing_excercise.apps.utils.tests import TransactionBaseTestCase
+
+
+class TransferCreatedAt(TransactionBaseTestCase):
+
+    '''
+    Tests that transfers get posting time on posting
+    and creation time of their transaction by backfill command
+    '''
+
+    def setUp(self):
+        self.sender_account = self.create_account_with_amount()
+        self.reciever_account = self.create_account()
+        self.transaction = self.create_transaction(
+            from_account=self.sender_account.base_account,
+            to_account=self.reciever_account.base_account,
+            amount=1)
+
+    def check_transfers_created_at(self, expected_created_at):
+        self.assertEqual(
+            set(Transfer.objects.filter(transaction=self.transaction).
+                values_list('created_at', flat=True)),
+            {expected_created_at})
+
+    def test__post_transfers__posting_time_saved(self):
+        # keep only posted transfers
+        Transfer.objects.all().delete()
+        posted_after = datetime.datetime.now()
+        self.transaction.add_transfer(
+            self.sender_account.base_account,
+            self.reciever_account.base_account, 1)
+        created_at = set(
+            Transfer.objects.filter(transaction=self.transaction).
+            values_list('created_at', flat=True))
+        self.assertEqual(len(created_at), 1)
+        self.assertGreaterEqual(created_at.pop(), posted_after)
+
+    def test__backfill__transaction_created_at_copied(self):
+        Transfer.objects.filter(transaction=self.transaction).\
+            update(created_at=None)
+        call_command('backfill_transfers_created_at', '--chunk-size', '1')
+        self.check_transfers_created_at(self.transaction.created_at)
+
+    def test__backfill__already_filled_not_changed(self):
+        created_at = datetime.datetime(2017, 1, 1)
+        Transfer.objects.filter(transaction=self.transaction).\
+            update(created_at=created_at)
+        call_command('backfill_transfers_created_at')
+        self.check_transfers_created_at(created_at)
@@ -0,0 +1,203 @@
+'''
+Per-stage timings of the Schema webhook requests.
+Wall time and number of database queries of every processing stage
+are collected into in-process histograms by message type.
+'''
+
+from collections import deque, namedtuple
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+from django.db import connection
+
+from card_issuing_excercise.settings import STAGE_TIMINGS_MAX_SAMPLES
+
+
+# Stage with whole request processing time
+TOTAL_STAGE = 'total'
+# Message type for messages without valid type
+INVALID_MESSAGE_TYPE = 'invalid'
+MESSAGE_TYPES = ('authorization', 'presentment')
+
+# Percentiles of one stage of one message type
+# and total queries number of kept samples.
+# Time is in seconds
+StageStats = namedtuple(
+    'StageStats',
+    ['message_type', 'stage', 'count',
+     'time_p50', 'time_p95', 'time_p99',
+     'queries_p50', 'queries_p95', 'queries_p99', 'queries_total'])
+
+
+def get_percentile(sorted_values, percentile):
+    '''
+    Nearest-rank percentile of sorted list
+    '''
+    index = int(math.ceil(percentile / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(index, 0)]
+
+
+def get_message_type(message):
+    '''
+    Type of raw message for grouping timings.
+    Unknown types are grouped together
+    '''
+    if isinstance(message, dict) and message.get('type') in MESSAGE_TYPES:
+        return message.get('type')
+    return INVALID_MESSAGE_TYPE
+
+
+class NoTiming:
+
+    '''
+    Context manager which does nothing.
+    Used instead of timers when timings are disabled
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_TIMING = NoTiming()
+
+
+class QueriesCountingCursor:
+
+    '''
+    Counts queries executed by wrapped django cursor
+    into thread local counter
+    '''
+
+    def __init__(self, cursor, local):
+        self.cursor = cursor
+        self.local = local
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.cursor.__exit__(*exc_info)
+
+    def execute(self, *args, **kwargs):
+        self.local.queries += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.local.queries += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        self.local.queries += 1
+        return self.cursor.callproc(*args, **kwargs)
+
+
+class StageTimings:
+
+    '''
+    Collects stages timed inside of request
+    and keeps last samples of every stage by message type.
+    Queries are counted by wrapping cursors of thread database connection
+    during timed request (django 1.10 has no execute wrappers)
+    '''
+
+    # shared by all instances in process
+    _samples = {}
+    _lock = threading.Lock()
+    _local = threading.local()
+
+    @contextmanager
+    def request(self, message_type):
+        '''
+        Times whole request and all stages inside of with block
+        '''
+        stages = []
+        self._local.stages = stages
+        self._local.queries = 0
+        self._wrap_cursors()
+        try:
+            with self.stage(TOTAL_STAGE):
+                yield
+        finally:
+            self._unwrap_cursors()
+            self._local.stages = None
+            self._save(message_type, stages)
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Times stage inside of with block.
+        Does nothing outside of timed request
+        '''
+        stages = getattr(self._local, 'stages', None)
+        if stages is None:
+            yield
+            return
+        queries_number = self._local.queries
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages.append((
+                name, time.perf_counter() - started_at,
+                self._local.queries - queries_number))
+
+    def get_stats(self):
+        '''
+        Returns list of StageStats ordered by message type and stage
+        '''
+        with self._lock:
+            samples = {key: list(stage_samples)
+                       for key, stage_samples in self._samples.items()}
+        stats = []
+        for (message_type, stage), stage_samples in sorted(samples.items()):
+            durations = sorted(duration for duration, _ in stage_samples)
+            queries = sorted(queries for _, queries in stage_samples)
+            stats.append(StageStats(
+                message_type, stage, len(stage_samples),
+                *([get_percentile(durations, percentile)
+                   for percentile in (50, 95, 99)] +
+                  [get_percentile(queries, percentile)
+                   for percentile in (50, 95, 99)] +
+                  [sum(queries)])))
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def _wrap_cursors(self):
+        '''
+        Makes connection of current thread return counting cursors.
+        Both plain and debug cursor factories are wrapped,
+        so counting doesn't depend on DEBUG
+        '''
+        local = self._local
+        make_cursor = connection.make_cursor
+        make_debug_cursor = connection.make_debug_cursor
+        connection.make_cursor = lambda cursor: \
+            QueriesCountingCursor(make_cursor(cursor), local)
+        connection.make_debug_cursor = lambda cursor: \
+            QueriesCountingCursor(make_debug_cursor(cursor), local)
+
+    def _unwrap_cursors(self):
+        del connection.make_cursor
+        del connection.make_debug_cursor
+
+    def _save(self, message_type, stages):
+        with self._lock:
+            for name, duration, queries in stages:
+                self._samples.setdefault(
+                    (message_type, name),
+                    deque(maxlen=STAGE_TIMINGS_MAX_SAMPLES)).\
+                    append((duration, queries))
@@ -1,8 +1,14 @@
 from django.conf.urls import url
 from django.views.decorators.csrf import csrf_exempt
 
-from card_issuing_excercise.apps.processing.views import SchemaWebHook
+from card_issuing_excercise.apps.processing.views import SchemaWebHook, \
+    SchemaBatchWebHook, \
+    StageTimingsView, \
+    CardLockMetricsView
 
 urlpatterns = [
     url(r'^$', csrf_exempt(SchemaWebHook.as_view())),
+    url(r'^batch/$', csrf_exempt(SchemaBatchWebHook.as_view())),
+    url(r'^timings/$', StageTimingsView.as_view()),
+    url(r'^locks/$', CardLockMetricsView.as_view()),
 ]
@@ -0,0 +1,148 @@
+'''
+Validates schema request without DRF serializer machinery.
+Used by lean webhook pipeline
+'''
+
+from collections import OrderedDict
+import decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from card_issuing_excercise.apps.processing.serializers import \
+    SchemaRequestSerializer
+
+
+class CompiledSchemaRequestValidator:
+
+    '''
+    Validates Schema message with checks compiled once
+    from SchemaRequestSerializer fields.
+    Accepts same messages as serializer and returns same data
+    as serializer.data: stripped strings and quantized decimal strings.
+    Only Char and Decimal fields are supported.
+    '''
+
+    # same as DRF DecimalField limit
+    MAX_DECIMAL_STRING_LENGTH = 1000
+
+    def __init__(self, serializer_class=SchemaRequestSerializer):
+        self.checks = [
+            (field_name, field.required, field.allow_null,
+             self._compile_field(field))
+            for field_name, field in serializer_class().fields.items()]
+
+    def validate(self, message):
+        '''
+        Returns validated data or None for invalid message
+        '''
+        if not isinstance(message, dict):
+            return None
+        data = OrderedDict()
+        for field_name, required, allow_null, check in self.checks:
+            if field_name not in message:
+                if required:
+                    return None
+                continue
+            value = message[field_name]
+            if value is None:
+                if not allow_null:
+                    return None
+                data[field_name] = None
+                continue
+            try:
+                data[field_name] = check(value)
+            except ValueError:
+                return None
+        return data
+
+    def _compile_field(self, field):
+        '''
+        Returns check for serializer field.
+        Check converts valid value to representation
+        or raises ValueError
+        '''
+        if isinstance(field, serializers.DecimalField):
+            return self._compile_decimal_field(field)
+        if isinstance(field, serializers.CharField):
+            return self._compile_char_field(field)
+        raise ImproperlyConfigured(
+            'Field {} is not supported by compiled validator'.format(
+                field.__class__.__name__))
+
+    def _compile_char_field(self, field):
+        allow_blank = field.allow_blank
+        trim_whitespace = field.trim_whitespace
+        max_length = field.max_length
+        min_length = field.min_length
+
+        def check(value):
+            if isinstance(value, bool) or \
+                    not isinstance(value, (str, int, float)):
+                raise ValueError('Invalid string')
+            value = str(value)
+            if trim_whitespace:
+                value = value.strip()
+            if not value:
+                if not allow_blank:
+                    raise ValueError('Blank string')
+                return value
+            if max_length is not None and len(value) > max_length:
+                raise ValueError('String is too long')
+            if min_length is not None and len(value) < min_length:
+                raise ValueError('String is too short')
+            return value
+        return check
+
+    def _compile_decimal_field(self, field):
+        max_digits = field.max_digits
+        decimal_places = field.decimal_places
+        max_whole_digits = field.max_whole_digits
+        coerce_to_string = getattr(field, 'coerce_to_string',
+                                   api_settings.COERCE_DECIMAL_TO_STRING)
+        quantum = None
+        context = decimal.getcontext().copy()
+        if decimal_places is not None:
+            quantum = decimal.Decimal('.1') ** decimal_places
+        if max_digits is not None:
+            context.prec = max_digits
+        max_string_length = self.MAX_DECIMAL_STRING_LENGTH
+
+        def check(value):
+            value = str(value).strip()
+            if len(value) > max_string_length:
+                raise ValueError('Decimal string is too long')
+            try:
+                value = decimal.Decimal(value)
+            except decimal.DecimalException:
+                raise ValueError('Invalid decimal')
+            if not value.is_finite():
+                raise ValueError('Invalid decimal')
+            # same digits counting as in DRF DecimalField
+            _, digits, exponent = value.as_tuple()
+            if exponent >= 0:
+                total_digits = len(digits) + exponent
+                whole_digits = total_digits
+                places = 0
+            elif len(digits) > abs(exponent):
+                total_digits = len(digits)
+                whole_digits = total_digits - abs(exponent)
+                places = abs(exponent)
+            else:
+                total_digits = abs(exponent)
+                whole_digits = 0
+                places = total_digits
+            if max_digits is not None and total_digits > max_digits:
+                raise ValueError('Too many digits')
+            if decimal_places is not None and places > decimal_places:
+                raise ValueError('Too many decimal places')
+            if max_whole_digits is not None and \
+                    whole_digits > max_whole_digits:
+                raise ValueError('Too many whole digits')
+            if quantum is not None:
+                value = value.quantize(quantum, context=context)
+            if not coerce_to_string:
+                return value
+            return '{0:f}'.format(value)
+        return check
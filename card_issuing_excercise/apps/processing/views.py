@@ -1,117 +1,268 @@
 ''' Schema Web hook view'''
 
+from contextlib import ExitStack
+
+from django.db import transaction as db_transaction
 from django.http import HttpResponse
 
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser
 
 from card_issuing_excercise.apps.currency_converter.converter import Converter
 from card_issuing_excercise.apps.fraud_detector.detector import FraudDetector
+from card_issuing_excercise.apps.processing.batching import \
+    PresentmentBatcher
+from card_issuing_excercise.apps.processing.descriptions import \
+    DescriptionsWriter, \
+    DESCRIPTIONS_DEFERRED_MODE
+from card_issuing_excercise.apps.processing.idempotency import \
+    IdempotencyStore
+from card_issuing_excercise.apps.processing.locks import CardLockManager
 from card_issuing_excercise.apps.processing.models import UserAccountsUnion, \
+    Account, \
     Transaction
+from card_issuing_excercise.apps.processing.models.accounts import \
+    INNER_SETTLEMENT_ACCOUNT_ROLE, \
+    REVENUE_ACCOUNT_ROLE
 from card_issuing_excercise.apps.processing.models.transactions import \
     IssuerTransactionError
 from card_issuing_excercise.apps.processing.serializers import \
     SchemaRequestSerializer
+from card_issuing_excercise.apps.processing.timings import StageTimings, \
+    get_message_type, \
+    NO_TIMING
+from card_issuing_excercise.settings import SCHEMA_BATCH_MAX_SIZE, \
+    AUTHORISATION_CONDITIONAL_DEBIT, \
+    CARD_LOCKS_ENABLED, \
+    PRESENTMENT_BATCHING_ENABLED, \
+    STAGE_TIMINGS_ENABLED, \
+    TRANSACTION_DESCRIPTIONS_MODE
 
 
-class SchemaWebHook(APIView):
+class SchemaRequestProcessingMixin:
 
     '''
-    Handles payment requests from the Schema.
-    For both authorisation and presentment requests.
+    Incapsulates processing of one Schema message:
+    validation, fraud checks, currency convertion and transaction creation.
+    Shared by single and batch web hooks
     '''
 
-    parser_classes = (JSONParser,)
+    descriptions_mode = TRANSACTION_DESCRIPTIONS_MODE
+    card_locks_enabled = CARD_LOCKS_ENABLED
+    presentment_batching_enabled = PRESENTMENT_BATCHING_ENABLED
+    stage_timings_enabled = STAGE_TIMINGS_ENABLED
 
-    def post(self, request, format=None):
-        # check user exists
-        try:
-            self._process_request(request)
-        except IssuerTransactionError as err:
-            return HttpResponse(
-                status=self._get_http_status_by_code(err.code))
-        return HttpResponse()
-
-    def _process_request(self, request):
+    def _process_message(self, message, cards_accounts=None):
         '''
-        Shortcut for the Schema request processing.
+        Shortcut for the Schema message processing.
+        Accepts already fetched card accounts by card_id (optional).
         Raises IssuerTransactionError.
         Used for simple and unified errors management
         '''
-        request_serializer = SchemaRequestSerializer(data=request.data)
-
-        if not request_serializer.is_valid():
-            raise IssuerTransactionError(
-                Transaction.Errors.INVALID_FORMAT)
-        request_data = request_serializer.data
-        if self._seems_like_fraud(request_data):
+        with self._time_stage('validation'):
+            request_data = self._validate_message(message)
+        with self._time_stage('fraud_check'):
+            is_fraud = self._seems_like_fraud(request_data)
+        if is_fraud:
             raise IssuerTransactionError(
                 Transaction.Errors.FRAUD_TRANSACTION)
         try:
-            request_data = self._convert_amounts_currencies_inplace(
-                request_data)
+            with self._time_stage('conversion'):
+                request_data = self._convert_amounts_currencies_inplace(
+                    request_data)
         except Converter.ConverterError:
             # send 500 explicitly if converter is down
             raise IssuerTransactionError(
                 Transaction.Errors.INVALID_CONFIGURATION)
+        if cards_accounts is None:
+            # batch holds database locks till the end of the batch,
+            # so only single messages wait for card lock
+            # (otherwise batch and single message can deadlock)
+            with self._get_card_lock(request_data.get('card_id')):
+                with self._time_stage('card_lookup'):
+                    card_accounts = self._get_account_by_card_id(
+                        request_data.get('card_id'))
+                with self._time_stage('transaction'):
+                    transaction = self._create_card_transaction(
+                        card_accounts, request_data)
+        else:
+            with self._time_stage('transaction'):
+                transaction = self._create_card_transaction(
+                    cards_accounts.get(request_data.get('card_id')),
+                    request_data)
+        with self._time_stage('descriptions'):
+            self._save_descriptions(transaction, request_data)
+
+    def _create_card_transaction(self, card_accounts, request_data):
+        '''
+        Checks card accounts exist and creates transaction
+        '''
         # check account exists
         # TODO: put it into serizlizer
-        account = self._get_account_by_card_id(
-            request_data.get('card_id'))
-        if not account:
+        if not card_accounts:
             raise IssuerTransactionError(
                 Transaction.Errors.INVALID_USER)
-        transaction = self._create_transaction(account, request_data)
-        transaction.update_descriptions(request_data)
+        return self._create_transaction(card_accounts, request_data)
+
+    def _get_card_lock(self, card_id):
+        '''
+        Returns in-process lock of card if card locks are enabled
+        or context manager which does nothing
+        '''
+        if not self.card_locks_enabled:
+            return ExitStack()
+        return CardLockManager().lock(card_id)
+
+    def _time_request(self, message):
+        '''
+        Returns timer of whole message processing if timings are enabled
+        or context manager which does nothing
+        '''
+        if not self.stage_timings_enabled:
+            return NO_TIMING
+        return StageTimings().request(get_message_type(message))
 
-    def _create_transaction(self, account, request):
+    def _time_stage(self, name):
+        '''
+        Returns timer of processing stage if timings are enabled
+        or context manager which does nothing
+        '''
+        if not self.stage_timings_enabled:
+            return NO_TIMING
+        return StageTimings().stage(name)
+
+    def _get_message_status(self, message):
+        '''
+        Processes one message and represents its outcome as http status.
+        Retries are answered from idempotency store without touching database
+        '''
+        with self._time_request(message):
+            return self._get_processed_message_status(message)
+
+    def _get_processed_message_status(self, message):
+        idempotency_store = IdempotencyStore()
+        outcome = idempotency_store.get(message)
+        if outcome is not None:
+            if idempotency_store.is_retry(message, outcome):
+                # retry gets the same answer as original message
+                return outcome.status_code
+            # processed id is reused by message with other payload
+            return self._get_http_status_by_code(
+                Transaction.Errors.ALREADY_DONE)
+        try:
+            self._process_message(message)
+        except IssuerTransactionError as err:
+            http_status = self._get_http_status_by_code(err.code)
+            if err.code == Transaction.Errors.ALREADY_DONE:
+                idempotency_store.remember(message, http_status)
+            return http_status
+        # only final outcomes are remembered:
+        # declined message can be approved on retry
+        idempotency_store.remember(message, status.HTTP_200_OK)
+        return status.HTTP_200_OK
+
+    def _validate_message(self, message):
+        '''
+        Validates message format and returns its data.
+        Raises IssuerTransactionError
+        '''
+        request_serializer = SchemaRequestSerializer(data=message)
+        if not request_serializer.is_valid():
+            raise IssuerTransactionError(
+                Transaction.Errors.INVALID_FORMAT)
+        return request_serializer.data
+
+    def _save_descriptions(self, transaction, request_data):
+        '''
+        Saves descriptions right away or hands them to background writer
+        depending on descriptions mode
+        '''
+        if self.descriptions_mode == DESCRIPTIONS_DEFERRED_MODE:
+            DescriptionsWriter().schedule(transaction, request_data)
+        else:
+            transaction.update_descriptions(request_data)
+
+    def _create_transaction(self, card_accounts, request):
         '''
         Shortcut for different creating transaction.
         Depends on type specified in request
         '''
         request_type = request.get('type')
         if request_type == 'authorization':
-            return self._process_authorization_request(account, request)
+            return self._process_authorization_request(
+                card_accounts, request)
         elif request_type == 'presentment':
-            return self._process_presentment_request(account, request)
+            return self._process_presentment_request(
+                card_accounts, request)
         raise IssuerTransactionError(Transaction.Errors.INVALID_FORMAT)
 
-    def _process_authorization_request(self, account, request):
-        return Transaction.objects.try_authorise_transaction(
-            request.get('transaction_id'), request.get('billing_amount'),
-            from_account=account.base_account,
-            to_account=account.reserved_account)
+    def _process_authorization_request(self, card_accounts, request):
+        if AUTHORISATION_CONDITIONAL_DEBIT:
+            # balance is checked by conditional debit, no locks needed
+            return Transaction.objects.try_authorise_transaction(
+                request.get('transaction_id'),
+                request.get('billing_amount'),
+                from_account=Account.objects.get_reference(
+                    card_accounts.base_account_id),
+                to_account=Account.objects.get_reference(
+                    card_accounts.reserved_account_id))
+        # lock both accounts at once by primary keys
+        # decline is logged as transaction too, so it should be commited
+        # and error is raised only after database transaction is closed
+        authorization_error = None
+        with db_transaction.atomic():
+            from_account, to_account = Account.objects.get_for_update(
+                card_accounts.base_account_id,
+                card_accounts.reserved_account_id)
+            try:
+                return Transaction.objects.try_authorise_transaction(
+                    request.get('transaction_id'),
+                    request.get('billing_amount'),
+                    conditional_debit=False,
+                    from_account=from_account,
+                    to_account=to_account)
+            except IssuerTransactionError as err:
+                authorization_error = err
+        raise authorization_error
 
-    def _process_presentment_request(self, account, request):
+    def _process_presentment_request(self, card_accounts, request):
         # get inner settlement account and revenue account
         # we should fail with 500 here fast
         # if it is not presented - it means that whole start up was broken
+        # presentments of different cards credit different shards
         settlement_account = UserAccountsUnion.objects.\
-            get_inner_settlement_account()
+            get_pinned_special_account(INNER_SETTLEMENT_ACCOUNT_ROLE,
+                                       shard_key=request.get('card_id'))
         revenue_account = UserAccountsUnion.objects.\
-            get_revenue_account()
+            get_pinned_special_account(REVENUE_ACCOUNT_ROLE,
+                                       shard_key=request.get('card_id'))
         if settlement_account is None or \
                 revenue_account is None:
             raise IssuerTransactionError(
                 Transaction.Errors.INVALID_CONFIGURATION)
-        return Transaction.objects.present_transaction(
+        present_transaction = Transaction.objects.present_transaction
+        if self.presentment_batching_enabled:
+            # commited together with concurrent presentments
+            present_transaction = PresentmentBatcher().present
+        return present_transaction(
             request.get('transaction_id'),
             request.get('billing_amount'), request.get('settlement_amount'),
-            from_account=account.base_account,
-            to_account=settlement_account.base_account,
-            extra_account=revenue_account.base_account)
+            from_account=Account.objects.get(
+                id=card_accounts.base_account_id),
+            to_account=settlement_account,
+            extra_account=revenue_account)
 
     def _get_account_by_card_id(self, card_id):
         # TODO: check if account has rights to do transaction
         '''
-        Helper for retrieving account.
+        Helper for retrieving ids of card accounts.
         '''
         # we depends on inner integrity checks
         # and don't need to check if multiple objects returned
-        return UserAccountsUnion.objects.\
-            filter(card_id=card_id).first()
+        return UserAccountsUnion.objects.get_card_accounts(card_id)
 
     def _get_http_status_by_code(self, code):
         '''
@@ -152,3 +303,129 @@ class SchemaWebHook(APIView):
     def _seems_like_fraud(self, transaction_info):
         '''Shortcut for fraud check'''
         return FraudDetector().check_is_fraud(**transaction_info)
+
+
+class SchemaWebHook(SchemaRequestProcessingMixin, APIView):
+
+    '''
+    Handles payment requests from the Schema.
+    For both authorisation and presentment requests.
+    '''
+
+    parser_classes = (JSONParser,)
+
+    def post(self, request, format=None):
+        return HttpResponse(
+            status=self._get_message_status(request.data))
+
+
+class SchemaBatchWebHook(SchemaRequestProcessingMixin, APIView):
+
+    '''
+    Handles array of payment requests from the Schema.
+    Returns http status for every message in the same order.
+    All messages are processed in one database transaction,
+    but each of them succeeds or fails separately.
+    '''
+
+    parser_classes = (JSONParser,)
+
+    def post(self, request, format=None):
+        messages = request.data
+        if not isinstance(messages, list) or \
+                len(messages) > SCHEMA_BATCH_MAX_SIZE:
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        with db_transaction.atomic():
+            cards_accounts = self._get_accounts_by_card_ids(messages)
+            results = [
+                self._get_message_result(message, cards_accounts)
+                for message in messages]
+        return Response(results)
+
+    def _get_message_result(self, message, cards_accounts):
+        '''
+        Processes one message of the batch and
+        represents its outcome as http status
+        '''
+        http_status = status.HTTP_200_OK
+        # transaction manager doesn't use savepoints,
+        # so every message gets exactly one to fail separately.
+        # Errors are caught inside to keep declined transactions saved
+        with self._time_request(message), db_transaction.atomic():
+            try:
+                if not isinstance(message, dict):
+                    raise IssuerTransactionError(
+                        Transaction.Errors.INVALID_FORMAT)
+                self._process_message(message, cards_accounts)
+            except IssuerTransactionError as err:
+                http_status = self._get_http_status_by_code(err.code)
+        return {
+            'transaction_id': self._get_message_field(
+                message, 'transaction_id'),
+            'type': self._get_message_field(message, 'type'),
+            'status': http_status}
+
+    def _get_accounts_by_card_ids(self, messages):
+        '''
+        Fetches ids of card accounts
+        for all cards in batch at once.
+        '''
+        card_ids = [
+            self._get_message_field(message, 'card_id')
+            for message in messages]
+        # invalid card ids are rejected later by the serializer
+        card_ids = {
+            card_id for card_id in card_ids if isinstance(card_id, str)}
+        return UserAccountsUnion.objects.get_cards_accounts(card_ids)
+
+    def _get_message_field(self, message, field):
+        '''
+        Safe getter for raw message field.
+        Message format can be invalid
+        '''
+        if not isinstance(message, dict):
+            return None
+        return message.get(field)
+
+
+class StageTimingsView(APIView):
+
+    '''
+    Internal endpoint for per stage timings of the Schema webhook.
+    Timings are collected by the worker process which answers the request.
+    DELETE starts collection from scratch
+    '''
+
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request, format=None):
+        return Response([
+            stage_stats._asdict()
+            for stage_stats in StageTimings().get_stats()])
+
+    def delete(self, request, format=None):
+        StageTimings().reset()
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
+class CardLockMetricsView(APIView):
+
+    '''
+    Internal endpoint for card lock waits of the Schema webhook.
+    Only stripes acquired at least once are returned.
+    Metrics are collected by the worker process which answers the request.
+    DELETE starts collection from scratch
+    '''
+
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request, format=None):
+        return Response([
+            dict(stripe=stripe, **stripe_metrics._asdict())
+            for stripe, stripe_metrics in
+            enumerate(CardLockManager().get_metrics())
+            if stripe_metrics.acquisitions])
+
+    def delete(self, request, format=None):
+        CardLockManager().reset_metrics()
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,88 @@
+'''
+Lean WSGI pipeline for the Schema webhook.
+Machine to machine traffic doesn't need sessions, auth, messages,
+csrf and clickjacking middlewares or DRF request wrapping,
+so messages are parsed and validated directly.
+'''
+
+from http.client import responses
+import json
+import logging
+
+from django.core import signals
+from django.core.handlers.wsgi import get_path_info
+
+from rest_framework import status
+
+from card_issuing_excercise.apps.processing.models.transactions import \
+    IssuerTransactionError, \
+    Transaction
+from card_issuing_excercise.apps.processing.validators import \
+    CompiledSchemaRequestValidator
+from card_issuing_excercise.apps.processing.views import \
+    SchemaRequestProcessingMixin
+
+
+logger = logging.getLogger('django.request')
+
+
+class SchemaWebHookApplication(SchemaRequestProcessingMixin):
+
+    '''
+    WSGI application which handles POST requests to the Schema webhook
+    and passes all other requests to wrapped django application.
+    Responds with same status codes as SchemaWebHook
+    '''
+
+    PATH = '/api/v1/request/'
+
+    def __init__(self, application):
+        self.application = application
+        self.validator = CompiledSchemaRequestValidator()
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') != 'POST' or \
+                get_path_info(environ) != self.PATH:
+            return self.application(environ, start_response)
+        # keeps database connections management of django handler
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        try:
+            http_status = self._get_request_status(environ)
+        except Exception:
+            logger.exception('Internal Server Error: %s', self.PATH)
+            http_status = status.HTTP_500_INTERNAL_SERVER_ERROR
+        finally:
+            signals.request_finished.send(sender=self.__class__)
+        start_response(
+            '{} {}'.format(http_status, responses[http_status]),
+            [('Content-Type', 'text/html; charset=utf-8'),
+             ('Content-Length', '0')])
+        return [b'']
+
+    def _get_request_status(self, environ):
+        '''
+        Parses JSON body and processes it as the Schema message
+        '''
+        if not environ.get('CONTENT_TYPE', '').startswith('application/json'):
+            return status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        try:
+            message = json.loads(self._read_body(environ).decode('utf-8'))
+        except ValueError:
+            return status.HTTP_400_BAD_REQUEST
+        return self._get_message_status(message)
+
+    def _read_body(self, environ):
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length <= 0:
+            return b''
+        return environ['wsgi.input'].read(content_length)
+
+    def _validate_message(self, message):
+        request_data = self.validator.validate(message)
+        if request_data is None:
+            raise IssuerTransactionError(
+                Transaction.Errors.INVALID_FORMAT)
+        return request_data
@@ -1,5 +1,7 @@
 '''Request and response serializers for public user API'''
 
-from .request_serializers import BalanceRequestSerializer, \
+from .request_serializers import BalanceBatchRequestSerializer, \
+    BalanceRequestSerializer, \
+    BalanceSeriesRequestSerializer, \
     TransactionRequestSerializer
 from .response_serializers import TransactionSerializer
@@ -3,6 +3,10 @@
 from rest_framework import serializers
 
 
+BALANCE_BATCH_MAX_SIZE = 1000
+BALANCE_SERIES_MAX_POINTS = 1000
+
+
 class BalanceRequestSerializer(serializers.Serializer):
 
     '''
@@ -13,6 +17,29 @@ class BalanceRequestSerializer(serializers.Serializer):
     ts = serializers.IntegerField(required=False)  # timestamp
 
 
+class BalanceSeriesRequestSerializer(serializers.Serializer):
+
+    '''
+    Serializer for balance series request.
+    Limits number of points in series
+    '''
+
+    begin = serializers.IntegerField()  # timestamp
+    end = serializers.IntegerField()  # timestamp
+    step = serializers.IntegerField(min_value=1)  # seconds
+
+    def validate(self, data):
+        if data.get('end') < data.get('begin'):
+            raise serializers.ValidationError('end is earlier than begin')
+        points_number = \
+            (data.get('end') - data.get('begin')) // data.get('step') + 1
+        if points_number > BALANCE_SERIES_MAX_POINTS:
+            raise serializers.ValidationError(
+                'Not more than {} points are expected'.format(
+                    BALANCE_SERIES_MAX_POINTS))
+        return data
+
+
 class TransactionRequestSerializer(serializers.Serializer):
 
     '''
@@ -22,3 +49,30 @@ class TransactionRequestSerializer(serializers.Serializer):
 
     begin_ts = serializers.IntegerField(required=False)  # timestamp
     end_ts = serializers.IntegerField(required=False)  # timestamp
+
+
+class BalanceBatchItemSerializer(serializers.Serializer):
+
+    '''
+    Serializer for one balance of batch balance request
+    '''
+
+    account_id = serializers.IntegerField()
+    ts = serializers.IntegerField(required=False)  # timestamp
+
+
+class BalanceBatchRequestSerializer(serializers.Serializer):
+
+    '''
+    Serializer for batch balance request.
+    Limits number of requested balances
+    '''
+
+    balances = BalanceBatchItemSerializer(many=True)
+
+    def validate_balances(self, balances):
+        if not balances or len(balances) > BALANCE_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                'From 1 to {} balances are expected'.format(
+                    BALANCE_BATCH_MAX_SIZE))
+        return balances
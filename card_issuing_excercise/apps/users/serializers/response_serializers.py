@@ -20,7 +20,10 @@ class TransferSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Transfer
-        exclude = ('account', 'transaction')
+        # transfers of other accounts are listed too:
+        # don't expose their balances.
+        # Posting time is right after transaction creation
+        exclude = ('account', 'transaction', 'created_at', 'balance_after')
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -33,4 +36,4 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         # Don't expose transaction ids
-        exclude = ('code', 'base64_description')
+        exclude = ('code', 'legacy_base64_description')
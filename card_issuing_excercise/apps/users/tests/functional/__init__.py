@@ -1,4 +1,6 @@
 '''Functional tests for public users API'''
 
+from .get_user_balance_batch_test_case import GetUserBalanceBatch
+from .get_user_balance_series_test_case import GetUserBalanceSeries
 from .get_user_balance_test_case import GetUserBalance
 from .get_user_transactions_test_case import GetUserTransactions
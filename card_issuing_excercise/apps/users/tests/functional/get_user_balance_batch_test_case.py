@@ -0,0 +1,149 @@
+'''Tests public API which returns many balances of current user at once'''
+
+import datetime
+import decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from card_issuing_excercise.apps.processing.models import Transaction, \
+    Transfer, \
+    UserAccountsUnion
+from card_issuing_excercise.apps.users.serializers.request_serializers \
+    import BALANCE_BATCH_MAX_SIZE
+from card_issuing_excercise.apps.utils import datetime_to_timestamp
+from card_issuing_excercise.apps.utils.tests import UserAPITestCase
+from card_issuing_excercise.apps.utils.tests.mixins import \
+    get_random_string_for_test
+
+
+class GetUserBalanceBatch(UserAPITestCase):
+
+    '''Functional test for batch balance API'''
+
+    def setUp(self):
+        self.arrange_dates()
+        self.arrange_accounts()
+        self.arrange_transactions()
+
+    ##
+    # Helpers
+    ##
+
+    # Arrangements
+
+    def arrange_dates(self):
+        self.now = datetime.datetime.now()
+        self.created_at = self.now - datetime.timedelta(days=2)
+        self.loaded_at = self.now - datetime.timedelta(days=1)
+
+    def arrange_accounts(self):
+        self.load_money_account = self.create_account()
+        self.user_account = self.create_account(self.created_at)
+        # second card of the same user
+        self.other_user_account = UserAccountsUnion.objects.create(
+            user=self.user_account.user,
+            card_id=get_random_string_for_test())
+
+    def arrange_transactions(self):
+        self.load_amount = decimal.Decimal(10)
+        load_transaction = Transaction.objects.load_money(
+            self.load_amount,
+            self.load_money_account.base_account,
+            self.user_account.base_account,
+            code='LTEST')
+        Transaction.objects.filter(id=load_transaction.id).\
+            update(created_at=self.loaded_at)
+        Transfer.objects.filter(transaction=load_transaction).\
+            update(created_at=self.loaded_at)
+
+    # Shortcuts
+
+    def get_balances_by_request(self, balances, user_for_auth=None):
+        '''Constructs and executes request for batch balance API'''
+        client = APIClient()
+        client.force_authenticate(
+            user=user_for_auth or self.user_account.user)
+        return client.post(
+            '/api/v1/user/balance/batch/',
+            {'balances': balances}, format='json')
+
+    def get_ts(self, hours_ago):
+        return datetime_to_timestamp(
+            self.now - datetime.timedelta(hours=hours_ago))
+
+    def get_available_amounts(self, response):
+        return [decimal.Decimal(balance.get('available_amount'))
+                for balance in response.data.get('balances')]
+
+    ##
+    # Tests
+    ##
+
+    def test__many_timestamps__successfull(self):
+        response = self.get_balances_by_request([
+            {'account_id': self.user_account.id, 'ts': self.get_ts(hours)}
+            for hours in (1, 36, 72)])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # after load, before load and before account creation
+        self.assertEqual(
+            self.get_available_amounts(response), [self.load_amount, 0, 0])
+
+    def test__many_accounts__successfull(self):
+        response = self.get_balances_by_request([
+            {'account_id': self.user_account.id},
+            {'account_id': self.other_user_account.id}])
+        self.assertEqual(
+            self.get_available_amounts(response), [self.load_amount, 0])
+        self.assertEqual(
+            [balance.get('account_id')
+             for balance in response.data.get('balances')],
+            [self.user_account.id, self.other_user_account.id])
+
+    def test__more_timestamps__same_number_of_queries(self):
+        queries_numbers = []
+        for balances_number in (2, 20):
+            with CaptureQueriesContext(connection) as queries:
+                self.get_balances_by_request([
+                    {'account_id': self.user_account.id,
+                     'ts': self.get_ts(hours)}
+                    for hours in range(1, balances_number + 1)])
+            queries_numbers.append(len(queries))
+        self.assertEqual(queries_numbers[0], queries_numbers[1])
+
+    def test__foreign_account__got_403(self):
+        response = self.get_balances_by_request([
+            {'account_id': self.user_account.id},
+            {'account_id': self.load_money_account.id}])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test__non_existent_account__got_403(self):
+        response = self.get_balances_by_request([
+            {'account_id': self.other_user_account.id + 1000}])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test__non_existent_and_foreign_accounts__same_response(self):
+        non_existent_response = self.get_balances_by_request([
+            {'account_id': self.user_account.id},
+            {'account_id': self.other_user_account.id + 1000}])
+        foreign_response = self.get_balances_by_request([
+            {'account_id': self.user_account.id},
+            {'account_id': self.load_money_account.id}])
+        self.assertEqual(
+            (non_existent_response.status_code, non_existent_response.data),
+            (foreign_response.status_code, foreign_response.data))
+
+    def test__non_authenticated_user__got_403(self):
+        response = APIClient().post(
+            '/api/v1/user/balance/batch/',
+            {'balances': [{'account_id': self.user_account.id}]},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test__too_many_balances__got_400(self):
+        response = self.get_balances_by_request(
+            [{'account_id': self.user_account.id}] *
+            (BALANCE_BATCH_MAX_SIZE + 1))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,138 @@
+'''Tests public API which returns balance series of current user'''
+
+import datetime
+import decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from card_issuing_excercise.apps.processing.models import Transaction, \
+    Transfer
+from card_issuing_excercise.apps.utils import datetime_to_timestamp
+from card_issuing_excercise.apps.utils.tests import UserAPITestCase, \
+    CreateTransactionMixin
+
+
+class GetUserBalanceSeries(UserAPITestCase,
+                           CreateTransactionMixin):
+
+    '''Functional test for balance series API'''
+
+    def setUp(self):
+        self.arrange_dates()
+        self.arrange_accounts()
+        self.arrange_transactions()
+
+    ##
+    # Helpers
+    ##
+
+    # Arrangements
+
+    def arrange_dates(self):
+        self.now = datetime.datetime.now()
+        self.created_at = self.now - datetime.timedelta(hours=48)
+
+    def arrange_accounts(self):
+        self.load_money_account = self.create_account()
+        self.user_account = self.create_account(self.created_at)
+
+    def arrange_transactions(self):
+        self.load_amount = decimal.Decimal(10)
+        self.reserve_amount = decimal.Decimal(3)
+        self.post_transaction(
+            self.load_money_account.base_account,
+            self.user_account.base_account,
+            self.load_amount, hours_ago=30)
+        self.post_transaction(
+            self.user_account.base_account,
+            self.user_account.reserved_account,
+            self.reserve_amount, hours_ago=10)
+
+    # Shortcuts
+
+    def post_transaction(self, from_account, to_account, amount, hours_ago):
+        issuer_transaction = self.create_transaction()
+        issuer_transaction.add_transfer(from_account, to_account, amount)
+        created_at = self.now - datetime.timedelta(hours=hours_ago)
+        Transaction.objects.filter(id=issuer_transaction.id).\
+            update(created_at=created_at)
+        Transfer.objects.filter(transaction=issuer_transaction).\
+            update(created_at=created_at)
+
+    def get_ts(self, hours_ago):
+        return int(datetime_to_timestamp(
+            self.now - datetime.timedelta(hours=hours_ago)))
+
+    def get_series_by_request(self, begin, end, step):
+        '''Constructs and executes request for balance series API'''
+        return self.get_resource_for_user(
+            'balance/series',
+            {'begin': begin, 'end': end, 'step': step},
+            user_id=self.user_account.id,
+            user_for_auth=self.user_account.user)
+
+    def get_amounts(self, response, key):
+        return [decimal.Decimal(balance.get(key))
+                for balance in response.data.get('balances')]
+
+    ##
+    # Tests
+    ##
+
+    def test__valid_range__balance_at_every_step(self):
+        response = self.get_series_by_request(
+            self.get_ts(40), self.get_ts(4), 12 * 60 * 60)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [balance.get('ts') for balance in response.data.get('balances')],
+            [self.get_ts(hours) for hours in (40, 28, 16, 4)])
+        self.assertEqual(
+            self.get_amounts(response, 'available_amount'),
+            [0, self.load_amount, self.load_amount,
+             self.load_amount - self.reserve_amount])
+        self.assertEqual(
+            self.get_amounts(response, 'total_amount'),
+            [0, self.load_amount, self.load_amount, self.load_amount])
+
+    def test__range_before_account_creation__zero_balances(self):
+        response = self.get_series_by_request(
+            self.get_ts(72), self.get_ts(60), 60 * 60)
+        self.assertEqual(
+            set(self.get_amounts(response, 'total_amount')), {0})
+
+    def test__zero_begin__balance_at_epoch_not_current(self):
+        response = self.get_series_by_request(0, 0, 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [balance.get('ts') for balance in response.data.get('balances')],
+            [0])
+        self.assertEqual(self.get_amounts(response, 'total_amount'), [0])
+        self.assertEqual(self.get_amounts(response, 'available_amount'), [0])
+
+    def test__more_steps__same_number_of_queries(self):
+        queries_numbers = []
+        for step_hours in (12, 1):
+            with CaptureQueriesContext(connection) as queries:
+                self.get_series_by_request(
+                    self.get_ts(40), self.get_ts(4), step_hours * 60 * 60)
+            queries_numbers.append(len(queries))
+        self.assertEqual(queries_numbers[0], queries_numbers[1])
+
+    def test__end_before_begin__got_400(self):
+        response = self.get_series_by_request(
+            self.get_ts(4), self.get_ts(40), 60 * 60)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test__too_many_points__got_400(self):
+        response = self.get_series_by_request(
+            self.get_ts(40), self.get_ts(4), 1)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test__non_authenticated_user__got_403(self):
+        response = self.get_resource_for_user(
+            'balance/series',
+            {'begin': self.get_ts(40), 'end': self.get_ts(4), 'step': 60},
+            user_id=self.user_account.id)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -50,6 +50,15 @@ class GetUserBalance(UserAPITestCase):
                                  'total_amount': 0
                              })
 
+    def test__zero_ts__current_balance(self):
+        response = self.get_user_balance_by_request({'ts': 0})
+        amount = self.user_account.base_amount
+        self.assertDictEqual(response.data,
+                             {
+                                 'available_amount': amount,
+                                 'total_amount': amount
+                             })
+
     def test__non_authenticated_user__got_403(self):
         response = self.get_user_balance_by_request(user_for_auth=None)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
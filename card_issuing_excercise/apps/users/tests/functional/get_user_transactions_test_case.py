@@ -5,9 +5,13 @@ import decimal
 from unittest import skip
 
 from rest_framework import status
+from rest_framework.test import APIClient
 
+from card_issuing_excercise.apps.processing.models import Transfer
 from card_issuing_excercise.apps.processing.models.transactions import \
+    Transaction, \
     TRANSACTION_PRESENTMENT_STATUS
+from card_issuing_excercise.apps.users.views import TRANSACTIONS_PER_PAGE
 from card_issuing_excercise.apps.utils import datetime_to_timestamp, \
     to_dict
 from card_issuing_excercise.apps.utils.tests import UserAPITestCase, \
@@ -52,6 +56,44 @@ class GetUserTransactions(UserAPITestCase,
             from_account=self.user_account.base_account,
             to_account=self.settlement_account.base_account)
 
+    def create_presentment_transactions(self, transactions_number,
+                                        fee_amount=None):
+        '''
+        Creates presentments with the same creation and posting time,
+        so pages are split by ids.
+        With fee amount presentments have two transfers of base account
+        '''
+        transactions = []
+        for _ in range(transactions_number):
+            transaction = self.create_transaction(
+                amount=self.transfer_amount,
+                status=TRANSACTION_PRESENTMENT_STATUS,
+                from_account=self.user_account.base_account,
+                to_account=self.settlement_account.base_account)
+            if fee_amount is not None:
+                transaction.transfers.create(
+                    account=self.user_account.base_account,
+                    amount=-fee_amount)
+            transactions.append(transaction)
+        transactions_ids = [transaction.id for transaction in transactions]
+        Transaction.objects.filter(id__in=transactions_ids).\
+            update(created_at=self.presentment_transaction.created_at)
+        Transfer.objects.filter(transaction_id__in=transactions_ids).\
+            update(created_at=self.presentment_transaction.created_at)
+        return transactions
+
+    def get_all_cursor_pages(self):
+        '''
+        Follows "next" links from the first cursor page
+        '''
+        pages = [self.get_user_transactions_by_request(
+            {'pagination': 'cursor'})]
+        client = APIClient()
+        client.force_authenticate(user=self.user_account.user)
+        while pages[-1].data.get('next'):
+            pages.append(client.get(pages[-1].data.get('next')))
+        return pages
+
     # Shortcuts
     def get_user_transactions_by_request(self, *args, **kwargs):
         '''
@@ -104,6 +146,57 @@ class GetUserTransactions(UserAPITestCase,
                                  'results': [],
                              })
 
+    def test__cursor_pagination__all_pages_linked(self):
+        transactions = self.create_presentment_transactions(
+            TRANSACTIONS_PER_PAGE)
+        first_page = self.get_user_transactions_by_request(
+            {'pagination': 'cursor'})
+        self.assertEqual(
+            len(first_page.data.get('results')), TRANSACTIONS_PER_PAGE)
+        client = APIClient()
+        client.force_authenticate(user=self.user_account.user)
+        second_page = client.get(first_page.data.get('next'))
+        self.assertIsNone(second_page.data.get('next'))
+        self.assertEqual(
+            [transaction.get('id')
+             for page in (first_page, second_page)
+             for transaction in page.data.get('results')],
+            sorted([self.presentment_transaction.id] +
+                   [transaction.id for transaction in transactions],
+                   reverse=True))
+
+    def test__cursor_pagination__transaction_not_split_btw_pages(self):
+        # the last transaction of the first page has two transfers
+        transactions = self.create_presentment_transactions(
+            TRANSACTIONS_PER_PAGE, fee_amount=decimal.Decimal(1))
+        pages = self.get_all_cursor_pages()
+        results = [transaction
+                   for page in pages
+                   for transaction in page.data.get('results')]
+        self.assertEqual(
+            [len(page.data.get('results')) for page in pages],
+            [TRANSACTIONS_PER_PAGE, 1])
+        self.assertEqual(
+            [transaction.get('id') for transaction in results],
+            sorted([self.presentment_transaction.id] +
+                   [transaction.id for transaction in transactions],
+                   reverse=True))
+        self.assertEqual(
+            [len(transaction.get('transfers')) for transaction in results],
+            [2] * TRANSACTIONS_PER_PAGE + [1])
+
+    def test__cursor_pagination__page_filtered_by_time_range(self):
+        yesterday = self.user_account.created_at + datetime.timedelta(days=1)
+        response = self.get_user_transactions_by_request(
+            {'pagination': 'cursor',
+             'begin_ts': datetime_to_timestamp(yesterday)})
+        self.assertEqual(response.data, {'next': None, 'results': []})
+
+    def test__cursor_pagination_with_invalid_cursor__got_404(self):
+        response = self.get_user_transactions_by_request(
+            {'pagination': 'cursor', 'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     @skip('Need forcing auth before object selection -- not implemented')
     def test__non_authorized_user__got_403(self):
         fake_user_account = self.create_account_with_amount()
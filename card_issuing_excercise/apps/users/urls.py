@@ -1,9 +1,13 @@
 from django.conf.urls import url
 
-from card_issuing_excercise.apps.users.views import TransactionsView, BalanceView 
+from card_issuing_excercise.apps.users.views import TransactionsView, BalanceView, \
+    BalanceBatchView, \
+    BalanceSeriesView
 
 urlpatterns = [
     url(r'^(?P<id>\d+)/transaction/$', TransactionsView.as_view()),
     url(r'^(?P<id>\d+)/balance/$', BalanceView.as_view()),
+    url(r'^(?P<id>\d+)/balance/series/$', BalanceSeriesView.as_view()),
+    url(r'^balance/batch/$', BalanceBatchView.as_view()),
 ]
 
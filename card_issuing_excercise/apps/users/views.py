@@ -1,22 +1,35 @@
 '''Views for public user API (transactions and balance)'''
 
+import base64
+import binascii
+from collections import OrderedDict
+import datetime
+
 from django.http import HttpResponse
 from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import GenericAPIView, \
     ListAPIView, get_object_or_404
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import BasePagination, \
+    PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
-from card_issuing_excercise.apps.processing.models import UserAccountsUnion
-from card_issuing_excercise.apps.users.serializers import BalanceRequestSerializer, \
+from card_issuing_excercise.apps.processing.models import Transfer, \
+    UserAccountsUnion
+from card_issuing_excercise.apps.users.serializers import BalanceBatchRequestSerializer, \
+    BalanceRequestSerializer, \
+    BalanceSeriesRequestSerializer, \
     TransactionRequestSerializer, \
     TransactionSerializer
 from card_issuing_excercise.apps.users.permissions import IsAccountOwner
 
 
 TRANSACTIONS_PER_PAGE = 20
+# value of "pagination" query param for keyset pagination
+CURSOR_PAGINATION = 'cursor'
+CURSOR_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
 
 
 class GetUserAccountMixin:
@@ -42,6 +55,63 @@ class TransactionsPaginator(PageNumberPagination):
     page_size = TRANSACTIONS_PER_PAGE
 
 
+class TransactionsCursorPaginator(BasePagination):
+
+    '''
+    Keyset pagination of transactions
+    ordered by posting time and id of their transfers in descending order.
+    Page starts right after the last transfer of the previous one,
+    which is encoded in opaque cursor,
+    so deep pages cost the same as the first one: no COUNT and OFFSET.
+    Paginates transfers of account, not transactions
+    '''
+
+    page_size = TRANSACTIONS_PER_PAGE
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param))
+        self.page, self.last_position, self.has_next = Transfer.objects.\
+            get_transactions_page(queryset, self.page_size, position)
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            self.encode_cursor(*self.last_position))
+
+    def encode_cursor(self, created_at, transfer_id):
+        position = '{}|{}'.format(
+            created_at.strftime(CURSOR_DATETIME_FORMAT), transfer_id)
+        return base64.urlsafe_b64encode(
+            position.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, encoded_cursor):
+        '''
+        Returns (created_at, id) of the last seen transfer
+        or None for the first page.
+        Raises NotFound for invalid cursor
+        '''
+        if not encoded_cursor:
+            return None
+        try:
+            created_at, transfer_id = base64.urlsafe_b64decode(
+                encoded_cursor.encode('ascii')).decode('ascii').split('|')
+            return datetime.datetime.strptime(
+                created_at, CURSOR_DATETIME_FORMAT), int(transfer_id)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+
 class TransactionsView(GetUserAccountMixin,
                        ListAPIView):
 
@@ -49,11 +119,29 @@ class TransactionsView(GetUserAccountMixin,
     Repsresents all presentment transactions for particular user in  a given time range.
     Accepts nill values for time range. 
     In this case it doesn't limit transactions in time frame.
+    Pages are numbered or, in cursor pagination mode, linked by cursors.
     '''
 
     pagination_class = TransactionsPaginator
     serializer_class = TransactionSerializer
 
+    @property
+    def paginator(self):
+        '''
+        Page number pagination by default,
+        keyset pagination for "pagination=cursor" query param
+        '''
+        if not hasattr(self, '_paginator'):
+            if self._is_cursor_pagination():
+                self._paginator = TransactionsCursorPaginator()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def _is_cursor_pagination(self):
+        return self.request.query_params.get('pagination') == \
+            CURSOR_PAGINATION
+
     def get_object(self, *args, **kwargs):
         # rewrite get_object to avoid recursion
         filter_kwargs = {self.lookup_field: self.kwargs[self.lookup_field]}
@@ -65,9 +153,13 @@ class TransactionsView(GetUserAccountMixin,
         user_account = self.get_object()
         request_serializer = TransactionRequestSerializer(
             data=self.request.query_params)
-        if request_serializer.is_valid():
-            return user_account.get_transactions(**request_serializer.data)
-        raise ValidationError()
+        if not request_serializer.is_valid():
+            raise ValidationError()
+        if self._is_cursor_pagination():
+            # cursor pages are selected by transfers of account
+            return user_account.get_transactions_transfers(
+                **request_serializer.data)
+        return user_account.get_transactions(**request_serializer.data)
 
 
 class BalanceView(GetUserAccountMixin,
@@ -89,3 +181,74 @@ class BalanceView(GetUserAccountMixin,
                 'available_amount': amounts_tuple[0],
                 'total_amount': amounts_tuple[1]})
         return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+
+class BalanceSeriesView(GetUserAccountMixin,
+                        GenericAPIView):
+
+    '''
+    Show user's balance at every step of time range.
+    Balances are computed by one pass over transfers of the range.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        user_account = self.get_object()
+        request_serializer = BalanceSeriesRequestSerializer(
+            data=request.query_params)
+        if not request_serializer.is_valid():
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        series = user_account.get_amounts_series(
+            request_serializer.validated_data.get('begin'),
+            request_serializer.validated_data.get('end'),
+            request_serializer.validated_data.get('step'))
+        return Response({'balances': [
+            {'ts': ts,
+             'available_amount': available_amount,
+             'total_amount': total_amount}
+            for ts, total_amount, available_amount in series]})
+
+
+class BalanceBatchView(GetUserAccountMixin,
+                       GenericAPIView):
+
+    '''
+    Show balances of many accounts for particular dates and times at once.
+    Every account is checked for permissions,
+    all balances are found by a few grouped queries.
+    '''
+
+    def post(self, request, *args, **kwargs):
+        request_serializer = BalanceBatchRequestSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        balances = request_serializer.validated_data.get('balances')
+        user_accounts = self._get_user_accounts(
+            {balance.get('account_id') for balance in balances})
+        amounts_tuples = UserAccountsUnion.objects.get_amounts_for_ts_batch([
+            (user_accounts[balance.get('account_id')], balance.get('ts'))
+            for balance in balances])
+        return Response({'balances': [
+            {'account_id': balance.get('account_id'),
+             'ts': balance.get('ts'),
+             'available_amount': amounts_tuple[1],
+             'total_amount': amounts_tuple[0]}
+            for balance, amounts_tuple in zip(balances, amounts_tuples)]})
+
+    def _get_user_accounts(self, account_ids):
+        '''
+        Returns dict id -> user account with prefetched accounts.
+        Raises PermissionDenied if any of accounts is not permitted
+        or doesn't exist: the same error for both,
+        so ids of other users accounts can't be found by brute force
+        '''
+        user_accounts = {
+            user_account.id: user_account
+            for user_account in self.get_queryset().
+            filter(id__in=account_ids).
+            select_related('user').
+            prefetch_related('accounts')}
+        for user_account in user_accounts.values():
+            self.check_object_permissions(self.request, user_account)
+        if len(user_accounts) != len(account_ids):
+            self.permission_denied(self.request)
+        return user_accounts
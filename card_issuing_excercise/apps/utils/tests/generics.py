@@ -2,6 +2,9 @@
 
 from django.test import TestCase
 
+from card_issuing_excercise.apps.processing.idempotency import \
+    IdempotencyStore
+
 from .mixins import CreateAccountMixin, \
     CreateTransactionMixin, \
     TestTransactionMixin, \
@@ -26,7 +29,11 @@ class ShemaWebHookBaseTestCase(CreateAccountMixin, CreateTransactionMixin,
     '''
     Base class for testing schema web hook
     '''
-    pass
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        # outcomes remembered by previous tests are rollbacked from database
+        IdempotencyStore().backend.clear()
 
 
 class UserAPITestCase(CreateAccountMixin,
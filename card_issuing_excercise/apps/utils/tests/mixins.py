@@ -161,6 +161,8 @@ class CreateTransactionMixin:
             Transaction.objects.\
                 filter(id=issuer_transaction.id).\
                 update(created_at=kwargs.get('datetime'))
+            # transfer copies creation time of transaction
+            issuer_transaction.created_at = kwargs.get('datetime')
         except IntegrityError:
             issuer_transaction = Transaction.objects.get(
                 code=kwargs.get('transaction_code'),
@@ -59,15 +59,23 @@ def to_dict(input_ordered_dict):
     return loads(dumps(input_ordered_dict))
 
 
-def dict_to_base64(dict_to_convert):
+def dict_to_json_bytes(dict_to_convert):
     '''
-    Convert dict as base64 string
+    Convert dict as utf-8 encoded JSON
+    with all values converted to str
     '''
     if not dict_to_convert:
-        return ''
+        return b''
     # convert all values to its str representatation
     dict_to_convert = {key: str(value)
                        for key, value in dict_to_convert.items()}
+    return dumps(dict_to_convert).encode('utf-8')
+
+
+def dict_to_base64(dict_to_convert):
+    '''
+    Convert dict as base64 string
+    '''
     return base64.b64encode(
-        dumps(dict_to_convert).encode('utf-8')).\
+        dict_to_json_bytes(dict_to_convert)).\
         decode('ascii')
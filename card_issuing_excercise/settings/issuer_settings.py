@@ -2,10 +2,65 @@
 Issuer specific settings: 
 - overhead on authorisation transaction in percents
 - TTL for authorisation transaction without presentment in days
+- whether authorisation checks and deducts amount by one conditional UPDATE
+  instead of locking account in advance
+- max number of messages in one Schema batch request
+- max number of cards in process level card_id -> accounts cache
+- whether special accounts should be resolved and pinned on startup
+  (enable for web workers after initialize_before_startup is done)
+- storage for outcomes of processed Schema messages:
+  None for process level LRU or django cache alias for shared one,
+  its size (for process level storage only) and TTL in seconds
+- how webhook saves transactions descriptions:
+  'sync' in request or 'deferred' by background writer after commit,
+  and max number of descriptions saved by writer at once
+- whether single webhook messages of the same card are processed
+  one at a time inside of worker process and number of lock stripes
+- number of basic account shards for hot special accounts by role
+  (inner settlement and revenue). Shards are created by
+  initialize_before_startup, their number can only be increased
+- whether single webhook presentments are commited in groups,
+  how long first presentment of group waits for others in seconds
+  and max number of presentments in one group
+- whether wall time and queries number of webhook processing stages
+  are collected and max number of last samples kept per stage
+- max number of days balance at point of time is rolled forward
+  from the nearest previous day snapshot. Longer windows are counted
+  and logged as missing snapshots and rolled back from current balance
+  when it is closer
+- interval of intraday balance checkpoints in seconds
+  (counted from the beginning of the day)
+- how long transfers can be committed after the moment they are stamped
+  with, in seconds. Day snapshots and checkpoints are saved
+  only for moments at least that old, otherwise late commits
+  are missed by them forever
 '''
 
 AUTHORISATION_OVERHEAD = 20
 AUTHORISATION_TRANSACTION_TTL = 5
+AUTHORISATION_CONDITIONAL_DEBIT = True
+SCHEMA_BATCH_MAX_SIZE = 500
+CARD_ACCOUNTS_CACHE_SIZE = 100000
+PIN_SPECIAL_ACCOUNTS_ON_STARTUP = False
+SCHEMA_IDEMPOTENCY_BACKEND = None
+SCHEMA_IDEMPOTENCY_CACHE_SIZE = 100000
+SCHEMA_IDEMPOTENCY_TTL = 24 * 60 * 60
+TRANSACTION_DESCRIPTIONS_MODE = 'sync'
+TRANSACTION_DESCRIPTIONS_BATCH_SIZE = 500
+CARD_LOCKS_ENABLED = False
+CARD_LOCK_STRIPES = 1024
+SPECIAL_ACCOUNT_SHARDS = {
+    'is': 1,  # inner settlement account
+    'r': 1,  # revenue account
+}
+PRESENTMENT_BATCHING_ENABLED = False
+PRESENTMENT_BATCH_WINDOW = 0.005
+PRESENTMENT_BATCH_MAX_SIZE = 100
+STAGE_TIMINGS_ENABLED = False
+STAGE_TIMINGS_MAX_SAMPLES = 10000
+BALANCE_ROLL_FORWARD_MAX_DAYS = 7
+BALANCE_CHECKPOINT_INTERVAL = 60 * 60
+BALANCE_SNAPSHOT_COMMIT_LAG = 5 * 60
 #TODO: what are real precision requirements??
 AMOUNT_PRECISION_SETTINGS = {
     'max_digits': 19,
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "card_issuing_excercise.settings")
 
 application = get_wsgi_application()
+
+# Lean entry point: serves the Schema webhook without middlewares and DRF,
+# everything else is passed to django application.
+# Imported after django setup as it depends on models
+from card_issuing_excercise.apps.processing.wsgi import \
+    SchemaWebHookApplication  # noqa
+
+schema_application = SchemaWebHookApplication(application)